@@ -0,0 +1,97 @@
+"""
+Command line entry point for compiling fixture files ahead of time, so that
+``--django-compiled-fixtures`` can skip parsing and deserializing them.
+"""
+
+from __future__ import absolute_import
+
+import os
+import sys
+from optparse import OptionParser
+
+from nosedjango.fixtures import COMPRESSION_TYPES
+from nosedjango.fixtures import can_load_in_bulk
+from nosedjango.fixtures import compile_fixture_file
+from nosedjango.fixtures import find_fixture_files
+from nosedjango.fixtures import get_fixture_dirs
+
+def find_all_fixture_files():
+    """
+    Every fixture file in the app fixture directories and ``FIXTURE_DIRS``,
+    as ``(path, format, compression)`` tuples.
+    """
+    from django.core import serializers
+
+    public_formats = serializers.get_public_serializer_formats()
+    found = []
+    for fixture_dir in get_fixture_dirs():
+        if not fixture_dir or not os.path.isdir(fixture_dir):
+            continue
+        for file_name in sorted(os.listdir(fixture_dir)):
+            parts = file_name.split('.')
+            compression_format = None
+            if len(parts) > 2 and parts[-1] in COMPRESSION_TYPES:
+                compression_format = parts.pop()
+            if len(parts) > 1 and parts[-1] in public_formats:
+                found.append((
+                    os.path.join(fixture_dir, file_name),
+                    parts[-1],
+                    compression_format))
+    return found
+
+def main(argv=None):
+    parser = OptionParser(
+        usage='%prog [options] [fixture_label ...]',
+        description='Compile fixtures in to DIR for use with '
+                    '--django-compiled-fixtures. With no labels, every '
+                    'fixture in the fixture directories is compiled.')
+    parser.add_option(
+        '--settings',
+        help='Use custom Django settings module.',
+        metavar='SETTINGS',
+    )
+    parser.add_option(
+        '-d', '--output-dir',
+        dest='output_dir',
+        metavar='DIR',
+        help='Write the compiled fixtures to DIR.',
+    )
+    options, fixture_labels = parser.parse_args(argv)
+    if not options.output_dir:
+        parser.error('--output-dir is required')
+    if not can_load_in_bulk():
+        parser.error('compiled fixtures need django >= 1.2')
+
+    if options.settings:
+        os.environ['DJANGO_SETTINGS_MODULE'] = options.settings
+    elif 'DJANGO_SETTINGS_MODULE' not in os.environ:
+        os.environ['DJANGO_SETTINGS_MODULE'] = 'settings'
+    if os.getcwd() not in sys.path:
+        sys.path.insert(0, os.getcwd())
+
+    if not os.path.isdir(options.output_dir):
+        os.makedirs(options.output_dir)
+
+    if fixture_labels:
+        fixture_files = []
+        for fixture_label in fixture_labels:
+            fixture_files.extend(find_fixture_files(fixture_label))
+    else:
+        fixture_files = find_all_fixture_files()
+
+    failed = False
+    for path, format, compression_format in fixture_files:
+        try:
+            compile_fixture_file(
+                path, format, compression_format, options.output_dir)
+        except Exception as e:
+            # Fixtures using natural keys need a database to look the keys
+            # up in, so they can't be compiled
+            sys.stderr.write('Could not compile %s: %s\n' % (path, e))
+            failed = True
+        else:
+            print 'Compiled %s' % path
+    return int(failed)
+
+if __name__ == '__main__':
+    sys.exit(main())
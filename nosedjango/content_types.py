@@ -0,0 +1,122 @@
+"""
+Content types and permissions for django < 1.2, where a flush can leave them
+numbered differently from a fresh database (see
+http://code.djangoproject.com/ticket/9207). Putting them right one object at
+a time takes a few queries per model, as does the ``post_syncdb`` signal a
+flush sends, so that's only done by the first flush. Later flushes copy the
+result back with bulk inserts instead.
+"""
+
+from __future__ import absolute_import
+
+from nosedjango.fixtures import _insert_rows
+
+def resequence_content_types():
+    """
+    Re-create the content types and permissions, numbered from 1 in the
+    order the models are found.
+    """
+    from django.contrib.auth.management import create_permissions
+    from django.contrib.auth.models import Permission
+    from django.contrib.contenttypes.management import update_all_contenttypes
+    from django.contrib.contenttypes.models import ContentType
+    from django.db import models
+
+    ContentType.objects.all().delete()
+    ContentType.objects.clear_cache()
+    update_all_contenttypes(verbosity=0)
+
+    # Because of various ways of handling auto-increment, we need to
+    # make sure the new contenttypes start at 1
+    next_pk = 1
+    content_types = list(ContentType.objects.all().order_by('pk'))
+    ContentType.objects.all().delete()
+    for ct in content_types:
+        ct.pk = next_pk
+        ct.save()
+        next_pk += 1
+
+    # Because of the same problems with ContentTypes, we can get
+    # busted permissions
+    Permission.objects.all().delete()
+    for app in models.get_apps():
+        create_permissions(app=app, created_models=None, verbosity=0)
+
+    # Because of various ways of handling auto-increment, we need to
+    # make sure the new permissions start at 1
+    next_pk = 1
+    permissions = list(Permission.objects.all().order_by('pk'))
+    Permission.objects.all().delete()
+    for perm in permissions:
+        perm.pk = next_pk
+        perm.save()
+        next_pk += 1
+
+def get_image_models():
+    from django.contrib.auth.models import Permission
+    from django.contrib.contenttypes.models import ContentType
+
+    # Content types first, since permissions refer to them
+    return [ContentType, Permission]
+
+class ContentTypeImage(object):
+    """
+    A copy of the rows of a freshly flushed database: the content types and
+    permissions, and whatever ``post_syncdb`` handlers and initial data put in
+    the other tables, eg. the default site.
+    """
+    def __init__(self, tables):
+        self.tables = tables
+
+    @classmethod
+    def capture(cls, connection):
+        from nosedjango.dirty_tables import get_seeded_tables
+
+        image_tables = [model._meta.db_table for model in get_image_models()]
+        image_tables.extend(
+            sorted(get_seeded_tables(connection) - set(image_tables)))
+
+        qn = connection.ops.quote_name
+        cursor = connection.cursor()
+        tables = []
+        for table in image_tables:
+            cursor.execute('SELECT * FROM %s' % qn(table))
+            columns = [column[0] for column in cursor.description]
+            tables.append((table, columns, list(cursor.fetchall())))
+        return cls(tables)
+
+    def restore(self, connection):
+        """
+        Flush the database and fill it in from the copy, instead of sending
+        ``post_syncdb`` and loading the initial data again. The number of
+        statements doesn't depend on how many models there are, beyond the
+        flush itself. Nothing is committed.
+        """
+        from django.contrib.contenttypes.models import ContentType
+        from django.core.management.color import no_style
+        from django.db.models import get_models
+
+        style = no_style()
+        cursor = connection.cursor()
+        for sql in connection.ops.sql_flush(
+            style,
+            connection.introspection.django_table_names(only_existing=True),
+            connection.introspection.sequence_list()):
+            cursor.execute(sql)
+
+        is_mysql = 'mysql' in connection.settings_dict['ENGINE']
+        if is_mysql:
+            # Only the content types are known to come before what refers
+            # to them
+            cursor.execute('SET FOREIGN_KEY_CHECKS = 0')
+        for table, columns, rows in self.tables:
+            _insert_rows(connection, table, columns, rows)
+        if is_mysql:
+            cursor.execute('SET FOREIGN_KEY_CHECKS = 1')
+
+        image_tables = set([table for table, _, _ in self.tables])
+        for sql in connection.ops.sequence_reset_sql(
+            style, [model for model in get_models()
+                    if model._meta.db_table in image_tables]):
+            cursor.execute(sql)
+        ContentType.objects.clear_cache()
@@ -0,0 +1,35 @@
+"""
+Hooks for watching the SQL that goes through django's database cursors.
+"""
+
+def wrap_cursors(connection, wrapper):
+    """
+    Make every cursor handed out by ``connection`` go through ``wrapper``,
+    a callable taking the cursor and returning its replacement. Wrappers
+    stack, with the most recently installed one outermost.
+    """
+    original_cursor = connection.cursor
+
+    def cursor(*args, **kwargs):
+        return wrapper(original_cursor(*args, **kwargs))
+    connection.cursor = cursor
+
+class CursorWrapper(object):
+    """
+    A cursor that passes everything through to the wrapped cursor. Subclasses
+    override ``execute`` and ``executemany`` to watch the SQL.
+    """
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def execute(self, sql, params=()):
+        return self.cursor.execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        return self.cursor.executemany(sql, param_list)
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
@@ -0,0 +1,105 @@
+"""
+The databases of the aliases in ``DATABASES`` other than the default one.
+Each gets a test database, which is destroyed in a thread of its own, unless
+it's a ``TEST_MIRROR`` of another alias or the same database as one, in
+which case it shares that alias's.
+"""
+
+from __future__ import absolute_import
+
+import sys
+import threading
+
+from nosedjango.snapshots import is_memory_db_name
+
+def get_other_connections():
+    """
+    The connections of the aliases other than the default one, split in to
+    the ones that need a test database of their own, and ``(connection,
+    shared_connection)`` pairs for the ones that share another alias's.
+    """
+    try:
+        from django.db import DEFAULT_DB_ALIAS, connections
+    except ImportError:
+        # Django < 1.2 only knows about the one database
+        return [], []
+
+    own = []
+    shared = []
+    default_connection = connections[DEFAULT_DB_ALIAS]
+    signatures = {
+        default_connection.creation.test_db_signature(): DEFAULT_DB_ALIAS}
+    for alias in sorted(connections):
+        if alias == DEFAULT_DB_ALIAS:
+            continue
+        connection = connections[alias]
+        mirror = connection.settings_dict.get('TEST_MIRROR')
+        signature = connection.creation.test_db_signature()
+        if mirror:
+            shared.append((connection, connections[mirror]))
+        elif signature in signatures and not is_memory_db(connection):
+            # Every connection to an in-memory database gets its own
+            shared.append((connection, connections[signatures[signature]]))
+        else:
+            signatures.setdefault(signature, alias)
+            own.append(connection)
+    return own, shared
+
+def is_memory_db(connection):
+    return 'sqlite3' in connection.settings_dict['ENGINE'] and \
+        is_memory_db_name(connection.creation._get_test_db_name())
+
+def can_use_from_thread(connection):
+    """
+    Whether the test database of ``connection`` can be created and destroyed
+    from another thread. An in-memory sqlite database only exists in the
+    connection that created it, which can't be used by other threads.
+    """
+    return not is_memory_db(connection)
+
+def use_worker_test_db_names(connections, token):
+    """
+    Give the test databases of ``connections`` names of their own in this
+    multiprocess worker, so that it doesn't create or use the ones of the
+    main process or the other workers. An in-memory database is already the
+    worker's own.
+    """
+    for connection in connections:
+        if is_memory_db(connection):
+            continue
+        connection.settings_dict['TEST_NAME'] = '%s_%s' % (
+            connection.creation._get_test_db_name(), token)
+
+def destroy_test_db(alias, old_database_name, verbosity):
+    from django.db import connections
+
+    connections[alias].creation.destroy_test_db(
+        old_database_name, verbosity=verbosity)
+
+def run_in_parallel(main, functions):
+    """
+    Call each of ``functions`` in a thread of its own while ``main`` is
+    called in this one, and wait for them all to finish. The first exception
+    any of them raised is raised again here.
+    """
+    errors = []
+
+    def run(function):
+        try:
+            function()
+        except Exception:
+            errors.append(sys.exc_info())
+
+    threads = [
+        threading.Thread(target=run, args=(function,))
+        for function in functions]
+    for thread in threads:
+        thread.start()
+    try:
+        main()
+    finally:
+        for thread in threads:
+            thread.join()
+    if errors:
+        exc_type, exc_value, exc_tb = errors[0]
+        raise exc_type, exc_value, exc_tb
@@ -0,0 +1,102 @@
+"""
+Track which tables have been written to since the database was last flushed,
+so that getting back to a flushed database only has to clear those tables.
+"""
+
+from __future__ import absolute_import
+
+import re
+
+from nosedjango.cursors import CursorWrapper
+
+_quoted_name = r'[`"\[]?([\w$]+)[`"\]]?'
+WRITE_RE = re.compile(
+    r'^\s*(?:INSERT\s+(?:IGNORE\s+)?INTO|REPLACE\s+INTO|UPDATE|DELETE\s+FROM'
+    r'|TRUNCATE(?:\s+TABLE)?)\s+(?:%s\.)?%s(?![\w$])(?!\s*[,.])' % (
+        _quoted_name, _quoted_name),
+    re.IGNORECASE)
+DML_RE = re.compile(
+    r'^\s*(?:INSERT|UPDATE|DELETE|REPLACE|TRUNCATE|MERGE|WITH)\b',
+    re.IGNORECASE)
+
+class DirtyTableTracker(object):
+    """
+    Records the tables touched by INSERT, UPDATE and DELETE statements. Any
+    data-modifying statement whose table can't be worked out marks the
+    whole database as dirty.
+
+    Schema changes are deliberately ignored, since a flush doesn't undo them
+    either.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.tables = set()
+        self.unknown_writes = False
+
+    def get_state(self):
+        return (set(self.tables), self.unknown_writes)
+
+    def set_state(self, state):
+        tables, self.unknown_writes = state
+        self.tables = set(tables)
+
+    def executed(self, sql):
+        match = WRITE_RE.match(sql)
+        if match:
+            self.tables.add(match.group(2))
+        elif DML_RE.match(sql):
+            self.unknown_writes = True
+
+class DirtyTableCursorWrapper(CursorWrapper):
+    def __init__(self, cursor, tracker):
+        super(DirtyTableCursorWrapper, self).__init__(cursor)
+        self.tracker = tracker
+
+    def execute(self, sql, params=()):
+        self.tracker.executed(sql)
+        return self.cursor.execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        self.tracker.executed(sql)
+        return self.cursor.executemany(sql, param_list)
+
+def get_seeded_tables(connection):
+    """
+    The django tables that have rows in them. Run straight after a flush, this
+    finds the tables that post_syncdb handlers and initial data fill in.
+    """
+    qn = connection.ops.quote_name
+    cursor = connection.cursor()
+    seeded_tables = set()
+    for table in connection.introspection.django_table_names(
+        only_existing=True):
+        cursor.execute('SELECT 1 FROM %s' % qn(table))
+        if cursor.fetchone() is not None:
+            seeded_tables.add(table)
+    return seeded_tables
+
+def sql_clear_tables(connection, tables):
+    """
+    The SQL to remove every row from ``tables`` and reset their sequences,
+    leaving all other tables alone.
+    """
+    from django.core.management.color import no_style
+    from django.db.models import get_models
+
+    style = no_style()
+    if 'postgresql' in connection.settings_dict['ENGINE']:
+        # Postgres refuses to TRUNCATE a table referenced by a table that
+        # isn't also being truncated
+        sql = ['DELETE FROM %s;' % connection.ops.quote_name(table)
+               for table in tables]
+        models = [model for model in get_models(include_auto_created=True)
+                  if model._meta.db_table in tables]
+        sql.extend(connection.ops.sequence_reset_sql(style, models))
+        return sql
+
+    sequences = [sequence for sequence in
+                 connection.introspection.sequence_list()
+                 if sequence['table'] in tables]
+    return connection.ops.sql_flush(style, list(tables), sequences)
@@ -0,0 +1,148 @@
+"""
+A history of how long tests take, kept between runs, so that the slowest
+tests can be handed out to ``--processes`` workers first.
+"""
+
+from __future__ import absolute_import
+
+import os
+import tempfile
+import time
+
+try:
+    import json
+except ImportError:
+    from django.utils import simplejson as json
+
+try:
+    import fcntl
+except ImportError:
+    # No locking on Windows, where nose can't run multiprocess anyway
+    fcntl = None
+
+DURATION_HISTORY_VERSION = 1
+
+# How much the latest run counts towards the remembered duration, so that a
+# single slow run doesn't reorder everything
+LATEST_RUN_WEIGHT = 0.5
+
+def smooth(old_seconds, new_seconds):
+    if old_seconds is None:
+        return new_seconds
+    return (
+        LATEST_RUN_WEIGHT * new_seconds +
+        (1 - LATEST_RUN_WEIGHT) * old_seconds)
+
+class DurationHistory(object):
+    """
+    Per-test durations, from the start of loading the test's fixtures to
+    the end of cleaning up after it, and per-class durations of everything
+    else that happens in the class, ie. class-level setup and teardown.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.tests = {}
+        self.classes = {}
+        self._new_tests = {}
+        self._new_classes = {}
+        self._test_start = None
+        self._class_stack = []
+
+    def load(self):
+        self.tests, self.classes = self._read()
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}, {}
+        f = open(self.path)
+        try:
+            try:
+                history = json.load(f)
+            except ValueError:
+                return {}, {}
+        finally:
+            f.close()
+        if history.get('version') != DURATION_HISTORY_VERSION:
+            return {}, {}
+        return history['tests'], history['classes']
+
+    def start_test(self):
+        self._test_start = time.time()
+
+    def stop_test(self, test_id):
+        if self._test_start is None:
+            return
+        seconds = time.time() - self._test_start
+        self._test_start = None
+        self._new_tests[test_id] = seconds
+        if self._class_stack:
+            self._class_stack[-1][2] += seconds
+
+    def start_class(self, class_name):
+        self._class_stack.append([class_name, time.time(), 0.0])
+
+    def stop_class(self, class_name):
+        if not self._class_stack or self._class_stack[-1][0] != class_name:
+            return
+        _, start, test_seconds = self._class_stack.pop()
+        # A class split across workers runs its class-level setup in each of
+        # them, so keep the most expensive
+        overhead = max(time.time() - start - test_seconds, 0.0)
+        self._new_classes[class_name] = max(
+            overhead, self._new_classes.get(class_name, 0.0))
+
+    def estimate(self, test_ids, class_names=()):
+        """
+        The expected duration of running ``test_ids`` in the classes
+        ``class_names``. Tests without a history are expected to take as
+        long as the average test.
+        """
+        if self.tests:
+            default = sum(self.tests.values()) / len(self.tests)
+        else:
+            default = 0.0
+        seconds = sum([self.tests.get(test_id, default)
+                       for test_id in test_ids])
+        seconds += sum([self.classes.get(class_name, 0.0)
+                        for class_name in class_names])
+        return seconds
+
+    def save(self):
+        """
+        Merge the durations from this run in to the history file. Each
+        multiprocess worker saves its own, so the history is locked while
+        it's rewritten.
+        """
+        if not self._new_tests and not self._new_classes:
+            return
+        history_dir = os.path.dirname(os.path.abspath(self.path))
+        lock_fd = None
+        if fcntl is not None:
+            # The file is replaced rather than rewritten, so lock its
+            # directory, which leaves no lock file behind
+            lock_fd = os.open(history_dir, os.O_RDONLY)
+        try:
+            if lock_fd is not None:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            tests, classes = self._read()
+            for durations, new_durations in (
+                (tests, self._new_tests), (classes, self._new_classes)):
+                for key, seconds in new_durations.items():
+                    durations[key] = smooth(durations.get(key), seconds)
+
+            fd, temp_path = tempfile.mkstemp(dir=history_dir)
+            f = os.fdopen(fd, 'w')
+            try:
+                json.dump({
+                    'version': DURATION_HISTORY_VERSION,
+                    'tests': tests,
+                    'classes': classes,
+                }, f, indent=2, sort_keys=True)
+            finally:
+                f.close()
+            os.rename(temp_path, self.path)
+        finally:
+            if lock_fd is not None:
+                os.close(lock_fd)
+        self._new_tests = {}
+        self._new_classes = {}
@@ -0,0 +1,174 @@
+"""
+Fixtures loaded in layers, one savepoint per fixture, inside a transaction
+that's kept open from one test to the next. A test whose fixtures start the
+same way as the previous test's only has the fixtures that differ rolled back
+and loaded. The data a test class creates in ``setup_test_data`` goes in a
+layer of its own, on top, for as long as the class's tests are running.
+"""
+
+from __future__ import absolute_import
+
+TEST_SAVEPOINT = 'nosedjango_test'
+TEST_DATA_SAVEPOINT = 'nosedjango_test_data'
+
+def get_common_prefix(fixtures, other_fixtures):
+    prefix = []
+    for fixture, other_fixture in zip(fixtures, other_fixtures):
+        if fixture != other_fixture:
+            break
+        prefix.append(fixture)
+    return prefix
+
+class FixtureLayers(object):
+    """
+    The open transaction and the fixtures loaded in it, each with the
+    savepoint taken just before it was loaded, and whatever state the caller
+    wants back when it's rolled back.
+
+    Savepoints are created with plain SQL, since django only uses them on
+    postgres. pysqlite commits before running any statement it doesn't
+    recognise, savepoints included, so sqlite connections are switched to
+    autocommit mode and the transaction is started by hand while it's open.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.is_open = False
+        self._begin_state = None
+        self._layers = []
+        self.test_data_name = None
+        self._test_data_state = None
+        self._in_test = False
+        self._isolation_level = None
+
+    @property
+    def fixtures(self):
+        return [fixture for _, fixture, _ in self._layers]
+
+    def _is_sqlite(self):
+        return 'sqlite3' in self.connection.settings_dict['ENGINE']
+
+    def _execute(self, sql):
+        self.connection.cursor().execute(sql)
+
+    def begin(self, state=None):
+        # Make sure there's a connection to begin on
+        cursor = self.connection.cursor()
+        if self._is_sqlite():
+            self._isolation_level = self.connection.connection.isolation_level
+            self.connection.connection.isolation_level = None
+            cursor.execute('BEGIN')
+        self.is_open = True
+        self._begin_state = state
+
+    def _end(self, commit):
+        raw_connection = self.connection.connection
+        self.is_open = False
+        self._layers = []
+        self.test_data_name = None
+        self._in_test = False
+        if raw_connection is None:
+            return
+        try:
+            if commit:
+                raw_connection.commit()
+            else:
+                raw_connection.rollback()
+        finally:
+            if self._is_sqlite():
+                raw_connection.isolation_level = self._isolation_level
+
+    def commit(self):
+        """
+        Commit every layer and end the transaction.
+        """
+        self._end(commit=True)
+
+    def rollback(self):
+        """
+        Roll back every layer and end the transaction. Returns the state
+        passed to ``begin``.
+        """
+        self._end(commit=False)
+        return self._begin_state
+
+    def push(self, fixture, state=None):
+        """
+        Take a savepoint for ``fixture``, which the caller then loads.
+        """
+        self._release_test()
+        savepoint = 'nosedjango_layer_%s' % len(self._layers)
+        self._execute('SAVEPOINT %s' % savepoint)
+        self._layers.append((savepoint, fixture, state))
+
+    def truncate(self, num_layers):
+        """
+        Roll back all but the bottom ``num_layers`` layers. Returns the state
+        passed to ``push`` with the lowest layer rolled back, or ``None`` if
+        there was nothing to roll back.
+        """
+        if num_layers >= len(self._layers):
+            return None
+        savepoint, _, state = self._layers[num_layers]
+        self._execute('ROLLBACK TO SAVEPOINT %s' % savepoint)
+        self._execute('RELEASE SAVEPOINT %s' % savepoint)
+        del self._layers[num_layers:]
+        # The test data, and the test's savepoint, were on top
+        self.test_data_name = None
+        self._in_test = False
+        return state
+
+    def push_test_data(self, name, state=None):
+        """
+        Take a savepoint for the test data of the class ``name``, which the
+        caller then creates.
+        """
+        self._release_test()
+        self._execute('SAVEPOINT %s' % TEST_DATA_SAVEPOINT)
+        self.test_data_name = name
+        self._test_data_state = state
+
+    def pop_test_data(self):
+        """
+        Roll back the test data. Returns the state passed to
+        ``push_test_data``.
+        """
+        self._execute('ROLLBACK TO SAVEPOINT %s' % TEST_DATA_SAVEPOINT)
+        self._execute('RELEASE SAVEPOINT %s' % TEST_DATA_SAVEPOINT)
+        self.test_data_name = None
+        self._in_test = False
+        return self._test_data_state
+
+    def start_test(self):
+        """
+        Take the savepoint the test rolls back to, unless the previous test
+        left nothing to roll back and its savepoint can be used again.
+        """
+        if self._in_test:
+            return
+        self._execute('SAVEPOINT %s' % TEST_SAVEPOINT)
+        self._in_test = True
+
+    def stop_test(self):
+        """
+        Roll back everything the test did, keeping the layers.
+        """
+        self._execute('ROLLBACK TO SAVEPOINT %s' % TEST_SAVEPOINT)
+        self._execute('RELEASE SAVEPOINT %s' % TEST_SAVEPOINT)
+        self._in_test = False
+
+    def _release_test(self):
+        # A test savepoint that was left for the next test to use mustn't
+        # end up under a layer
+        if self._in_test:
+            self._execute('RELEASE SAVEPOINT %s' % TEST_SAVEPOINT)
+            self._in_test = False
+
+    def abandon(self):
+        """
+        Forget about the transaction after something outside of our control
+        ended it, eg. a commit between tests.
+        """
+        try:
+            self._end(commit=False)
+        except Exception:
+            pass
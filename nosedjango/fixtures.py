@@ -0,0 +1,548 @@
+"""
+Helpers for locating the files behind Django fixture labels, so that anything
+derived from a fixture (snapshots, compiled fixtures, etc) can be invalidated
+when the fixture's contents change, and for loading fixtures in bulk.
+
+Compiled fixtures are a header followed by batches of pickled rows for each
+fixture file. They skip both parsing the file and building model instances
+from it.
+
+Fixtures are streamed from disk to the database: JSON fixtures are parsed one
+object at a time and rows are inserted in batches, so memory use doesn't grow
+with the size of the fixture.
+"""
+
+import bz2
+import codecs
+import cPickle as pickle
+import gzip
+import os
+import shutil
+import zipfile
+from hashlib import sha1
+
+# Rows per executemany when bulk loading fixtures, and per pickled batch in
+# compiled fixtures
+BULK_INSERT_BATCH_SIZE = 500
+# Bytes read at a time when streaming JSON fixtures
+JSON_CHUNK_SIZE = 64 * 1024
+
+class SingleZipReader(zipfile.ZipFile):
+    """
+    Reads the first file in a zip archive, like ``loaddata`` does, but
+    allows it to be read a chunk at a time.
+    """
+    def __init__(self, *args, **kwargs):
+        zipfile.ZipFile.__init__(self, *args, **kwargs)
+        self._member = None
+
+    def read(self, size=-1):
+        if self._member is None:
+            self._member = self.open(self.namelist()[0])
+        return self._member.read(size)
+
+COMPRESSION_TYPES = {
+    None: open,
+    'gz': gzip.GzipFile,
+    'zip': SingleZipReader,
+    'bz2': bz2.BZ2File,
+}
+
+# Content hashes keyed by (path, mtime, size) so that unchanged files are only
+# read once per process
+_file_hashes = {}
+
+def can_load_in_bulk():
+    """
+    Whether this version of django has the ``connections`` and ``router``
+    the bulk loader needs, as of django 1.2.
+    """
+    from django import VERSION as DJANGO_VERSION
+    return DJANGO_VERSION[:2] >= (1, 2)
+
+def get_fixture_dirs():
+    """
+    The directories that ``loaddata`` searches for relative fixture labels, in
+    the same order.
+    """
+    from django.conf import settings
+    from django.db.models import get_apps
+
+    app_module_paths = []
+    for app in get_apps():
+        if hasattr(app, '__path__'):
+            # It's a 'models/' subpackage
+            app_module_paths.extend(app.__path__)
+        else:
+            # It's a models.py module
+            app_module_paths.append(app.__file__)
+
+    app_fixtures = [
+        os.path.join(os.path.dirname(path), 'fixtures')
+        for path in app_module_paths]
+    return app_fixtures + list(settings.FIXTURE_DIRS) + ['']
+
+def find_fixture_files(fixture_label, using='default'):
+    """
+    Find the files that ``loaddata`` would load for the given fixture label,
+    as a list of ``(path, format, compression)`` tuples.
+    """
+    from django.core import serializers
+
+    parts = fixture_label.split('.')
+    if len(parts) > 1 and parts[-1] in COMPRESSION_TYPES:
+        compression_formats = [parts[-1]]
+        parts = parts[:-1]
+    else:
+        compression_formats = COMPRESSION_TYPES.keys()
+
+    public_formats = serializers.get_public_serializer_formats()
+    if len(parts) == 1:
+        fixture_name = parts[0]
+        formats = public_formats
+    else:
+        fixture_name, format = '.'.join(parts[:-1]), parts[-1]
+        if format in public_formats:
+            formats = [format]
+        else:
+            formats = []
+
+    if os.path.isabs(fixture_name):
+        fixture_dirs = [os.path.dirname(fixture_name)]
+        fixture_name = os.path.basename(fixture_name)
+    else:
+        fixture_dirs = get_fixture_dirs()
+
+    found = []
+    for fixture_dir in fixture_dirs:
+        for database in [using, None]:
+            for format in formats:
+                for compression_format in compression_formats:
+                    file_name = '.'.join([
+                        part for part in [
+                            fixture_name, database, format,
+                            compression_format]
+                        if part])
+                    path = os.path.join(fixture_dir, file_name)
+                    if os.path.isfile(path):
+                        found.append((path, format, compression_format))
+    return found
+
+def find_fixture_files_to_load(fixture_label, using='default'):
+    """
+    Like ``find_fixture_files``, but refuse to load a fixture label that
+    matches more than one file in the same directory, like ``loaddata``
+    does.
+    """
+    found = find_fixture_files(fixture_label, using=using)
+    fixture_dirs = [os.path.dirname(path) for path, _, _ in found]
+    for fixture_dir in fixture_dirs:
+        if fixture_dirs.count(fixture_dir) > 1:
+            raise ValueError("Multiple fixtures named '%s' in %s" % (
+                fixture_label, fixture_dir))
+    return found
+
+def get_file_hash(path):
+    stat = os.stat(path)
+    key = (path, stat.st_mtime, stat.st_size)
+    if key not in _file_hashes:
+        f = open(path, 'rb')
+        try:
+            _file_hashes[key] = sha1(f.read()).hexdigest()
+        finally:
+            f.close()
+    return _file_hashes[key]
+
+def get_fixtures_hash(fixture_labels):
+    """
+    A hash of the contents of every file behind the given fixture labels.
+    """
+    fixtures_hash = sha1()
+    for fixture_label in fixture_labels:
+        fixtures_hash.update(fixture_label)
+        for path, _, _ in find_fixture_files(fixture_label):
+            fixtures_hash.update(path)
+            fixtures_hash.update(get_file_hash(path))
+    return fixtures_hash.hexdigest()
+
+def iter_json_objects(stream, chunk_size=JSON_CHUNK_SIZE):
+    """
+    Yield the items of the JSON array in ``stream`` one at a time, only
+    reading as much of the stream as is needed to decode the next item.
+    """
+    from django.utils import simplejson
+
+    decoder = simplejson.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buf = u''
+    pos = 0
+    eof = False
+    in_array = False
+    while True:
+        # Skip the whitespace and punctuation between array items
+        while pos < len(buf) and (
+            buf[pos].isspace() or (in_array and buf[pos] == ',')):
+            pos += 1
+        if pos < len(buf):
+            if not in_array:
+                if buf[pos] != '[':
+                    raise ValueError('Expected a JSON array of objects')
+                in_array = True
+                pos += 1
+                continue
+            if buf[pos] == ']':
+                return
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                # Probably only part of the item has been read so far
+                if eof:
+                    raise
+            else:
+                yield obj
+                pos = end
+                continue
+        elif eof:
+            raise ValueError('Unexpected end of JSON fixture')
+
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buf = buf[pos:] + text_decoder.decode(chunk, eof)
+        pos = 0
+
+def deserialize_fixture_file(path, format, compression_format,
+                             using='default'):
+    """
+    Yield the ``DeserializedObject`` instances in a single fixture file. JSON
+    fixtures are read incrementally instead of all at once.
+    """
+    from django.core import serializers
+    from django.core.serializers.python import Deserializer
+
+    fixture = COMPRESSION_TYPES[compression_format](path, 'r')
+    try:
+        if format == 'json':
+            objects = Deserializer(iter_json_objects(fixture), using=using)
+        else:
+            objects = serializers.deserialize(format, fixture, using=using)
+        for obj in objects:
+            yield obj
+    finally:
+        fixture.close()
+
+def get_concrete_model(model):
+    """
+    The model whose table holds the rows of ``model``, which is a different
+    one for proxy models.
+    """
+    while getattr(model._meta, 'proxy', False):
+        model = model._meta.proxy_for_model
+    return model
+
+def get_object_row(obj):
+    """
+    Flatten a ``DeserializedObject`` in to the ``(model, values, m2m_data)``
+    form used by the bulk loader, where ``values`` lines up with the local
+    fields of the concrete model. A multi-table inheritance child's local
+    fields are its own table's, with the parent link as primary key, and
+    the parent is a separate object in the fixture.
+    """
+    model = get_concrete_model(obj.object.__class__)
+    values = tuple([getattr(obj.object, field.attname)
+                    for field in model._meta.local_fields])
+    return model, values, obj.m2m_data
+
+def _get_model_key(model):
+    return (
+        model._meta.app_label,
+        model._meta.object_name,
+        tuple([field.attname for field in model._meta.local_fields]),
+    )
+
+def get_compiled_fixture_path(path, compiled_dir):
+    return os.path.join(
+        compiled_dir,
+        '%s.pickle' % sha1(os.path.abspath(path)).hexdigest())
+
+def compile_fixture_file(path, format, compression_format, compiled_dir,
+                         using='default'):
+    """
+    Deserialize a fixture file and pickle its rows in to ``compiled_dir``.
+
+    The compiled file starts with a header holding a hash of the source file
+    and the fields of the models in it, so that stale copies are ignored.
+    That's followed by ``(model_key, rows)`` batches of consecutive rows for
+    the same model, and ends with ``None``.
+    """
+    compiled_path = get_compiled_fixture_path(path, compiled_dir)
+    # The rows are written to a temporary file first, so that the models can
+    # go in the header and a failed compile doesn't leave a truncated file
+    # behind
+    rows_path = '%s.%s.rows' % (compiled_path, os.getpid())
+    tmp_path = '%s.%s.tmp' % (compiled_path, os.getpid())
+    model_keys = set()
+    try:
+        rows_file = open(rows_path, 'w+b')
+        try:
+            pickler = pickle.Pickler(rows_file, pickle.HIGHEST_PROTOCOL)
+            batch_model, batch = None, []
+            for obj in deserialize_fixture_file(
+                path, format, compression_format, using=using):
+                model, values, m2m_data = get_object_row(obj)
+                if batch and (model is not batch_model or
+                              len(batch) >= BULK_INSERT_BATCH_SIZE):
+                    model_keys.add(_get_model_key(batch_model))
+                    pickler.dump((_get_model_key(batch_model), batch))
+                    # Don't let the pickler's memo keep every row alive
+                    pickler.clear_memo()
+                    batch = []
+                batch_model = model
+                batch.append((values, m2m_data))
+            if batch:
+                model_keys.add(_get_model_key(batch_model))
+                pickler.dump((_get_model_key(batch_model), batch))
+            pickler.dump(None)
+
+            f = open(tmp_path, 'wb')
+            try:
+                pickle.dump({
+                    'source_hash': get_file_hash(path),
+                    'models': sorted(model_keys),
+                }, f, pickle.HIGHEST_PROTOCOL)
+                rows_file.seek(0)
+                shutil.copyfileobj(rows_file, f)
+            finally:
+                f.close()
+        finally:
+            rows_file.close()
+            os.remove(rows_path)
+        os.rename(tmp_path, compiled_path)
+    except:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return compiled_path
+
+def open_compiled_fixture(path, compiled_dir):
+    """
+    Open the copy of a fixture file compiled in to ``compiled_dir``, or
+    return ``None`` if there's no compiled copy matching the file and the
+    current models.
+    """
+    from django.db.models import get_model
+
+    compiled_path = get_compiled_fixture_path(path, compiled_dir)
+    if not os.path.exists(compiled_path):
+        return None
+    f = open(compiled_path, 'rb')
+    try:
+        header = pickle.load(f)
+    except Exception:
+        # Truncated, or written by an incompatible version
+        f.close()
+        return None
+    if not isinstance(header, dict) or \
+       header.get('source_hash') != get_file_hash(path):
+        f.close()
+        return None
+    for model_key in header['models']:
+        model = get_model(model_key[0], model_key[1])
+        if model is None or _get_model_key(model) != model_key or \
+           get_concrete_model(model) is not model:
+            # The model has changed since the fixture was compiled
+            f.close()
+            return None
+    return f
+
+def read_compiled_fixture(compiled_file):
+    """
+    Yield ``(model, values, m2m_data)`` for the rows in a compiled fixture
+    opened with ``open_compiled_fixture``.
+    """
+    from django.db.models import get_model
+
+    models = {}
+    try:
+        while True:
+            batch = pickle.load(compiled_file)
+            if batch is None:
+                return
+            model_key, rows = batch
+            if model_key not in models:
+                models[model_key] = get_model(model_key[0], model_key[1])
+            model = models[model_key]
+            for values, m2m_data in rows:
+                yield model, values, m2m_data
+    finally:
+        compiled_file.close()
+
+def get_fixture_rows(fixture_labels, using='default', compiled_dir=None):
+    """
+    Yield ``(model, values, m2m_data)`` for every object in the given
+    fixtures, preferring compiled copies from ``compiled_dir``.
+    """
+    for fixture_label in fixture_labels:
+        for path, format, compression_format in find_fixture_files_to_load(
+            fixture_label, using=using):
+            compiled_file = None
+            if compiled_dir is not None:
+                compiled_file = open_compiled_fixture(path, compiled_dir)
+            if compiled_file is not None:
+                rows = read_compiled_fixture(compiled_file)
+            else:
+                rows = (get_object_row(obj) for obj in deserialize_fixture_file(
+                    path, format, compression_format, using=using))
+            for row in rows:
+                yield row
+
+class BulkLoader(object):
+    """
+    Inserts fixture rows in batches of ``BULK_INSERT_BATCH_SIZE`` per model.
+    The parsed objects are streamed, with at most a batch per model held at
+    once, but the primary key of every row inserted is kept to spot later
+    rows repeating it, so that set still grows with the number of rows.
+
+    Rows for models whose table already had rows in it (eg. from post_syncdb
+    handlers), rows without a primary key and rows repeating an earlier
+    primary key are saved normally, since they might need to update existing
+    rows.
+    """
+    def __init__(self, using='default'):
+        from django.db import connections
+
+        self.using = using
+        self.connection = connections[using]
+        self.models = []
+        self.bulk_models = set()
+        self.pending = {}
+        self.seen_pks = {}
+
+    def add(self, model, values, m2m_data):
+        if model not in self.seen_pks:
+            self.models.append(model)
+            self.seen_pks[model] = set()
+            if not _table_has_rows(self.connection, model._meta.db_table):
+                self.bulk_models.add(model)
+                self.pending[model] = {}
+
+        pk = values[model._meta.local_fields.index(model._meta.pk)]
+        if model not in self.bulk_models or pk is None:
+            _save_row(model, values, m2m_data, self.using)
+            return
+        pending = self.pending[model]
+        if pk in pending:
+            # Keep only the last copy of each object, just like saving them
+            # would
+            pending[pk] = (values, m2m_data)
+        elif pk in self.seen_pks[model]:
+            _save_row(model, values, m2m_data, self.using)
+        else:
+            self.seen_pks[model].add(pk)
+            pending[pk] = (values, m2m_data)
+            if len(pending) >= BULK_INSERT_BATCH_SIZE:
+                self.flush_model(model)
+
+    def flush_model(self, model):
+        if self.pending[model]:
+            _insert_model_rows(
+                self.connection, model, self.pending[model].values())
+            self.pending[model] = {}
+
+    def finish(self):
+        """
+        Insert any remaining rows and reset the sequences of the loaded
+        models.
+        """
+        from django.core.management.color import no_style
+
+        for model in self.models:
+            if model in self.bulk_models:
+                self.flush_model(model)
+        cursor = self.connection.cursor()
+        for sql in self.connection.ops.sequence_reset_sql(
+            no_style(), self.models):
+            cursor.execute(sql)
+
+def load_fixtures(fixture_labels, using='default', compiled_dir=None):
+    """
+    A faster ``loaddata``. Instead of saving objects one at a time, the
+    objects are grouped by model and inserted with batched ``executemany``
+    calls, with the sequences reset afterwards. If ``compiled_dir`` is given,
+    fixture files compiled in to it are read from there.
+
+    Objects go straight in to the database, so no ``pre_save`` or
+    ``post_save`` signals are sent.
+
+    Nothing is committed.
+    """
+    from django.db import connections, router
+
+    connection = connections[using]
+    cursor = connection.cursor()
+    is_mysql = 'mysql' in connection.settings_dict['ENGINE']
+    if is_mysql:
+        # Models are inserted in batches as they fill up, which isn't
+        # necessarily the order their foreign keys need
+        cursor.execute('SET FOREIGN_KEY_CHECKS = 0')
+    try:
+        loader = BulkLoader(using=using)
+        for model, values, m2m_data in get_fixture_rows(
+            fixture_labels, using=using, compiled_dir=compiled_dir):
+            if router.allow_syncdb(using, model):
+                loader.add(model, values, m2m_data)
+        loader.finish()
+    finally:
+        if is_mysql:
+            cursor.execute('SET FOREIGN_KEY_CHECKS = 1')
+
+def _save_row(model, values, m2m_data, using):
+    from django.core.serializers.base import DeserializedObject
+
+    attnames = [field.attname for field in model._meta.local_fields]
+    obj = model(**dict(zip(attnames, values)))
+    DeserializedObject(obj, m2m_data).save(using=using)
+
+def _table_has_rows(connection, table):
+    cursor = connection.cursor()
+    cursor.execute('SELECT 1 FROM %s' % connection.ops.quote_name(table))
+    return cursor.fetchone() is not None
+
+def _insert_rows(connection, table, columns, rows):
+    qn = connection.ops.quote_name
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        qn(table),
+        ', '.join([qn(column) for column in columns]),
+        ', '.join(['%s'] * len(columns)),
+    )
+    cursor = connection.cursor()
+    for start in range(0, len(rows), BULK_INSERT_BATCH_SIZE):
+        cursor.executemany(sql, rows[start:start + BULK_INSERT_BATCH_SIZE])
+
+def _insert_model_rows(connection, model, rows):
+    """
+    Insert the model's rows and the rows for their many-to-many relations.
+    """
+    fields = model._meta.local_fields
+    pk_index = fields.index(model._meta.pk)
+    _insert_rows(
+        connection,
+        model._meta.db_table,
+        [field.column for field in fields],
+        [tuple([field.get_db_prep_save(value, connection=connection)
+                for field, value in zip(fields, values)])
+         for values, _ in rows])
+
+    for field in model._meta.many_to_many:
+        if not field.rel.through._meta.auto_created:
+            # The serializers skip these too
+            continue
+        m2m_rows = []
+        for values, m2m_data in rows:
+            for related_pk in m2m_data.get(field.name, []):
+                m2m_rows.append((values[pk_index], related_pk))
+        if m2m_rows:
+            _insert_rows(
+                connection,
+                field.m2m_db_table(),
+                [field.m2m_column_name(), field.m2m_reverse_name()],
+                m2m_rows)
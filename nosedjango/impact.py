@@ -0,0 +1,331 @@
+"""
+Test impact analysis: record which project files each test depends on, so
+that later runs can skip the tests that a change can't affect.
+
+A test depends on its module and on every project module that one depends
+on, however indirectly: the modules it imports, including from inside
+functions, and the modules of the functions and classes it refers to.
+Modules imported while setting up (settings, models, etc) and
+``initial_data`` fixtures are global dependencies, and changing one of them
+selects every test. Tests whose module isn't known are left out of the map,
+so that they always run.
+"""
+
+from __future__ import absolute_import
+
+import __builtin__
+import os
+import subprocess
+import sys
+import types
+
+try:
+    import json
+except ImportError:
+    from django.utils import simplejson as json
+
+from nosedjango.fixtures import find_fixture_files
+
+# Maps recorded before dependencies were followed from module to module
+# would leave out tests
+IMPACT_MAP_VERSION = 2
+
+def get_module_file(module):
+    path = getattr(module, '__file__', None)
+    if not path:
+        return None
+    if path.endswith(('.pyc', '.pyo')):
+        path = path[:-1]
+    return os.path.abspath(path)
+
+def get_test_module_name(test):
+    """
+    The name of the module a nose test was collected from.
+    """
+    context = getattr(test, 'context', None)
+    if context is None:
+        return None
+    # Test classes know their module, and function tests have the module
+    # itself as their context
+    return getattr(context, '__module__', None) or \
+        getattr(context, '__name__', None)
+
+def get_referenced_modules(module):
+    """
+    The names of the modules that ``module`` refers to by name: the ones it
+    imported, and the ones it imported functions, classes or other objects
+    from. The submodules of a package aren't counted for the package.
+    """
+    submodule_prefix = module.__name__ + '.'
+    names = set()
+    for value in list(vars(module).values()):
+        try:
+            if isinstance(value, types.ModuleType):
+                name = value.__name__
+            else:
+                name = getattr(value, '__module__', None)
+        except Exception:
+            # Lazy objects can fail in all sorts of ways
+            continue
+        if isinstance(name, basestring) and \
+           not name.startswith(submodule_prefix):
+            names.add(name)
+    return names
+
+def get_imported_module_names(name, importer_globals, fromlist, level):
+    """
+    The names of the modules an ``__import__`` call may have imported, as
+    either absolute or relative imports.
+    """
+    names = [name]
+    importer = importer_globals.get('__name__')
+    if importer and level != 0:
+        if '__path__' in importer_globals:
+            package = importer
+        else:
+            package = importer.rpartition('.')[0]
+        for _ in range(max(level, 1) - 1):
+            package = package.rpartition('.')[0]
+        if package:
+            names.append('.'.join([part for part in [package, name] if part]))
+    for module_name in list(names):
+        for item in fromlist or ():
+            names.append('%s.%s' % (module_name, item))
+    return names
+
+class ImpactRecorder(object):
+    """
+    Collects the project files, relative to ``root``, that each test
+    depends on.
+    """
+    def __init__(self, root):
+        self.root = root
+        self.global_files = set()
+        self.tests = {}
+        self._test_modules = {}
+        self._imports = {}
+        self._original_import = None
+        self._import_files = {}
+        self._modules_before_import = None
+        self._modules_before_test = None
+        self._current_test = None
+
+    def relative_path(self, path):
+        if path is None:
+            return None
+        path = os.path.abspath(path)
+        if not path.startswith(self.root + os.sep):
+            return None
+        return os.path.relpath(path, self.root).replace(os.sep, '/')
+
+    def _new_module_files(self, modules_before):
+        files = set()
+        for name in set(sys.modules) - modules_before:
+            path = self.relative_path(get_module_file(sys.modules[name]))
+            if path:
+                files.add(path)
+        return files
+
+    def record_global(self):
+        """
+        Record everything imported so far, and the ``initial_data``
+        fixtures, as global dependencies.
+        """
+        for name, module in sys.modules.items():
+            if name == '__main__':
+                # The script nose is running from, not part of the project
+                continue
+            path = self.relative_path(get_module_file(module))
+            if path:
+                self.global_files.add(path)
+        for path, _, _ in find_fixture_files('initial_data'):
+            path = self.relative_path(path)
+            if path:
+                self.global_files.add(path)
+
+    def start_recording_imports(self):
+        """
+        Record which modules each module imports, including the imports run
+        inside functions and those of modules that were already imported.
+        """
+        self._original_import = __builtin__.__import__
+        __builtin__.__import__ = self._import
+
+    def stop_recording_imports(self):
+        if self._original_import is not None:
+            __builtin__.__import__ = self._original_import
+            self._original_import = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=None,
+                level=-1):
+        module = self._original_import(name, globals, locals, fromlist, level)
+        if globals and globals.get('__name__'):
+            imported = self._imports.setdefault(globals['__name__'], set())
+            if getattr(module, '__name__', None):
+                imported.add(module.__name__)
+            for module_name in get_imported_module_names(
+                name, globals, fromlist, level):
+                if sys.modules.get(module_name) is not None:
+                    imported.add(module_name)
+        return module
+
+    def get_module_files(self, module_name):
+        """
+        The project files of ``module_name`` and of every project module it
+        imports or refers to, directly or not.
+        """
+        files = set()
+        seen = set()
+        pending = [module_name]
+        while pending:
+            name = pending.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            module = sys.modules.get(name)
+            path = self.relative_path(get_module_file(module))
+            if path is None:
+                # Not part of the project, so not followed any further
+                continue
+            files.add(path)
+            pending.extend(self._imports.get(name, ()))
+            pending.extend(get_referenced_modules(module))
+        return files
+
+    def before_import(self):
+        self._modules_before_import = set(sys.modules)
+
+    def after_import(self, module_name):
+        if self._modules_before_import is None:
+            return
+        files = self._new_module_files(self._modules_before_import)
+        module_path = self.relative_path(
+            get_module_file(sys.modules.get(module_name)))
+        if module_path:
+            files.add(module_path)
+        self._import_files.setdefault(module_name, set()).update(files)
+
+    def start_test(self, test_id, module_name):
+        module_path = self.relative_path(
+            get_module_file(sys.modules.get(module_name)))
+        if module_path is None:
+            # Nothing to go on, so leave it to always run
+            self._current_test = None
+            return
+        files = set(self._import_files.get(module_name, ()))
+        files.add(module_path)
+        self._current_test = {'files': files, 'templates': set()}
+        self.tests[test_id] = self._current_test
+        self._test_modules[test_id] = module_name
+        self._modules_before_test = set(sys.modules)
+
+    def add_fixtures(self, fixture_labels):
+        if self._current_test is None:
+            return
+        for fixture_label in fixture_labels:
+            for path, _, _ in find_fixture_files(fixture_label):
+                path = self.relative_path(path)
+                if path:
+                    self._current_test['files'].add(path)
+
+    def add_template(self, template_name):
+        if self._current_test is not None and template_name:
+            self._current_test['templates'].add(template_name)
+
+    def stop_test(self):
+        if self._current_test is None:
+            return
+        self._current_test['files'].update(
+            self._new_module_files(self._modules_before_test))
+        self._current_test = None
+
+    def save(self, path):
+        """
+        Merge what was recorded in to the impact map at ``path``, keeping
+        the entries for tests that didn't run.
+        """
+        impact_map = load_impact_map(path) or {'global': [], 'tests': {}}
+        impact_map['version'] = IMPACT_MAP_VERSION
+        impact_map['global'] = sorted(
+            set(impact_map['global']) | self.global_files)
+        module_files = {}
+        for test_id, dependencies in self.tests.items():
+            module_name = self._test_modules[test_id]
+            if module_name not in module_files:
+                module_files[module_name] = self.get_module_files(module_name)
+            impact_map['tests'][test_id] = {
+                'files': sorted(
+                    dependencies['files'] | module_files[module_name]),
+                'templates': sorted(dependencies['templates']),
+            }
+        f = open(path, 'w')
+        try:
+            json.dump(impact_map, f, indent=2, sort_keys=True)
+        finally:
+            f.close()
+
+def load_impact_map(path):
+    if not os.path.exists(path):
+        return None
+    f = open(path)
+    try:
+        try:
+            impact_map = json.load(f)
+        except ValueError:
+            return None
+    finally:
+        f.close()
+    if impact_map.get('version') != IMPACT_MAP_VERSION:
+        return None
+    return impact_map
+
+def get_changed_files(since, root):
+    """
+    The files, relative to ``root``, that git says have changed since the
+    ``since`` revision, including uncommitted and untracked files.
+    """
+    def git(*args):
+        process = subprocess.Popen(
+            ('git',) + args, cwd=root, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE)
+        out, err = process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError(
+                "Can't get the files changed since %s: %s" % (
+                    since, err.strip()))
+        return [line for line in out.splitlines() if line]
+
+    toplevel = git('rev-parse', '--show-toplevel')[0]
+    paths = git('diff', '--name-only', since, '--') + \
+        git('ls-files', '--others', '--exclude-standard', '--full-name')
+    changed_files = set()
+    for path in paths:
+        path = os.path.join(toplevel, path)
+        if path.startswith(root + os.sep):
+            changed_files.add(
+                os.path.relpath(path, root).replace(os.sep, '/'))
+    return changed_files
+
+class ImpactSelector(object):
+    """
+    Decides which tests need to run after ``changed_files`` changed. Tests
+    missing from the impact map always run.
+    """
+    def __init__(self, impact_map, changed_files):
+        self.changed_files = changed_files
+        self.tests = impact_map['tests']
+        self.run_everything = bool(
+            set(impact_map['global']) & changed_files)
+
+    def is_affected(self, test_id):
+        if self.run_everything or test_id not in self.tests:
+            return True
+        dependencies = self.tests[test_id]
+        if set(dependencies['files']) & self.changed_files:
+            return True
+        for template_name in dependencies['templates']:
+            for path in self.changed_files:
+                if path == template_name or \
+                   path.endswith('/' + template_name):
+                    return True
+        return False
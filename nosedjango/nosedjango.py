@@ -4,15 +4,18 @@ database (or schema) and installs apps from test settings file before tests
 are run, and tears the test database (or schema) down after all tests are run.
 """
 
-from __future__ import with_statement
+from __future__ import absolute_import, with_statement
 
 import logging
 import os
 import re
 import sys
+import unittest
+from inspect import isclass
 
 import nose.case
 from nose.plugins import Plugin
+from nose.suite import ContextSuite, LazySuite
 
 # Force settings.py pointer
 # search the current working directory and all parent directories to find
@@ -23,6 +26,31 @@ if not 'DJANGO_SETTINGS_MODULE' in os.environ:
 
 logger = logging.getLogger('nose.plugins.nosedjango')
 
+# The NoseDjango instance that set up django and the test database in this
+# process, for multiprocess workers forked from it to take over
+_warm_parent = None
+
+# State that warm workers take over from the process they were forked from.
+# The cursor wrappers installed on the inherited connection refer to these.
+WARM_WORKER_ATTRIBUTES = (
+    'settings_path',
+    'old_db',
+    'dirty_tables',
+    '_seeded_tables',
+    'query_stats',
+    'fixture_snapshots',
+    'schema_cache',
+    '_pristine_table_ddl',
+    '_content_type_image',
+    'fixture_layers',
+    'session_tracker',
+    'read_only_tracker',
+    'other_connections',
+    'other_test_dbs',
+    '_shared_test_dbs',
+    '_old_other_dbs',
+)
+
 NT_ROOT = re.compile(r"^[a-zA-Z]:\\$")
 def get_settings_path(settings_module):
     '''
@@ -42,6 +70,9 @@ def get_settings_path(settings_module):
             return None
     return cwd
 
+def get_class_name(cls):
+    return '%s.%s' % (cls.__module__, cls.__name__)
+
 def _dummy(*args, **kwargs):
     """Dummy function that replaces the transaction functions"""
     return
@@ -68,6 +99,41 @@ class NoseDjango(Plugin):
         self._num_fixture_loads = 0
         self._num_flush_calls = 0
         self._num_syncdb_calls = 0
+        self._num_snapshot_restores = 0
+        self._num_dirty_table_clears = 0
+        self._num_schema_replays = 0
+
+        self.fixture_snapshots = None
+        self._keep_test_db = False
+        self._reused_test_db = False
+        self.dirty_tables = None
+        self._seeded_tables = None
+        self._dirty_tables_before_test = None
+        self._fixture_dirty_tables = {}
+        self.timings = None
+        self.query_stats = None
+        self.impact = None
+        self.impact_selector = None
+        self.durations = None
+        self.schema_cache = None
+        self._pristine_table_ddl = None
+        self._content_type_image = None
+        self._num_schema_restores = 0
+        self.use_fixture_layers = False
+        self.fixture_layers = None
+        self._committed_fixture_layers = []
+        self._num_fixture_layer_rollbacks = 0
+        self._num_test_data_setups = 0
+        self.session_tracker = None
+        self._num_session_resets = 0
+        self.read_only_tracker = None
+        self._num_read_only_tests = 0
+        self.other_connections = []
+        self.other_test_dbs = []
+        self._shared_test_dbs = []
+        self._old_other_dbs = {}
+        self._other_db_fixtures = []
+        self._num_other_db_flushes = 0
 
     def disable_transaction_support(self, transaction):
         self.orig_commit = transaction.commit
@@ -98,6 +164,211 @@ class NoseDjango(Plugin):
             help='Use custom Django settings module.',
             metavar='SETTINGS',
         )
+        parser.add_option(
+            '--django-fixture-grouping',
+            dest='django_fixture_grouping',
+            action='store_true',
+            default=False,
+            help='Reorder test classes so that classes sharing the same '
+                 'fixtures and transaction settings run back-to-back. Each '
+                 'distinct set of fixtures is then only loaded once.',
+        )
+        parser.add_option(
+            '--django-fixture-snapshots',
+            dest='django_fixture_snapshots',
+            type='int',
+            default=0,
+            metavar='N',
+            help='Keep snapshots of the database contents for up to N sets of '
+                 'fixtures and restore them instead of reloading the '
+                 'fixtures. Default: 0 (disabled).',
+        )
+        parser.add_option(
+            '--django-fixture-layers',
+            dest='django_fixture_layers',
+            action='store_true',
+            default=False,
+            help='Load the fixtures of transaction isolated tests one '
+                 'savepoint at a time, so that only the fixtures that differ '
+                 'from the previous test are rolled back and loaded. '
+                 'Fixtures shared by neighbouring tests are committed.',
+        )
+        parser.add_option(
+            '--django-reuse-db',
+            dest='django_reuse_db',
+            action='store_true',
+            default=False,
+            help='Keep the test database between runs and only re-create it '
+                 'when the models have changed. Has no effect on in-memory '
+                 'sqlite databases.',
+        )
+        parser.add_option(
+            '--django-schema-cache',
+            dest='django_schema_cache',
+            metavar='DIR',
+            help='Keep the SQL that syncdb ran to create the test database '
+                 'in DIR, and replay it instead of running syncdb when the '
+                 'models are the same.',
+        )
+        parser.add_option(
+            '--django-fast-rebuild-schema',
+            dest='django_fast_rebuild_schema',
+            action='store_true',
+            default=False,
+            help='After a rebuild_schema test, only re-create the tables '
+                 'whose schema it changed, and flush, instead of re-creating '
+                 'the whole test database. Works with sqlite and MySQL.',
+        )
+        parser.add_option(
+            '--django-reuse-connections',
+            dest='django_reuse_connections',
+            action='store_true',
+            default=False,
+            help='Keep the database connection open after rolling back a '
+                 'transaction isolated test, and reset its session instead: '
+                 'temporary tables, settings, encoding and isolation level.',
+        )
+        parser.add_option(
+            '--django-detect-read-only',
+            dest='django_detect_read_only',
+            action='store_true',
+            default=False,
+            help='Watch the statements each test runs, and skip rolling '
+                 'back, reconnecting, clearing the database or rebuilding '
+                 'the schema after tests that only read.',
+        )
+        parser.add_option(
+            '--django-track-dirty-tables',
+            dest='django_track_dirty_tables',
+            action='store_true',
+            default=False,
+            help='Keep track of the tables written to since the last flush '
+                 'and only clear those instead of flushing the whole '
+                 'database.',
+        )
+        parser.add_option(
+            '--django-bulk-fixtures',
+            dest='django_bulk_fixtures',
+            action='store_true',
+            default=False,
+            help='Load fixtures with batched inserts instead of saving each '
+                 'object. No model signals are sent for the loaded objects.',
+        )
+        parser.add_option(
+            '--django-compiled-fixtures',
+            dest='django_compiled_fixtures',
+            metavar='DIR',
+            help='Load fixtures from the copies compiled in to DIR by '
+                 'nosedjango-compile-fixtures, where they are up to date. '
+                 'Implies --django-bulk-fixtures.',
+        )
+        parser.add_option(
+            '--django-warm-workers',
+            dest='django_warm_workers',
+            action='store_true',
+            default=False,
+            help='Let --processes workers take over the django setup and '
+                 'sqlite test database of the main process, which they '
+                 'inherit when forked, instead of setting up from scratch.',
+        )
+        parser.add_option(
+            '--django-timings',
+            dest='django_timings',
+            action='store_true',
+            default=False,
+            help='Report how long each phase nosedjango controls took, eg. '
+                 'creating the test database, flushing and loading '
+                 'fixtures, along with the slowest tests for each phase.',
+        )
+        parser.add_option(
+            '--django-timings-json',
+            dest='django_timings_json',
+            metavar='FILE',
+            help='Also write the phase timings to FILE as JSON. Implies '
+                 '--django-timings.',
+        )
+        parser.add_option(
+            '--django-timings-top',
+            dest='django_timings_top',
+            type='int',
+            default=5,
+            metavar='N',
+            help='Number of slowest tests to list for each phase. '
+                 'Default: 5.',
+        )
+        parser.add_option(
+            '--django-query-stats',
+            dest='django_query_stats',
+            action='store_true',
+            default=False,
+            help='Count the queries each test runs and how long they take, '
+                 'and report the tests running the most queries.',
+        )
+        parser.add_option(
+            '--django-query-stats-json',
+            dest='django_query_stats_json',
+            metavar='FILE',
+            help='Also write the query counts, times and slowest statements '
+                 'of every test to FILE as JSON. Implies '
+                 '--django-query-stats.',
+        )
+        parser.add_option(
+            '--django-query-stats-top',
+            dest='django_query_stats_top',
+            type='int',
+            default=10,
+            metavar='N',
+            help='Number of tests to list in the query report. Default: 10.',
+        )
+        parser.add_option(
+            '--django-record-impact',
+            dest='django_record_impact',
+            action='store_true',
+            default=False,
+            help='Record the project modules, fixtures and templates that '
+                 'each test uses in the impact map.',
+        )
+        parser.add_option(
+            '--django-impact-map',
+            dest='django_impact_map',
+            default='.nosedjango-impact.json',
+            metavar='FILE',
+            help='Where to keep the impact map. '
+                 'Default: .nosedjango-impact.json',
+        )
+        parser.add_option(
+            '--django-changed-since',
+            dest='django_changed_since',
+            metavar='REV',
+            help='Only run the tests that, according to the impact map, '
+                 'depend on files changed since the git revision REV. Tests '
+                 'missing from the map always run.',
+        )
+        parser.add_option(
+            '--django-record-durations',
+            dest='django_record_durations',
+            action='store_true',
+            default=False,
+            help='Remember how long each test and test class took, '
+                 'including loading fixtures, in the durations file.',
+        )
+        parser.add_option(
+            '--django-durations-file',
+            dest='django_durations_file',
+            default='.nosedjango-durations.json',
+            metavar='FILE',
+            help='Where to keep test durations. '
+                 'Default: .nosedjango-durations.json',
+        )
+        parser.add_option(
+            '--django-longest-first',
+            dest='django_longest_first',
+            action='store_true',
+            default=False,
+            help='Run the test classes that took longest last time first, so '
+                 'that --processes workers finish at about the same time. '
+                 'Implies --django-record-durations.',
+        )
         super(NoseDjango, self).options(parser, env)
 
     def configure(self, options, conf):
@@ -108,15 +379,81 @@ class NoseDjango(Plugin):
             self.settings_module = os.environ['DJANGO_SETTINGS_MODULE']
         else:
             self.settings_module = 'settings'
+        self.fixture_grouping = options.django_fixture_grouping
+        self.max_fixture_snapshots = options.django_fixture_snapshots
+        self.use_fixture_layers = options.django_fixture_layers
+        self.reuse_db = options.django_reuse_db
+        self.track_dirty_tables = options.django_track_dirty_tables
+        self.reuse_connections = options.django_reuse_connections
+        self.detect_read_only = options.django_detect_read_only
+        self.fast_rebuild_schema = options.django_fast_rebuild_schema
+        if options.django_schema_cache:
+            from nosedjango.schema_cache import SchemaCache
+            self.schema_cache = SchemaCache(
+                os.path.abspath(options.django_schema_cache))
+        self.compiled_fixtures_dir = options.django_compiled_fixtures
+        self.bulk_fixtures = (
+            options.django_bulk_fixtures or bool(self.compiled_fixtures_dir))
+        if self.bulk_fixtures:
+            from nosedjango.fixtures import can_load_in_bulk
+            if not can_load_in_bulk():
+                logger.warning(
+                    "Bulk fixture loading needs django >= 1.2, "
+                    "using loaddata")
+                self.bulk_fixtures = False
+        self.warm_workers = options.django_warm_workers
+        self.timings_json = options.django_timings_json
+        self.timings_top = options.django_timings_top
+        if options.django_timings or self.timings_json:
+            from nosedjango.timings import PhaseTimings
+            self.timings = PhaseTimings()
+        self.query_stats_json = options.django_query_stats_json
+        self.query_stats_top = options.django_query_stats_top
+        if options.django_query_stats or self.query_stats_json:
+            from nosedjango.query_stats import QueryStats
+            self.query_stats = QueryStats()
+        self.record_impact = options.django_record_impact
+        self.impact_map_path = os.path.abspath(options.django_impact_map)
+        self.changed_since = options.django_changed_since
+        self.longest_first = options.django_longest_first
+        if options.django_record_durations or self.longest_first:
+            from nosedjango.durations import DurationHistory
+            self.durations = DurationHistory(
+                os.path.abspath(options.django_durations_file))
+            self.durations.load()
 
         super(NoseDjango, self).configure(options, conf)
 
         self.nose_config = conf
 
+    def _timed(self, phase):
+        """
+        A context manager timing ``phase``, if timings are being collected.
+        """
+        if self.timings is None:
+            from nosedjango.timings import NO_TIMINGS
+            return NO_TIMINGS
+        return self.timings.phase(phase)
+
     def call_plugins_method(self, meth_name, *args, **kwargs):
         for plugin in self.django_plugins:
             if hasattr(plugin, meth_name):
-                getattr(plugin, meth_name)(*args, **kwargs)
+                with self._timed('hook:%s' % meth_name):
+                    getattr(plugin, meth_name)(*args, **kwargs)
+
+    def call_plugins_handler(self, meth_name, *args, **kwargs):
+        """
+        Like ``call_plugins_method``, but stops at the first plugin that
+        returns a true value to say that it has taken care of things itself.
+        Returns whether any plugin did.
+        """
+        for plugin in self.django_plugins:
+            if hasattr(plugin, meth_name):
+                with self._timed('hook:%s' % meth_name):
+                    handled = getattr(plugin, meth_name)(*args, **kwargs)
+                if handled:
+                    return True
+        return False
 
     def begin(self):
         """
@@ -128,6 +465,17 @@ class NoseDjango(Plugin):
             if getattr(plugin, 'django_plugin', False):
                 self.django_plugins.append(plugin)
 
+        if self.durations is not None:
+            from nosedjango.plugins.worker_db_plugin import is_worker_process
+            if is_worker_process():
+                # nose never calls finalize() in its workers
+                from multiprocessing.util import Finalize
+                Finalize(None, self.durations.save, exitpriority=10)
+
+        if self.warm_workers and self._can_take_over(_warm_parent):
+            self._take_over(_warm_parent)
+            return
+
         os.environ['DJANGO_SETTINGS_MODULE'] = self.settings_module
 
         if self.conf.addPaths:
@@ -182,11 +530,331 @@ class NoseDjango(Plugin):
 
         self.call_plugins_method(
             'beforeTestDb', settings, connection, management)
-        connection.creation.create_test_db(verbosity=self.verbosity)
-        logger.debug("Running syncdb")
-        self._num_syncdb_calls += 1
+        from nosedjango.databases import get_other_connections
+        self.other_test_dbs, self._shared_test_dbs = get_other_connections()
+        self.other_connections = self.other_test_dbs + [
+            shared for shared, _ in self._shared_test_dbs]
+        if self.track_dirty_tables:
+            from nosedjango.cursors import wrap_cursors
+            from nosedjango.dirty_tables import DirtyTableCursorWrapper
+            from nosedjango.dirty_tables import DirtyTableTracker
+            self.dirty_tables = DirtyTableTracker()
+            wrap_cursors(
+                connection,
+                lambda cursor: DirtyTableCursorWrapper(
+                    cursor, self.dirty_tables))
+        if self.schema_cache is not None:
+            from nosedjango.cursors import wrap_cursors
+            from nosedjango.schema_cache import SchemaRecordingCursorWrapper
+            wrap_cursors(
+                connection,
+                lambda cursor: SchemaRecordingCursorWrapper(
+                    cursor, self.schema_cache))
+        if self.reuse_connections:
+            from nosedjango.cursors import wrap_cursors
+            from nosedjango.sessions import SessionTracker
+            from nosedjango.sessions import SessionTrackingCursorWrapper
+            self.session_tracker = SessionTracker()
+            wrap_cursors(
+                connection,
+                lambda cursor: SessionTrackingCursorWrapper(
+                    cursor, self.session_tracker))
+        if self.detect_read_only:
+            from nosedjango.cursors import wrap_cursors
+            from nosedjango.read_only import ReadOnlyCursorWrapper
+            from nosedjango.read_only import ReadOnlyTracker
+            self.read_only_tracker = ReadOnlyTracker()
+            # A write to any of the databases has to be cleaned up
+            for watched in [connection] + self.other_connections:
+                wrap_cursors(
+                    watched,
+                    lambda cursor: ReadOnlyCursorWrapper(
+                        cursor, self.read_only_tracker))
+        if self.query_stats is not None:
+            from nosedjango.cursors import wrap_cursors
+            from nosedjango.query_stats import QueryStatsCursorWrapper
+            wrap_cursors(
+                connection,
+                lambda cursor: QueryStatsCursorWrapper(
+                    cursor, self.query_stats))
+        self._create_test_dbs(connection)
+        if self.fast_rebuild_schema:
+            from nosedjango.schema import get_table_ddl
+            self._pristine_table_ddl = get_table_ddl(connection)
+        # Nothing after this may use the connection. The worker db plugin
+        # closes it here, and Postgres refuses to use a test database with
+        # open connections as the template of the workers' databases.
         self.call_plugins_method('afterTestDb', settings, connection)
 
+        if self.max_fixture_snapshots > 0:
+            from nosedjango.snapshots import FixtureSnapshotCache
+            from nosedjango.snapshots import get_snapshot_store
+            self.fixture_snapshots = FixtureSnapshotCache(
+                get_snapshot_store(connection), self.max_fixture_snapshots)
+
+        # Also needed without --django-fixture-layers, for the test data of
+        # classes with setup_test_data
+        from nosedjango.fixture_layers import FixtureLayers
+        self.fixture_layers = FixtureLayers(connection)
+
+        if self.record_impact or self.changed_since:
+            self._set_up_impact_analysis()
+
+        if self.warm_workers:
+            self._become_warm_parent()
+
+    def _set_up_impact_analysis(self):
+        from nosedjango.impact import ImpactRecorder, ImpactSelector
+        from nosedjango.impact import get_changed_files, load_impact_map
+
+        root = os.path.abspath(self.nose_config.workingDir)
+        if self.record_impact:
+            from django.test.signals import template_rendered
+
+            self.impact = ImpactRecorder(root)
+            self.impact.record_global()
+            self.impact.start_recording_imports()
+            template_rendered.connect(self._template_rendered)
+        if self.changed_since:
+            impact_map = load_impact_map(self.impact_map_path)
+            if impact_map is None:
+                logger.warning(
+                    "No impact map at %s, running all tests",
+                    self.impact_map_path)
+            else:
+                self.impact_selector = ImpactSelector(
+                    impact_map, get_changed_files(self.changed_since, root))
+
+    def _template_rendered(self, sender, template, **kwargs):
+        self.impact.add_template(getattr(template, 'name', None))
+
+    def _become_warm_parent(self):
+        global _warm_parent
+        self._pid = os.getpid()
+        _warm_parent = self
+
+    def _can_take_over(self, parent):
+        """
+        Whether this is a worker forked from a process that has already set
+        up django and a sqlite test database we can take over.
+        """
+        if parent is None or parent._pid == os.getpid():
+            return False
+        return parent._can_be_taken_over()
+
+    def _can_be_taken_over(self):
+        """
+        Whether a process forked from this one could take over its test
+        databases, which only works with sqlite.
+        """
+        from nosedjango.databases import is_memory_db
+        for other in self.other_connections:
+            if not is_memory_db(other):
+                # Only in-memory databases come along with the process
+                return False
+        from django.db import connection
+        return 'sqlite3' in connection.settings_dict['ENGINE']
+
+    def _take_over(self, parent):
+        """
+        Start up a forked worker using the django setup it inherited from
+        ``parent``, instead of importing settings, patching the test classes,
+        setting up the test environment and creating the test database again.
+        """
+        from django.db import connection
+        from nosedjango.snapshots import is_memory_db_name
+
+        for attr in WARM_WORKER_ATTRIBUTES:
+            setattr(self, attr, getattr(parent, attr))
+        logger.debug("Taking over the test setup of process %s", parent._pid)
+
+        if not is_memory_db_name(connection.settings_dict['NAME']):
+            # An in-memory database was copied along with the rest of the
+            # process, but a database file has to be copied by hand
+            self._copy_test_db_file(connection)
+
+        # The plugins' setup hooks only ran in the parent, so anything they
+        # set up for a process of its own, eg. a media directory, is still
+        # the parent's
+        from django.conf import settings
+        self.call_plugins_method('afterTakeOver', settings, connection)
+
+    def _copy_test_db_file(self, connection):
+        import shutil
+        from multiprocessing.util import Finalize
+
+        test_database_name = connection.settings_dict['NAME']
+        worker_database_name = '%s.%s' % (test_database_name, os.getpid())
+        connection.close()
+        shutil.copyfile(test_database_name, worker_database_name)
+        connection.settings_dict['NAME'] = worker_database_name
+        # Tests that rebuild the schema need to re-create this copy, not the
+        # main process's database
+        connection.settings_dict['TEST_NAME'] = worker_database_name
+
+        def remove_test_db_file():
+            # nose never calls finalize() in its workers
+            if os.path.exists(worker_database_name):
+                os.remove(worker_database_name)
+        Finalize(None, remove_test_db_file, exitpriority=10)
+
+    def _create_test_dbs(self, connection):
+        """
+        Create, or reuse, the default test database, then the test databases
+        of the other aliases.
+        """
+        from nosedjango.plugins.worker_db_plugin import is_worker_process
+
+        # First, since syncdb's post_syncdb handlers can use the default
+        # database whichever database is being synced
+        if self.reuse_db:
+            with self._timed('reuse_test_db'):
+                self._reused_test_db = self._reuse_test_db(connection)
+        if not self._reused_test_db:
+            self._create_test_db(connection)
+
+        if self.other_test_dbs and is_worker_process():
+            self._use_worker_other_test_dbs()
+        with self._timed('create_other_test_dbs'):
+            for other in self.other_test_dbs:
+                self._old_other_dbs[other.alias] = other.settings_dict['NAME']
+                other.creation.create_test_db(
+                    verbosity=self.verbosity, autoclobber=self.reuse_db)
+        logger.debug(
+            "Created the test databases of: %s",
+            [other.alias for other in self.other_test_dbs])
+
+        for shared, shared_with in self._shared_test_dbs:
+            self._old_other_dbs[shared.alias] = shared.settings_dict['NAME']
+            shared.close()
+            shared.settings_dict['NAME'] = shared_with.settings_dict['NAME']
+
+    def _use_worker_other_test_dbs(self):
+        """
+        Every multiprocess worker runs ``begin()``, so the test databases of
+        the other aliases get a name of their own in each, instead of the
+        workers all creating the same one. nose never calls ``finalize()`` in
+        its workers, so they're destroyed when the worker exits.
+        """
+        from multiprocessing.util import Finalize
+        from nosedjango.databases import use_worker_test_db_names
+
+        use_worker_test_db_names(self.other_test_dbs, os.getpid())
+        Finalize(None, self._destroy_other_test_dbs, exitpriority=10)
+
+    def _destroy_test_dbs(self, connection):
+        """
+        Destroy the default test database, unless it's being kept for the
+        next run, while the test databases of the other aliases are destroyed
+        in threads of their own.
+        """
+        def destroy_default_test_db():
+            if self._keep_test_db:
+                # Leave the test database around for the next run
+                connection.close()
+                connection.settings_dict['NAME'] = self.old_db
+            else:
+                with self._timed('destroy_test_db'):
+                    connection.creation.destroy_test_db(
+                        self.old_db, verbosity=self.verbosity)
+
+        self._destroy_other_test_dbs(destroy_default_test_db)
+
+    def _destroy_other_test_dbs(self, destroy_default_test_db=None):
+        """
+        Destroy the test databases of the other aliases, in threads of their
+        own where they can be, while ``destroy_default_test_db`` is called in
+        this one.
+        """
+        from functools import partial
+        from nosedjango.databases import can_use_from_thread, destroy_test_db
+        from nosedjango.databases import run_in_parallel
+
+        for shared, _ in self._shared_test_dbs:
+            shared.close()
+            shared.settings_dict['NAME'] = self._old_other_dbs[shared.alias]
+
+        in_threads = []
+        in_this_thread = []
+        for other in self.other_test_dbs:
+            destroy = partial(
+                destroy_test_db, other.alias,
+                self._old_other_dbs[other.alias], self.verbosity)
+            if can_use_from_thread(other):
+                # The connection can only be closed by the thread that
+                # opened it
+                other.close()
+                in_threads.append(destroy)
+            else:
+                in_this_thread.append(destroy)
+
+        def destroy_in_this_thread():
+            if destroy_default_test_db is not None:
+                destroy_default_test_db()
+            for destroy in in_this_thread:
+                destroy()
+
+        run_in_parallel(destroy_in_this_thread, in_threads)
+
+    def _create_test_db(self, connection):
+        from django.conf import settings
+
+        with self._timed('create_test_db'):
+            handled = self.call_plugins_handler(
+                'handleCreateTestDb', settings, connection)
+            if not handled and self.schema_cache is not None:
+                handled = self.schema_cache.create_test_db(
+                    connection, verbosity=self.verbosity,
+                    autoclobber=self._keep_test_db)
+                if handled:
+                    self._num_schema_replays += 1
+            elif not handled:
+                connection.creation.create_test_db(
+                    verbosity=self.verbosity, autoclobber=self._keep_test_db)
+        if not handled:
+            logger.debug("Running syncdb")
+            self._num_syncdb_calls += 1
+
+        if self._keep_test_db:
+            from nosedjango.schema import write_fingerprint
+            write_fingerprint(connection, self._models_fingerprint)
+
+        # The syncdb left the database in a freshly flushed state, but the
+        # schema might not be the same as last time
+        self._seeded_tables = None
+        self._reset_dirty_tables()
+
+    def _reuse_test_db(self, connection):
+        """
+        Switch the connection over to the test database left behind by a
+        previous run, if it was built from the same models. Returns ``False``
+        if the test database needs to be created.
+        """
+        from nosedjango.schema import get_models_fingerprint, read_fingerprint
+        from nosedjango.snapshots import is_memory_db_name
+
+        test_database_name = connection.creation._get_test_db_name()
+        if is_memory_db_name(test_database_name):
+            # Nothing survives between runs
+            return False
+        self._keep_test_db = True
+        self._models_fingerprint = get_models_fingerprint(connection)
+
+        connection.close()
+        connection.settings_dict['NAME'] = test_database_name
+        if read_fingerprint(connection) != self._models_fingerprint:
+            logger.debug("Models have changed. Re-creating the test database")
+            connection.close()
+            connection.settings_dict['NAME'] = self.old_db
+            return False
+
+        logger.debug("Reusing test database %s", test_database_name)
+        if hasattr(connection.features, 'confirm'):
+            connection.features.confirm()
+        # Clear out anything left behind by an interrupted run
+        self._flush_db()
+        return True
+
     def _should_use_transaction_isolation(self, test, settings):
         """
         Determine if the given test supports transaction management for database
@@ -220,6 +888,11 @@ class NoseDjango(Plugin):
         """
         Clean up any changes to the test database.
         """
+        self._clean_up_test(test)
+        if self.durations is not None:
+            self.durations.stop_test(test.id())
+
+    def _clean_up_test(self, test):
         # Restore transaction support on tests
         from django.conf import settings
         from django.db import connection, transaction
@@ -228,13 +901,39 @@ class NoseDjango(Plugin):
         use_transaction_isolation = self._should_use_transaction_isolation(
             test, settings)
 
+        if self.query_stats is not None:
+            self.query_stats.stop_test()
+        if self.impact is not None:
+            self.impact.stop_test()
+
+        read_only = self.read_only_tracker is not None and \
+            not self.read_only_tracker.wrote
+        if self.other_connections:
+            self._clean_up_other_dbs(use_transaction_isolation, read_only)
+
+        if read_only:
+            self._finish_read_only_test(test, use_transaction_isolation)
+            return
+
+        if self._should_rebuild_schema(test) and \
+           self._pristine_table_ddl is not None:
+            if use_transaction_isolation:
+                self.restore_transaction_support(transaction)
+                transaction.rollback()
+                if transaction.is_managed():
+                    transaction.leave_transaction_management()
+            self._restore_schema(connection)
+            self._loaded_test_fixtures = []
+            return
+
         if self._should_rebuild_schema(test):
-            connection.creation.destroy_test_db(
-                self.old_db, verbosity=self.verbosity)
+            with self._timed('destroy_test_db'):
+                connection.creation.destroy_test_db(
+                    self.old_db, verbosity=self.verbosity)
             teardown_test_environment()
 
             setup_test_environment()
-            connection.creation.create_test_db(verbosity=self.verbosity)
+            self._create_test_db(connection)
             self.restore_transaction_support(transaction)
             transaction.commit()
             if transaction.is_managed():
@@ -242,39 +941,388 @@ class NoseDjango(Plugin):
             # If connection is not closed Postgres can go wild with
             # character encodings.
             connection.close()
-            logger.debug("Running syncdb")
-            self._num_syncdb_calls += 1
             self._loaded_test_fixtures = []
             return
 
         if use_transaction_isolation:
             self.restore_transaction_support(transaction)
             logger.debug("Rolling back")
-            transaction.rollback()
-            if transaction.is_managed():
-                transaction.leave_transaction_management()
-            # If connection is not closed Postgres can go wild with
-            # character encodings.
-            connection.close()
+            if self.fixture_layers is not None and self.fixture_layers.is_open:
+                self._roll_back_test_in_fixture_layers()
+            else:
+                with self._timed('transaction_rollback'):
+                    transaction.rollback()
+                    if transaction.is_managed():
+                        transaction.leave_transaction_management()
+                self._reset_connection(connection)
+                if self.dirty_tables is not None:
+                    # Anything written during the test was rolled back
+                    self.dirty_tables.set_state(self._dirty_tables_before_test)
         else:
             # Have to clear the db even if we're using django because django
             # doesn't properly flush the database after a test. It relies on
             # flushing before a test, so we want to avoid the case where a django
             # test doesn't flush and then a normal test runs, because it will
             # expect the db to already be flushed
-            self._flush_db()
+            self._clear_db()
             self._loaded_test_fixtures = []
 
 
         self.call_plugins_method('afterRollback', settings)
 
+    def _clean_up_other_dbs(self, use_transaction_isolation, read_only):
+        """
+        Roll back, or flush, whatever the test did to the databases of the
+        other aliases. Their fixtures are committed, so they survive the
+        rollback.
+        """
+        from django.db import transaction
+
+        if use_transaction_isolation:
+            self.restore_transaction_support(transaction)
+            with self._timed('transaction_rollback'):
+                for other in self.other_connections:
+                    if read_only:
+                        transaction.set_clean(using=other.alias)
+                    else:
+                        transaction.rollback(using=other.alias)
+                    if transaction.is_managed(using=other.alias):
+                        transaction.leave_transaction_management(
+                            using=other.alias)
+        elif not read_only:
+            self._flush_other_dbs()
+
+    def _flush_other_dbs(self):
+        from django.core.management import call_command
+
+        logger.debug(
+            "Flushing the databases of: %s",
+            [other.alias for other in self.other_test_dbs])
+        with self._timed('flush_other_dbs'):
+            for other in self.other_test_dbs:
+                call_command(
+                    'flush', verbosity=0, interactive=False,
+                    database=other.alias)
+        self._num_other_db_flushes += 1
+        self._other_db_fixtures = []
+
+    def _load_other_db_fixtures(self, test, use_transaction_isolation):
+        """
+        Like django's ``TestCase``, load the fixtures of ``multi_db`` tests in
+        to every database. The other databases of other tests are left with
+        no fixtures.
+        """
+        from django.db import transaction
+
+        if not isinstance(test, nose.case.Test) or \
+           not hasattr(test.context, 'fixtures'):
+            # Like the default database, it gets whatever's already loaded
+            return
+        if getattr(test.context, 'multi_db', False):
+            fixtures = sorted(test.context.fixtures)
+        else:
+            fixtures = []
+        if fixtures == self._other_db_fixtures:
+            return
+
+        if use_transaction_isolation:
+            self.restore_transaction_support(transaction)
+        self._flush_other_dbs()
+        for other in self.other_test_dbs:
+            if fixtures:
+                logger.debug(
+                    "Loading fixtures in to %s: %s", other.alias, fixtures)
+                self._load_fixtures(
+                    test.context.fixtures, use_transaction_isolation,
+                    using=other.alias)
+            if use_transaction_isolation:
+                transaction.commit(using=other.alias)
+        if use_transaction_isolation:
+            self.disable_transaction_support(transaction)
+        if fixtures:
+            self._num_fixture_loads += 1
+        self._other_db_fixtures = fixtures
+
+    def _finish_read_only_test(self, test, use_transaction_isolation):
+        """
+        The test didn't change the database, so there's nothing to roll back,
+        clear or rebuild. The transaction is left open for the next test, and
+        the fixtures stay loaded.
+        """
+        from django.conf import settings
+        from django.db import connection, transaction
+
+        logger.debug("Only read from the db, leaving it as it is")
+        self._num_read_only_tests += 1
+        if use_transaction_isolation:
+            self.restore_transaction_support(transaction)
+            transaction.set_clean()
+            if transaction.is_managed():
+                transaction.leave_transaction_management()
+        if self._keep_test_db and self._should_rebuild_schema(test):
+            from nosedjango.schema import write_fingerprint
+            write_fingerprint(connection, self._models_fingerprint)
+        self.call_plugins_method('afterRollback', settings)
+
+    def _roll_back_test_in_fixture_layers(self):
+        """
+        Roll back to the savepoint taken after loading the test's fixture
+        layers, keeping the layers, and the connection they're in, open for
+        the next test.
+        """
+        from django.db import DatabaseError, transaction
+
+        with self._timed('transaction_rollback'):
+            try:
+                self.fixture_layers.stop_test()
+                lost_transaction = False
+            except DatabaseError:
+                lost_transaction = True
+            transaction.set_clean()
+            if transaction.is_managed():
+                transaction.leave_transaction_management()
+
+        if lost_transaction:
+            self._recover_lost_layers()
+        elif self.dirty_tables is not None:
+            # Anything written during the test was rolled back
+            self.dirty_tables.set_state(self._dirty_tables_before_test)
+
+    def _reset_connection(self, connection):
+        if self.session_tracker is not None:
+            from nosedjango.sessions import reset_session
+
+            with self._timed('reset_session'):
+                reset = reset_session(connection, self.session_tracker)
+            if reset:
+                self._num_session_resets += 1
+                return
+            logger.debug("Can't reset the db session, closing the connection")
+            self.session_tracker.reset()
+        # If connection is not closed Postgres can go wild with
+        # character encodings.
+        connection.close()
+
+    def _recover_lost_layers(self):
+        """
+        Something committed the transaction the layers were in, eg. class
+        level set up, so whatever was written in it is there to stay.
+        """
+        logger.warning("The fixture layers were committed, flushing")
+        self.fixture_layers.abandon()
+        self._flush_db()
+        self._loaded_test_fixtures = []
+        self._committed_fixture_layers = []
+
+    def _get_test_data_class(self, test):
+        if not isinstance(test, nose.case.Test) or \
+           not isclass(test.context):
+            return None
+        if not callable(getattr(test.context, 'setup_test_data', None)):
+            return None
+        return test.context
+
+    def _drop_unwanted_layers(self, use_layers, test_data_name):
+        """
+        Roll back what the next test doesn't want: test data other than
+        ``test_data_name``'s and, unless the test's fixtures are loaded in
+        layers, the transaction the test data is in.
+        """
+        from django.db import DatabaseError
+
+        layers = self.fixture_layers
+        if layers is None or not layers.is_open:
+            return
+        try:
+            if self.use_fixture_layers and use_layers:
+                if layers.test_data_name != test_data_name:
+                    self._roll_back_test_data()
+            elif not use_layers or layers.test_data_name != test_data_name:
+                self._drop_fixture_layers()
+        except DatabaseError:
+            self._recover_lost_layers()
+
+    def _set_up_test_data(self, test_class, test_data_name):
+        """
+        Call the ``setup_test_data`` classmethod of ``test_class``, in a
+        savepoint that the class's tests roll back to, unless it's already
+        been called.
+        """
+        layers = self.fixture_layers
+        if layers.test_data_name == test_data_name:
+            return
+        if not layers.is_open:
+            layers.begin(self._get_dirty_tables_state())
+        layers.push_test_data(test_data_name, self._get_dirty_tables_state())
+        logger.debug("Setting up test data: %s", test_data_name)
+        try:
+            with self._timed('setup_test_data'):
+                test_class.setup_test_data()
+        except:
+            self._roll_back_test_data()
+            raise
+        self._num_test_data_setups += 1
+
+    def _roll_back_test_data(self):
+        if self.fixture_layers.test_data_name is None:
+            return
+        logger.debug(
+            "Rolling back test data: %s", self.fixture_layers.test_data_name)
+        with self._timed('rollback_test_data'):
+            state = self.fixture_layers.pop_test_data()
+        self._set_dirty_tables_state(state)
+
+    def _load_fixture_layers(self, test):
+        """
+        Get the fixtures of a transaction isolated test loaded as layers on
+        top of the committed fixtures, only rolling back the layers it
+        doesn't share with the previous test. The layers both tests share are
+        committed, so that they outlive the transaction.
+        """
+        from django.db import DatabaseError, transaction
+        from nosedjango.fixture_layers import get_common_prefix
+
+        layers = self.fixture_layers
+        if isinstance(test, nose.case.Test) and \
+           hasattr(test.context, 'fixtures'):
+            fixtures = list(test.context.fixtures)
+        else:
+            # Like without layers, the test gets whatever's already loaded
+            fixtures = None
+
+        if fixtures is not None:
+            if sorted(self._committed_fixture_layers) != \
+               self._loaded_test_fixtures:
+                # Fixtures were committed without layers since, in an order
+                # we don't know, but any order will do
+                self._committed_fixture_layers = list(
+                    self._loaded_test_fixtures)
+            committed = self._committed_fixture_layers
+            loaded = committed + layers.fixtures
+            common = get_common_prefix(fixtures, loaded)
+
+            clear_db = len(common) < len(committed)
+            if not clear_db and fixtures != loaded:
+                try:
+                    self._truncate_fixture_layers(len(common) - len(committed))
+                    if len(common) > len(committed):
+                        with self._timed('commit_fixture_layers'):
+                            layers.commit()
+                        self._committed_fixture_layers = common
+                        self._loaded_test_fixtures = sorted(common)
+                except DatabaseError:
+                    # Something committed the transaction the layers were
+                    # in, eg. class level set up
+                    logger.warning(
+                        "The fixture layers were committed, flushing")
+                    layers.abandon()
+                    clear_db = True
+                    self._loaded_test_fixtures = None
+
+            if clear_db:
+                # Some of the committed fixtures aren't wanted
+                self._drop_fixture_layers()
+                self.restore_transaction_support(transaction)
+                if self._loaded_test_fixtures is None:
+                    # Don't know what's in the database
+                    self._flush_db()
+                else:
+                    self._clear_db()
+                transaction.commit()
+                self.disable_transaction_support(transaction)
+                self._loaded_test_fixtures = []
+                self._committed_fixture_layers = []
+
+            num_loaded = len(self._committed_fixture_layers) + \
+                len(layers.fixtures)
+            for fixture in fixtures[num_loaded:]:
+                if not layers.is_open:
+                    layers.begin(self._get_dirty_tables_state())
+                layers.push(fixture, self._get_dirty_tables_state())
+                logger.debug("Loading fixture layer: %s", fixture)
+                self._load_fixtures([fixture], True)
+                self._num_fixture_loads += 1
+
+        if not layers.is_open:
+            layers.begin(self._get_dirty_tables_state())
+
+    def _truncate_fixture_layers(self, num_layers):
+        if num_layers >= len(self.fixture_layers.fixtures):
+            return
+        logger.debug(
+            "Rolling back fixture layers: %s",
+            self.fixture_layers.fixtures[num_layers:])
+        with self._timed('rollback_fixture_layers'):
+            state = self.fixture_layers.truncate(num_layers)
+        self._num_fixture_layer_rollbacks += 1
+        self._set_dirty_tables_state(state)
+
+    def _drop_fixture_layers(self):
+        """
+        Roll back the transaction the fixture layers are in, leaving only the
+        committed fixtures.
+        """
+        if not self.fixture_layers.is_open:
+            return
+        if self.fixture_layers.fixtures:
+            logger.debug(
+                "Rolling back fixture layers: %s",
+                self.fixture_layers.fixtures)
+            self._num_fixture_layer_rollbacks += 1
+        with self._timed('rollback_fixture_layers'):
+            state = self.fixture_layers.rollback()
+        self._set_dirty_tables_state(state)
+
+    def _get_dirty_tables_state(self):
+        if self.dirty_tables is None:
+            return None
+        return self.dirty_tables.get_state()
+
+    def _set_dirty_tables_state(self, state):
+        if self.dirty_tables is not None and state is not None:
+            self.dirty_tables.set_state(state)
+
+    def _restore_schema(self, connection):
+        """
+        Put back the tables whose schema a ``rebuild_schema`` test changed,
+        then flush to get the database back to how it was created.
+        """
+        from nosedjango.schema import restore_table_ddl
+        from nosedjango.sessions import untracked
+
+        with self._timed('restore_schema'):
+            with untracked(self.session_tracker):
+                tables = restore_table_ddl(
+                    connection, self._pristine_table_ddl)
+        logger.debug("Re-created tables: %s", tables)
+        self._num_schema_restores += 1
+        # Anything derived from the old tables is gone
+        self._seeded_tables = None
+        self._flush_db()
+
+        if self._keep_test_db:
+            from nosedjango.schema import write_fingerprint
+            write_fingerprint(connection, self._models_fingerprint)
+
     def _flush_db(self):
+        from django.conf import settings
+        from django.db import connection
+
+        with self._timed('flush_db'):
+            if not self.call_plugins_handler(
+                'handleFlush', settings, connection):
+                self._call_flush_command()
+                self.call_plugins_method('afterFlush', settings, connection)
+
+        logger.debug("Flushing database")
+        self._num_flush_calls += 1
+        self._reset_dirty_tables()
+
+    def _call_flush_command(self):
         from django import VERSION as DJANGO_VERSION
         from django.conf import settings
         from django.core.management import call_command
 
-        call_command('flush', verbosity=0, interactive=False)
-
         # In Django <1.2 Depending on the order of certain post-syncdb
         # signals, ContentTypes can be removed accidentally. Manually delete and re-add all
         # and recreate ContentTypes if we're using the contenttypes app
@@ -283,44 +1331,68 @@ class NoseDjango(Plugin):
         if DJANGO_VERSION[0] <= 1 and DJANGO_VERSION[1] < 2 \
            and 'django.contrib.contenttypes' in settings.INSTALLED_APPS:
             # TODO: Only mysql actually needs this
-            from django.contrib.contenttypes.models import ContentType
-            from django.contrib.contenttypes.management import update_all_contenttypes
-            from django.db import models
-            from django.contrib.auth.management import create_permissions
-            from django.contrib.auth.models import Permission
-
-            ContentType.objects.all().delete()
-            ContentType.objects.clear_cache()
-            update_all_contenttypes(verbosity=0)
-
-            # Because of various ways of handling auto-increment, we need to
-            # make sure the new contenttypes start at 1
-            next_pk = 1
-            content_types = list(ContentType.objects.all().order_by('pk'))
-            ContentType.objects.all().delete()
-            for ct in content_types:
-                ct.pk = next_pk
-                ct.save()
-                next_pk += 1
-
-            # Because of the same problems with ContentTypes, we can get
-            # busted permissions
-            Permission.objects.all().delete()
-            for app in models.get_apps():
-                create_permissions(app=app, created_models=None, verbosity=0)
-
-            # Because of various ways of handling auto-increment, we need to
-            # make sure the new permissions start at 1
-            next_pk = 1
-            permissions = list(Permission.objects.all().order_by('pk'))
-            Permission.objects.all().delete()
-            for perm in permissions:
-                perm.pk = next_pk
-                perm.save()
-                next_pk += 1
+            self._flush_content_types()
+        else:
+            call_command('flush', verbosity=0, interactive=False)
 
-        logger.debug("Flushing database")
-        self._num_flush_calls += 1
+    def _flush_content_types(self):
+        """
+        The first flush sends ``post_syncdb`` and re-creates the content
+        types and permissions, which takes a few queries per model, and keeps
+        an image of the result. Later flushes put the image back instead.
+        """
+        from django.core.management import call_command
+        from django.db import connection, transaction
+        from nosedjango.content_types import ContentTypeImage
+        from nosedjango.content_types import resequence_content_types
+
+        if self._content_type_image is None:
+            call_command('flush', verbosity=0, interactive=False)
+            resequence_content_types()
+            self._content_type_image = ContentTypeImage.capture(connection)
+        else:
+            self._content_type_image.restore(connection)
+        transaction.commit_unless_managed()
+
+    def _reset_dirty_tables(self):
+        """
+        Called whenever the database is in a freshly flushed state.
+        """
+        if self.dirty_tables is None:
+            return
+        from django.db import connection
+        from nosedjango.dirty_tables import get_seeded_tables
+
+        if self._seeded_tables is None:
+            self._seeded_tables = get_seeded_tables(connection)
+        self.dirty_tables.reset()
+
+    def _clear_db(self):
+        """
+        Get the database back to the state a flush leaves it in. When dirty
+        tables are being tracked, only the tables written to since the last
+        flush need to be cleared.
+        """
+        tracker = self.dirty_tables
+        if tracker is None or tracker.unknown_writes or \
+           tracker.tables & self._seeded_tables:
+            # A flush re-creates the contents of the seeded tables, so
+            # clearing them isn't enough
+            self._flush_db()
+            return
+
+        from django.db import connection, transaction
+        from nosedjango.dirty_tables import sql_clear_tables
+
+        logger.debug("Clearing dirty tables: %s", sorted(tracker.tables))
+        if tracker.tables:
+            with self._timed('clear_dirty_tables'):
+                cursor = connection.cursor()
+                for sql in sql_clear_tables(connection, tracker.tables):
+                    cursor.execute(sql)
+                transaction.commit_unless_managed()
+        self._num_dirty_table_clears += 1
+        tracker.reset()
 
     def beforeTest(self, test):
         """
@@ -331,20 +1403,44 @@ class NoseDjango(Plugin):
             # short circuit if no settings file can be found
             return
 
+        if self.durations is not None:
+            self.durations.start_test()
+
         from django.contrib.sites.models import Site
         from django.contrib.contenttypes.models import ContentType
-        from django.core.management import call_command
         from django.core.urlresolvers import clear_url_caches
         from django.conf import settings
-        from django.db import transaction
+        from django.db import connection, transaction
 
         use_transaction_isolation = self._should_use_transaction_isolation(
             test, settings)
+        if self.timings is not None:
+            self.timings.current_test = test.id()
+
+        # Tests that don't roll back get a fresh copy of the test data
+        use_layers = use_transaction_isolation and \
+            not self._should_rebuild_schema(test)
+        test_data_class = self._get_test_data_class(test)
+        test_data_name = None
+        if use_layers and test_data_class is not None:
+            test_data_name = get_class_name(test_data_class)
+        self._drop_unwanted_layers(use_layers, test_data_name)
+
+        if self._keep_test_db and self._should_rebuild_schema(test):
+            # The test is about to alter the schema, so don't let a later run
+            # reuse the database if this run is interrupted
+            from nosedjango.schema import write_fingerprint
+            write_fingerprint(connection, None)
 
         if use_transaction_isolation:
             self.call_plugins_method('beforeTransactionManagement', settings, test)
-            transaction.enter_transaction_management()
-            transaction.managed(True)
+            with self._timed('transaction_enter'):
+                transaction.enter_transaction_management()
+                transaction.managed(True)
+                for other in self.other_connections:
+                    transaction.enter_transaction_management(
+                        using=other.alias)
+                    transaction.managed(True, using=other.alias)
             self.disable_transaction_support(transaction)
 
         Site.objects.clear_cache()
@@ -354,21 +1450,28 @@ class NoseDjango(Plugin):
             self.call_plugins_method('afterTransactionManagement', settings, test)
 
         self.call_plugins_method('beforeFixtureLoad', settings, test)
-        if isinstance(test, nose.case.Test):
+        use_fixture_layers = self.use_fixture_layers and use_layers
+        if use_fixture_layers:
+            self._load_fixture_layers(test)
+        if isinstance(test, nose.case.Test) and not use_fixture_layers:
             # Mirrors django.test.testcases:TestCase
 
             if hasattr(test.context, 'fixtures'):
                 # We have to use this slightly awkward syntax due to the fact
                 # that we're using *args and **kwargs together.
                 ordered_fixtures = sorted(test.context.fixtures)
-                if ordered_fixtures != self._loaded_test_fixtures:
+                if ordered_fixtures != self._loaded_test_fixtures and \
+                   self._restore_fixture_snapshot(
+                       ordered_fixtures, use_transaction_isolation):
+                    self._loaded_test_fixtures = ordered_fixtures
+                elif ordered_fixtures != self._loaded_test_fixtures:
                     # Only clear + load the fixtures if they're not already loaded
 
                     # Flush previous fixtures
                     if use_transaction_isolation:
                         self.restore_transaction_support(transaction)
 
-                    self._flush_db()
+                    self._clear_db()
 
                     if use_transaction_isolation:
                         transaction.commit()
@@ -376,35 +1479,135 @@ class NoseDjango(Plugin):
 
                     # Load the new fixtures
                     logger.debug("Loading fixtures: %s", test.context.fixtures)
+                    self._load_fixtures(
+                        test.context.fixtures, use_transaction_isolation)
                     if use_transaction_isolation:
-                        call_command(
-                            'loaddata',
-                            *test.context.fixtures,
-                            **{'verbosity': 0, 'commit': False}
-                        )
                         self.restore_transaction_support(transaction)
                         transaction.commit()
                         self.disable_transaction_support(transaction)
-                    else:
-                        call_command(
-                            'loaddata',
-                            *test.context.fixtures,
-                            **{'verbosity': 0}
-                        )
                     self._num_fixture_loads += 1
                     self._loaded_test_fixtures = ordered_fixtures
+                    if self.fixture_snapshots is not None:
+                        with self._timed('save_fixture_snapshot'):
+                            self.fixture_snapshots.save(ordered_fixtures)
+                        if self.dirty_tables is not None:
+                            self._fixture_dirty_tables[
+                                tuple(ordered_fixtures)] = (
+                                    self.dirty_tables.get_state())
+
+        if self.other_test_dbs:
+            self._load_other_db_fixtures(test, use_transaction_isolation)
+
+        if test_data_name is not None:
+            self._set_up_test_data(test_data_class, test_data_name)
+        if use_layers and self.fixture_layers.is_open:
+            self.fixture_layers.start_test()
+        if self.read_only_tracker is not None:
+            # Anything written from here on is the test's to clean up
+            self.read_only_tracker.reset()
+        if test_data_name is None and test_data_class is not None:
+            # Nothing to keep it in, so it's set up again for every test
+            with self._timed('setup_test_data'):
+                test_data_class.setup_test_data()
+            self._num_test_data_setups += 1
         self.call_plugins_method('afterFixtureLoad', settings, test)
 
+        if self.dirty_tables is not None:
+            self._dirty_tables_before_test = self.dirty_tables.get_state()
+
         self.call_plugins_method('beforeUrlConfLoad', settings, test)
         if isinstance(test, nose.case.Test) and \
            hasattr(test.context, 'urls'):
             # We have to use this slightly awkward syntax due to the fact
             # that we're using *args and **kwargs together.
-            self.old_urlconf = settings.ROOT_URLCONF
-            settings.ROOT_URLCONF = self.urls
-            clear_url_caches()
+            with self._timed('urlconf_swap'):
+                self.old_urlconf = settings.ROOT_URLCONF
+                settings.ROOT_URLCONF = self.urls
+                clear_url_caches()
         self.call_plugins_method('afterUrlConfLoad', settings, test)
 
+        if self.impact is not None:
+            from nosedjango.impact import get_test_module_name
+            self.impact.start_test(test.id(), get_test_module_name(test))
+            if isinstance(test, nose.case.Test) and \
+               hasattr(test.context, 'fixtures'):
+                self.impact.add_fixtures(test.context.fixtures)
+        if self.query_stats is not None:
+            self.query_stats.start_test(test.id())
+
+    def _load_fixtures(self, fixtures, use_transaction_isolation,
+                       using=None):
+        with self._timed('loaddata'):
+            self._call_loaddata(fixtures, use_transaction_isolation, using)
+
+    def _call_loaddata(self, fixtures, use_transaction_isolation,
+                       using=None):
+        """
+        Load ``fixtures`` in to the database of the alias ``using``, or the
+        default one. Only django >= 1.2 knows about other aliases, so the
+        default one is never passed on.
+        """
+        from django.core.management import call_command
+        from django.db import transaction
+
+        using_kwargs = {}
+        options = {'verbosity': 0}
+        if using is not None:
+            using_kwargs['using'] = using
+            options['database'] = using
+
+        if self.bulk_fixtures:
+            from nosedjango.fixtures import load_fixtures
+            from nosedjango.sessions import untracked
+
+            with untracked(self.session_tracker):
+                load_fixtures(
+                    fixtures, compiled_dir=self.compiled_fixtures_dir,
+                    **using_kwargs)
+            if not use_transaction_isolation:
+                transaction.commit_unless_managed(**using_kwargs)
+        else:
+            if use_transaction_isolation:
+                options['commit'] = False
+            # We have to use this slightly awkward syntax due to the fact
+            # that we're using *args and **kwargs together.
+            call_command('loaddata', *fixtures, **options)
+
+    def _restore_fixture_snapshot(self, fixtures, use_transaction_isolation):
+        """
+        Try to replace the database contents with a snapshot taken after these
+        fixtures were last loaded. Returns ``False`` if there's no usable
+        snapshot.
+        """
+        if self.fixture_snapshots is None:
+            return False
+        from django.db import transaction
+
+        if use_transaction_isolation:
+            self.restore_transaction_support(transaction)
+
+        from nosedjango.sessions import untracked
+
+        with self._timed('restore_fixture_snapshot'):
+            with untracked(self.session_tracker):
+                restored = self.fixture_snapshots.restore(fixtures)
+        if restored:
+            logger.debug("Restored fixture snapshot: %s", fixtures)
+            self._num_snapshot_restores += 1
+            if tuple(fixtures) in self._fixture_dirty_tables:
+                # The database is exactly as it was after loading the
+                # fixtures, so only the fixtures' tables are dirty
+                self.dirty_tables.set_state(
+                    self._fixture_dirty_tables[tuple(fixtures)])
+            if use_transaction_isolation:
+                transaction.commit()
+            else:
+                transaction.commit_unless_managed()
+
+        if use_transaction_isolation:
+            self.disable_transaction_support(transaction)
+        return restored
+
     def finalize(self, result=None):
         """
         Clean up any created database and schema.
@@ -418,8 +1621,14 @@ class NoseDjango(Plugin):
         from django.conf import settings
         from django.core.urlresolvers import clear_url_caches
 
+        if self.timings is not None:
+            self.timings.current_test = None
+
+        if self.fixture_layers is not None:
+            self._drop_fixture_layers()
+
         self.call_plugins_method('beforeDestroyTestDb', settings, connection)
-        connection.creation.destroy_test_db(self.old_db, verbosity=self.verbosity)
+        self._destroy_test_dbs(connection)
         self.call_plugins_method('afterDestroyTestDb', settings, connection)
 
         self.call_plugins_method(
@@ -427,14 +1636,241 @@ class NoseDjango(Plugin):
         teardown_test_environment()
         self.call_plugins_method('afterTeardownTestEnv', settings)
 
+        if self.timings_json:
+            # Written here rather than in report() so that tearing down the
+            # test database is included
+            self.timings.write_json(self.timings_json, self.timings_top)
+        if self.query_stats_json:
+            self.query_stats.write_json(self.query_stats_json)
+        if self.impact is not None:
+            self.impact.stop_recording_imports()
+            self.impact.save(self.impact_map_path)
+        if self.durations is not None:
+            self.durations.save()
+
         if hasattr(self, 'old_urlconf'):
             settings.ROOT_URLCONF = self.old_urlconf
             clear_url_caches()
 
+    def beforeImport(self, filename, module):
+        if self.impact is not None:
+            self.impact.before_import()
+
+    def afterImport(self, filename, module):
+        if self.impact is not None:
+            self.impact.after_import(module)
+
+    def wantMethod(self, method):
+        """
+        Leave out ``setup_test_data``, which nose would otherwise take for a
+        test, and test methods that the impact map says can't be affected by
+        the changed files.
+        """
+        if getattr(method, '__name__', None) == 'setup_test_data':
+            return False
+        if self.impact_selector is None:
+            return None
+        cls = getattr(method, 'im_class', None)
+        if cls is None:
+            return None
+        test_id = '%s.%s.%s' % (cls.__module__, cls.__name__, method.__name__)
+        if not self.impact_selector.is_affected(test_id):
+            return False
+        return None
+
+    def wantFunction(self, function):
+        if self.impact_selector is None:
+            return None
+        test_id = '%s.%s' % (function.__module__, function.__name__)
+        if not self.impact_selector.is_affected(test_id):
+            return False
+        return None
+
+    def startContext(self, context):
+        if self.durations is not None and isclass(context):
+            self.durations.start_class(get_class_name(context))
+
+    def stopContext(self, context):
+        if self.durations is not None and isclass(context):
+            self.durations.stop_class(get_class_name(context))
+        if self.fixture_layers is not None and isclass(context) and \
+           self.fixture_layers.test_data_name == get_class_name(context):
+            # Done with the class's test data
+            self._drop_unwanted_layers(True, None)
+
+    def prepareTest(self, test):
+        """
+        When fixture grouping is enabled, reorder the suite so that all test
+        classes that share a fixture group run consecutively. When running
+        the longest tests first, order the test classes (or fixture groups)
+        by how long they took last time.
+        """
+        if not self.settings_path or \
+           not (self.fixture_grouping or self.longest_first):
+            return None
+
+        return LazySuite(self._regroup(test))
+
+    def _regroup(self, suite):
+        """
+        The tests of ``suite``, with its test classes sorted in to fixture
+        groups and the groups put in order.
+        """
+        groups = {}
+        group_order = []
+        remaining = self._collect_fixture_groups(suite, groups, group_order)
+        if remaining:
+            groups[id(remaining)] = remaining
+            group_order.append(id(remaining))
+
+        if self.longest_first:
+            estimates = {}
+            for key in group_order:
+                test_ids = []
+                class_names = []
+                for test in groups[key]:
+                    if isinstance(test, unittest.TestSuite):
+                        self._collect_test_names(test, test_ids, class_names)
+                    else:
+                        test_ids.append(test.id())
+                estimates[key] = self.durations.estimate(
+                    test_ids, class_names)
+            group_order.sort(key=lambda key: estimates[key], reverse=True)
+
+        ordered_tests = []
+        for key in group_order:
+            ordered_tests.extend(groups[key])
+        logger.debug(
+            "Grouped the tests of %s in to %s fixture groups",
+            getattr(suite, 'context', None), len(group_order))
+        return ordered_tests
+
+    def _collect_test_names(self, suite, test_ids, class_names):
+        """
+        Add the ids of all of the tests in ``suite``, and the names of the
+        test classes, to ``test_ids`` and ``class_names``.
+        """
+        tests = list(suite)
+        if isinstance(suite, LazySuite):
+            # Iterating a lazy suite uses it up
+            suite._tests = tests
+        if isinstance(suite, ContextSuite) and isclass(suite.context):
+            class_names.append(get_class_name(suite.context))
+        for test in tests:
+            if isinstance(test, unittest.TestSuite):
+                self._collect_test_names(test, test_ids, class_names)
+            else:
+                test_ids.append(test.id())
+
+    def _collect_fixture_groups(self, suite, groups, group_order):
+        """
+        Walk the suite and sort its test classes in to ``groups``, keyed by
+        their fixture group. Returns the tests directly in ``suite`` that
+        aren't part of a class. Those of nested suites stay in their suite,
+        which is then grouped as a unit.
+
+        A module or package with setup or teardown functions is kept whole,
+        and only has the classes inside it regrouped. nose tears it down at
+        the end of whichever suite set it up, so a class taken out of it
+        would tear it down before the module's other classes had run.
+        """
+        remaining = []
+        for test in suite:
+            if isinstance(test, ContextSuite) and isclass(test.context):
+                self._add_to_fixture_group(test, groups, group_order)
+            elif isinstance(test, ContextSuite) and \
+                 test.context is not None and \
+                 test.implementsAnyFixture(test.context, None):
+                test._tests = self._regroup(test)
+                self._add_to_fixture_group(
+                    test, groups, group_order, key=id(test))
+            elif isinstance(test, unittest.TestSuite):
+                nested = self._collect_fixture_groups(
+                    test, groups, group_order)
+                if nested:
+                    # The suite has already been iterated, so give it back
+                    # the tests that weren't pulled out in to their own
+                    # groups
+                    test._tests = nested
+                    self._add_to_fixture_group(test, groups, group_order)
+            else:
+                remaining.append(test)
+        return remaining
+
+    def _add_to_fixture_group(self, test, groups, group_order, key=None):
+        if key is None and self.fixture_grouping:
+            key = self._fixture_group_key(test)
+        elif key is None:
+            # Only scheduling, so every class is on its own
+            key = id(test)
+        if key not in groups:
+            groups[key] = []
+            group_order.append(key)
+        groups[key].append(test)
+
+    def _fixture_group_key(self, test):
+        """
+        Tests can only share loaded fixtures if they use the same fixtures and
+        also agree on transaction isolation and schema rebuilding.
+        """
+        from django.conf import settings
+
+        if getattr(test, 'context', None) is None:
+            return (None, True, False)
+
+        fixtures = getattr(test.context, 'fixtures', None)
+        if fixtures is not None:
+            fixtures = tuple(sorted(fixtures))
+        return (
+            fixtures,
+            self._should_use_transaction_isolation(test, settings),
+            self._should_rebuild_schema(test),
+        )
+
     def report(self, stream):
         stream.writeln("Loaded fixtures %s times" % self._num_fixture_loads)
         stream.writeln("Flushed the db %s times" % self._num_flush_calls)
         stream.writeln("Sync'd the db %s times" % self._num_syncdb_calls)
+        if self._reused_test_db:
+            stream.writeln("Reused the test db from a previous run")
+        if self.other_test_dbs:
+            stream.writeln(
+                "Flushed the other dbs %s times" % self._num_other_db_flushes)
+        if self.dirty_tables is not None:
+            stream.writeln(
+                "Cleared only dirty tables %s times" % (
+                    self._num_dirty_table_clears))
+        if self._pristine_table_ddl is not None:
+            stream.writeln(
+                "Restored the schema %s times" % self._num_schema_restores)
+        if self.schema_cache is not None:
+            stream.writeln(
+                "Created the db from the schema cache %s times" % (
+                    self._num_schema_replays))
+        if self.fixture_snapshots is not None:
+            stream.writeln(
+                "Restored fixture snapshots %s times" % (
+                    self._num_snapshot_restores))
+        if self.read_only_tracker is not None:
+            stream.writeln(
+                "Left the db as it was after %s read-only tests" % (
+                    self._num_read_only_tests))
+        if self.session_tracker is not None:
+            stream.writeln(
+                "Reset the db session instead of reconnecting %s times" % (
+                    self._num_session_resets))
+        if self.use_fixture_layers:
+            stream.writeln(
+                "Rolled back fixture layers %s times" % (
+                    self._num_fixture_layer_rollbacks))
+        if self._num_test_data_setups:
+            stream.writeln(
+                "Set up class test data %s times" % (
+                    self._num_test_data_setups))
+        if self.timings is not None:
+            self.timings.write_report(stream, self.timings_top)
+        if self.query_stats is not None:
+            self.query_stats.write_report(stream, self.query_stats_top)
 
     def _monkeypatch_test_classes(self):
         # Monkeypatching. Like a boss.
@@ -49,9 +49,24 @@ class IPluginInterface(object):
     def beforeTestDb(self, settings, connection, management):
         pass
 
+    def handleCreateTestDb(self, settings, connection):
+        """
+        Return True if the plugin has created the test database, and switched
+        the connection over to it, itself, so that no syncdb is needed.
+        """
+        pass
+
     def afterTestDb(self, settings, connection):
         pass
 
+    def afterTakeOver(self, settings, connection):
+        """
+        Called in a ``--django-warm-workers`` worker instead of the setup
+        hooks above, which only ran in the process it was forked from. Set up
+        anything that each process needs its own of again here.
+        """
+        pass
+
     def beforeTransactionManagement(self, settings, test):
         pass
 
@@ -64,6 +79,16 @@ class IPluginInterface(object):
     def afterFixtureLoad(self, settings, test):
         pass
 
+    def handleFlush(self, settings, connection):
+        """
+        Return True if the plugin has put the database back in to a freshly
+        flushed state itself, so that no flush is needed.
+        """
+        pass
+
+    def afterFlush(self, settings, connection):
+        pass
+
     def beforeUrlConfLoad(self, settings, test):
         pass
 
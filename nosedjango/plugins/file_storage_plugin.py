@@ -19,6 +19,17 @@ class FileStoragePlugin(Plugin):
         the storage system.
         """
         settings.DEFAULT_FILE_STORAGE = 'django.core.files.storage.FileSystemStorage'
+        self.use_test_media(settings)
+
+    def afterTakeOver(self, settings, connection):
+        """
+        A warm worker inherited the storage location of the process it was
+        forked from, which the other workers would empty after their tests.
+        """
+        self._unique_token = None
+        self.use_test_media(settings)
+
+    def use_test_media(self, settings):
         from django.core.files.storage import default_storage
 
         token = self.get_unique_token()
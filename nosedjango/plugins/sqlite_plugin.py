@@ -1,5 +1,100 @@
+import os
+import tempfile
+import threading
+import time
+
 from nosedjango.plugins.base_plugin import Plugin
 
+# How long a statement keeps being retried while another thread's connection
+# to the shared in-memory database has it locked out
+SHARED_CACHE_TIMEOUT = 5.0
+
+# Statements on the shared in-memory database run one at a time, whichever
+# thread they come from
+shared_cache_lock = threading.RLock()
+
+# Run on every connection to a test database file. Nothing needs to survive
+# a crash, but rollbacks have to keep working, so the journal is kept in
+# memory rather than turned off.
+FILE_DB_PRAGMAS = (
+    'PRAGMA journal_mode = MEMORY',
+    'PRAGMA synchronous = OFF',
+    # In KiB when negative, ie. 64MB
+    'PRAGMA cache_size = -65536',
+    'PRAGMA temp_store = MEMORY',
+)
+
+def get_default_file_dir():
+    """
+    Somewhere in memory for test database files, if there's a tmpfs.
+    """
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+def locked(method):
+    """
+    Run ``method`` holding ``shared_cache_lock``. SQLite doesn't wait for
+    table locks held by other connections to a shared cache, it fails
+    straight away, so keep trying until ``SHARED_CACHE_TIMEOUT``.
+    """
+    from django.db.backends.sqlite3.base import Database
+    from django.db.utils import DatabaseError
+
+    def locked_method(self, *args, **kwargs):
+        deadline = time.time() + SHARED_CACHE_TIMEOUT
+        while True:
+            shared_cache_lock.acquire()
+            try:
+                try:
+                    return method(self, *args, **kwargs)
+                except (Database.DatabaseError, DatabaseError) as e:
+                    if 'locked' not in str(e) or time.time() > deadline:
+                        raise
+            finally:
+                shared_cache_lock.release()
+            time.sleep(0.01)
+    return locked_method
+
+_shared_cache_connection_class = None
+
+def get_shared_cache_connection_class():
+    """
+    A sqlite connection class, for the ``factory`` connection option, whose
+    cursors run their statements through ``locked``.
+    """
+    global _shared_cache_connection_class
+    if _shared_cache_connection_class is not None:
+        return _shared_cache_connection_class
+
+    from django.db.backends.sqlite3.base import Database
+
+    cursor_classes = {}
+
+    class SharedCacheConnection(Database.Connection):
+        def __init__(self, *args, **kwargs):
+            Database.Connection.__init__(self, *args, **kwargs)
+            # Read without waiting for the table locks of other threads'
+            # transactions, seeing what they haven't committed yet. This lets
+            # a live server see the fixtures loaded in a test's transaction.
+            self.execute('PRAGMA read_uncommitted = 1')
+
+        def cursor(self, factory=Database.Cursor):
+            if factory not in cursor_classes:
+                cursor_classes[factory] = type(
+                    'Locked%s' % factory.__name__, (factory,), {
+                        'execute': locked(factory.execute),
+                        'executemany': locked(factory.executemany),
+                    })
+            return Database.Connection.cursor(
+                self, factory=cursor_classes[factory])
+
+        commit = locked(Database.Connection.commit)
+        rollback = locked(Database.Connection.rollback)
+
+    _shared_cache_connection_class = SharedCacheConnection
+    return _shared_cache_connection_class
+
 class SqlitePlugin(Plugin):
     """
     Modify django database settings to use an in-memory sqlite instance for
@@ -7,16 +102,182 @@ class SqlitePlugin(Plugin):
     """
     name = 'django-sqlite'
 
+    def __init__(self, *args, **kwargs):
+        super(SqlitePlugin, self).__init__(*args, **kwargs)
+
+        self.keep_pristine_copy = False
+        self._pristine_copy = None
+        self.shared_cache = False
+        self._shared_cache_connection = None
+        self.file_dir = None
+        self._test_db_file = None
+
+    def options(self, parser, env=None):
+        if env is None:
+            env = os.environ
+        parser.add_option(
+            '--django-sqlite-pristine-copy',
+            dest='sqlite_pristine_copy',
+            action='store_true',
+            default=False,
+            help='Keep a copy of the freshly flushed in-memory database and '
+                 'restore it instead of flushing.')
+        parser.add_option(
+            '--django-sqlite-shared-cache',
+            dest='sqlite_shared_cache',
+            action='store_true',
+            default=False,
+            help='Use a named, shared-cache in-memory database that every '
+                 'thread can open, eg. a live server\'s, instead of one '
+                 'private to the test thread\'s connection.')
+        parser.add_option(
+            '--django-sqlite-file',
+            dest='sqlite_file',
+            action='store_true',
+            default=False,
+            help='Use a database file per process, tuned for speed over '
+                 'durability, instead of an in-memory database.')
+        parser.add_option(
+            '--django-sqlite-file-dir',
+            dest='sqlite_file_dir',
+            metavar='DIR',
+            help='Where to put --django-sqlite-file databases. Default: '
+                 '/dev/shm if it exists, otherwise the temp directory.')
+
+        super(SqlitePlugin, self).options(parser, env)
+
+    def configure(self, options, config):
+        self.keep_pristine_copy = options.sqlite_pristine_copy
+        self.shared_cache = options.sqlite_shared_cache
+        if options.sqlite_file or options.sqlite_file_dir:
+            self.file_dir = options.sqlite_file_dir or get_default_file_dir()
+
+        super(SqlitePlugin, self).configure(options, config)
+
     def beforeConnectionSetup(self, settings):
+        test_name = None
+        options = {}
+        if self.shared_cache:
+            # Named after the process so that multiprocess workers don't
+            # share
+            test_name = 'file:nosedjango-%s?mode=memory&cache=shared' % (
+                os.getpid())
+            options['factory'] = get_shared_cache_connection_class()
+        elif self.file_dir is not None:
+            test_name = self._set_up_test_db_file()
         if hasattr(settings, 'DATABASES'):
             settings.DATABASES['default']['ENGINE'] = 'django.db.backends.sqlite3'
             settings.DATABASES['default']['NAME'] = '' # in-memory database
-            settings.DATABASES['default']['OPTIONS'] = {}
+            settings.DATABASES['default']['TEST_NAME'] = test_name
+            settings.DATABASES['default']['OPTIONS'] = options
             settings.DATABASES['default']['USER'] = ''
             settings.DATABASES['default']['PASSWORD'] = ''
         else:
             settings.DATABASE_ENGINE = 'sqlite3'
             settings.DATABASE_NAME = ''
-            settings.DATABASE_OPTIONS = {}
+            settings.TEST_DATABASE_NAME = test_name
+            settings.DATABASE_OPTIONS = options
             settings.DATABASE_USER = ''
             settings.DATABASE_PASSWORD = ''
+
+    def _set_up_test_db_file(self):
+        from django.db.backends.signals import connection_created
+
+        if not os.path.isdir(self.file_dir):
+            os.makedirs(self.file_dir)
+        self._test_db_file = os.path.join(
+            self.file_dir, 'nosedjango-%s.db' % self.get_unique_token())
+        connection_created.connect(self._tune_connection)
+
+        from nosedjango.plugins.worker_db_plugin import is_worker_process
+        if is_worker_process():
+            # nose never calls finalize() in its workers, which is when
+            # django would remove the file
+            from multiprocessing.util import Finalize
+            Finalize(None, self._remove_test_db_file, exitpriority=10)
+        return self._test_db_file
+
+    def _tune_connection(self, sender, connection, **kwargs):
+        # Warm workers use copies of the file, named after it
+        if not connection.settings_dict['NAME'].startswith(
+            self._test_db_file):
+            return
+        cursor = connection.connection.cursor()
+        for pragma in FILE_DB_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+
+    def _remove_test_db_file(self):
+        if os.path.exists(self._test_db_file):
+            os.remove(self._test_db_file)
+
+    def beforeTestDb(self, settings, connection, management):
+        if self.shared_cache:
+            self._keep_shared_cache_db(connection)
+
+    def _keep_shared_cache_db(self, connection):
+        """
+        A shared-cache in-memory database goes away when the last connection
+        to it is closed, and django would try to delete it as a file. Hold a
+        connection open from creating the test database until destroying it
+        instead.
+        """
+        from django.db.backends.sqlite3.base import Database
+
+        creation = connection.creation
+
+        def create_test_db(verbosity, autoclobber):
+            test_database_name = creation._get_test_db_name()
+            self._shared_cache_connection = Database.connect(
+                test_database_name)
+            if os.path.exists(test_database_name):
+                # SQLite opened the URI as a file name
+                self._shared_cache_connection.close()
+                os.remove(test_database_name)
+                raise RuntimeError(
+                    "--django-sqlite-shared-cache needs SQLite to be built "
+                    "with URI file name support")
+            return test_database_name
+
+        def destroy_test_db(test_database_name, verbosity):
+            if self._shared_cache_connection is not None:
+                self._shared_cache_connection.close()
+                self._shared_cache_connection = None
+
+        creation._create_test_db = create_test_db
+        creation._destroy_test_db = destroy_test_db
+
+    def afterTestDb(self, settings, connection):
+        if self.keep_pristine_copy:
+            self._take_pristine_copy(connection)
+
+    def handleFlush(self, settings, connection):
+        """
+        Copy the pristine tables back over the top of the test database
+        instead of running a flush.
+        """
+        if self._pristine_copy is None or \
+           not self._pristine_copy.has_snapshot('pristine'):
+            # No copy yet, or the database has been re-created since
+            return False
+
+        from django.db import transaction
+
+        self._pristine_copy.restore('pristine')
+        transaction.commit_unless_managed()
+        return True
+
+    def afterFlush(self, settings, connection):
+        if self.keep_pristine_copy:
+            self._take_pristine_copy(connection)
+
+    def _take_pristine_copy(self, connection):
+        from nosedjango.snapshots import SqliteSnapshotStore
+        from nosedjango.snapshots import is_sqlite_memory_db
+
+        if not is_sqlite_memory_db(connection):
+            return
+        if self._pristine_copy is None:
+            self._pristine_copy = SqliteSnapshotStore(
+                connection, schema='nosedjango_pristine')
+        self._pristine_copy.take('pristine')
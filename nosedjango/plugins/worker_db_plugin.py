@@ -0,0 +1,155 @@
+from nosedjango.plugins.base_plugin import Plugin
+
+def is_worker_process():
+    """
+    Whether we're running in one of nose's multiprocess workers.
+    """
+    try:
+        import multiprocessing
+    except ImportError:
+        return False
+    return multiprocessing.current_process().name != 'MainProcess'
+
+def is_memory_sqlite_db(engine, test_name):
+    """
+    Whether the test database is an in-memory sqlite one, which each process
+    already has to itself.
+    """
+    return 'sqlite3' in engine and not test_name
+
+def clone_postgresql_database(connection, template_name, database_name):
+    qn = connection.ops.quote_name
+    cursor = connection.cursor()
+    # CREATE/DROP DATABASE can't run inside a transaction
+    connection.creation.set_autocommit()
+    cursor.execute('DROP DATABASE IF EXISTS %s' % qn(database_name))
+    cursor.execute('CREATE DATABASE %s TEMPLATE %s' % (
+        qn(database_name), qn(template_name)))
+
+def clone_mysql_database(connection, template_name, database_name):
+    """
+    MySQL has no template databases, so copy the tables' DDL and rows across
+    on the server, which is much faster than a syncdb.
+    """
+    qn = connection.ops.quote_name
+    cursor = connection.cursor()
+    cursor.execute('DROP DATABASE IF EXISTS %s' % qn(database_name))
+    cursor.execute('CREATE DATABASE %s %s' % (
+        qn(database_name), connection.creation.sql_table_creation_suffix()))
+
+    cursor.execute('USE %s' % qn(template_name))
+    cursor.execute("SHOW FULL TABLES WHERE Table_type = 'BASE TABLE'")
+    tables = [row[0] for row in cursor.fetchall()]
+    create_statements = []
+    for table in tables:
+        cursor.execute('SHOW CREATE TABLE %s' % qn(table))
+        create_statements.append(cursor.fetchone()[1])
+
+    cursor.execute('USE %s' % qn(database_name))
+    cursor.execute('SET FOREIGN_KEY_CHECKS = 0')
+    for sql in create_statements:
+        cursor.execute(sql)
+    for table in tables:
+        cursor.execute('INSERT INTO %s SELECT * FROM %s.%s' % (
+            qn(table), qn(template_name), qn(table)))
+    cursor.execute('SET FOREIGN_KEY_CHECKS = 1')
+    connection._commit()
+
+CLONE_FUNCTIONS = {
+    'postgresql': clone_postgresql_database,
+    'mysql': clone_mysql_database,
+}
+
+class WorkerDatabasePlugin(Plugin):
+    """
+    Give every ``--processes`` worker its own PostgreSQL or MySQL test
+    database, so that workers don't trample over each other's data.
+
+    The main nose process creates the test database as usual, and each worker
+    then clones that as a template instead of running syncdb itself.
+    """
+    name = 'django-worker-db'
+
+    def __init__(self, *args, **kwargs):
+        super(WorkerDatabasePlugin, self).__init__(*args, **kwargs)
+
+        self.template_name = None
+        self._database_name = None
+        self._test_database_name = None
+        self._cleanup_registered = False
+
+    def beforeConnectionSetup(self, settings):
+        if not is_worker_process():
+            return
+        # The main process has already created the test database under the
+        # usual name
+        if hasattr(settings, 'DATABASES'):
+            database = settings.DATABASES['default']
+            if not is_memory_sqlite_db(
+                database['ENGINE'], database.get('TEST_NAME')):
+                self._database_name = database['NAME']
+                self.template_name = database.get('TEST_NAME') or \
+                    'test_' + database['NAME']
+                database['TEST_NAME'] = self._test_database_name = \
+                    '%s_%s' % (self.template_name, self.get_unique_token())
+        elif not is_memory_sqlite_db(
+            settings.DATABASE_ENGINE,
+            getattr(settings, 'TEST_DATABASE_NAME', None)):
+            self._database_name = settings.DATABASE_NAME
+            self.template_name = getattr(
+                settings, 'TEST_DATABASE_NAME', None) or \
+                'test_' + settings.DATABASE_NAME
+            settings.TEST_DATABASE_NAME = self._test_database_name = \
+                '%s_%s' % (self.template_name, self.get_unique_token())
+
+    def afterTestDb(self, settings, connection):
+        if not is_worker_process() and \
+           'postgresql' in connection.settings_dict['ENGINE']:
+            # Postgres won't copy a template database that has other
+            # connections open to it
+            connection.close()
+        if self.template_name is not None and \
+           not self._cleanup_registered and \
+           connection.creation._get_test_db_name() == \
+           self._test_database_name:
+            # Created by syncdb rather than cloned, eg. a sqlite file, but
+            # still the worker's own
+            self._register_cleanup(connection, self._database_name)
+
+    def handleCreateTestDb(self, settings, connection):
+        if self.template_name is None:
+            return False
+        clone = None
+        for engine, clone_function in CLONE_FUNCTIONS.items():
+            if engine in connection.settings_dict['ENGINE']:
+                clone = clone_function
+        if clone is None:
+            # Nothing to gain on sqlite, where each process already gets its
+            # own in-memory database
+            return False
+
+        old_database_name = connection.settings_dict['NAME']
+        test_database_name = connection.creation._get_test_db_name()
+        clone(connection, self.template_name, test_database_name)
+
+        connection.close()
+        connection.settings_dict['NAME'] = test_database_name
+        if hasattr(connection.features, 'confirm'):
+            connection.features.confirm()
+
+        if not self._cleanup_registered:
+            self._register_cleanup(connection, old_database_name)
+        return True
+
+    def _register_cleanup(self, connection, old_database_name):
+        """
+        nose never calls ``finalize`` in its workers, so drop the worker's
+        database when the worker process exits.
+        """
+        from multiprocessing.util import Finalize
+
+        def drop_database():
+            connection.creation.destroy_test_db(
+                old_database_name, verbosity=0)
+        Finalize(None, drop_database, exitpriority=10)
+        self._cleanup_registered = True
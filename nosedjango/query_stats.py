@@ -0,0 +1,120 @@
+"""
+Count the queries each test runs and how long they take, without relying on
+``settings.DEBUG`` (which is forced off while testing).
+"""
+
+from __future__ import absolute_import
+
+import heapq
+import time
+
+try:
+    import json
+except ImportError:
+    from django.utils import simplejson as json
+
+from nosedjango.cursors import CursorWrapper
+
+# Statements kept per test in the slowest-statements list
+SLOWEST_STATEMENTS = 3
+
+class TestQueryStats(object):
+    def __init__(self, test):
+        self.test = test
+        self.queries = 0
+        self.seconds = 0.0
+        # A min-heap of (seconds, sql), so the fastest is dropped first
+        self._slowest = []
+
+    def add(self, sql, seconds):
+        self.queries += 1
+        self.seconds += seconds
+        if len(self._slowest) < SLOWEST_STATEMENTS:
+            heapq.heappush(self._slowest, (seconds, sql))
+        elif seconds > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, (seconds, sql))
+
+    def slowest_statements(self):
+        return sorted(self._slowest, reverse=True)
+
+    def as_dict(self):
+        return {
+            'test': self.test,
+            'queries': self.queries,
+            'seconds': self.seconds,
+            'slowest_statements': [
+                {'sql': sql, 'seconds': seconds}
+                for seconds, sql in self.slowest_statements()],
+        }
+
+class QueryStats(object):
+    """
+    Records the queries run while ``current_test`` is set. Queries run by the
+    plugin itself (flushing, loading fixtures) happen outside of that and
+    aren't counted.
+    """
+    def __init__(self):
+        self.current_test = None
+        self.tests = []
+        self._current_stats = None
+
+    def start_test(self, test):
+        self.current_test = test
+        self._current_stats = TestQueryStats(test)
+        self.tests.append(self._current_stats)
+
+    def stop_test(self):
+        self.current_test = None
+        self._current_stats = None
+
+    def executed(self, sql, seconds):
+        if self._current_stats is not None:
+            self._current_stats.add(sql, seconds)
+
+    def heaviest_tests(self, top_n):
+        return sorted(
+            self.tests, key=lambda stats: (stats.queries, stats.seconds),
+            reverse=True)[:top_n]
+
+    def write_report(self, stream, top_n=10):
+        stream.writeln("Tests running the most queries:")
+        stream.writeln("%7s %9s  %s" % ('queries', 'seconds', 'test'))
+        for stats in self.heaviest_tests(top_n):
+            if not stats.queries:
+                break
+            stream.writeln("%7d %9.4f  %s" % (
+                stats.queries, stats.seconds, stats.test))
+            for seconds, sql in stats.slowest_statements():
+                stream.writeln("          %9.4f  %s" % (seconds, sql[:200]))
+
+    def write_json(self, path):
+        f = open(path, 'w')
+        try:
+            json.dump(
+                {'tests': [stats.as_dict() for stats in self.tests]},
+                f, indent=2)
+        finally:
+            f.close()
+
+class QueryStatsCursorWrapper(CursorWrapper):
+    def __init__(self, cursor, stats):
+        super(QueryStatsCursorWrapper, self).__init__(cursor)
+        self.stats = stats
+
+    def execute(self, sql, params=()):
+        if self.stats.current_test is None:
+            return self.cursor.execute(sql, params)
+        start = time.time()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            self.stats.executed(sql, time.time() - start)
+
+    def executemany(self, sql, param_list):
+        if self.stats.current_test is None:
+            return self.cursor.executemany(sql, param_list)
+        start = time.time()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            self.stats.executed(sql, time.time() - start)
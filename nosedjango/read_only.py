@@ -0,0 +1,61 @@
+"""
+Notice tests that only read from the database, which leave nothing behind
+to roll back or clear.
+"""
+
+from __future__ import absolute_import
+
+import re
+
+from nosedjango.cursors import CursorWrapper
+
+READ_RE = re.compile(
+    r'^\s*\(?\s*(?:SELECT|SHOW|EXPLAIN|DESCRIBE)\b', re.IGNORECASE)
+# Reads that change something anyway: sequences, row locks and SELECT INTO
+SIDE_EFFECT_RE = re.compile(
+    r'\b(?:SETVAL|NEXTVAL|FOR\s+UPDATE|FOR\s+SHARE|LOCK\s+IN\s+SHARE\s+MODE'
+    r'|INTO)\b', re.IGNORECASE)
+
+def is_read_only_statement(sql):
+    return bool(READ_RE.match(sql)) and not SIDE_EFFECT_RE.search(sql)
+
+class ReadOnlyTracker(object):
+    """
+    Records whether anything other than a plain read has run since the last
+    reset. Anything it doesn't recognise counts as a write.
+    """
+    def __init__(self):
+        self.wrote = False
+
+    def reset(self):
+        self.wrote = False
+
+    def executed(self, sql):
+        if not self.wrote and not is_read_only_statement(sql):
+            self.wrote = True
+
+    def failed(self):
+        # Even a failed read can leave the transaction aborted, eg. on
+        # PostgreSQL, so it has to be rolled back like a write
+        self.wrote = True
+
+class ReadOnlyCursorWrapper(CursorWrapper):
+    def __init__(self, cursor, tracker):
+        super(ReadOnlyCursorWrapper, self).__init__(cursor)
+        self.tracker = tracker
+
+    def execute(self, sql, params=()):
+        self.tracker.executed(sql)
+        try:
+            return self.cursor.execute(sql, params)
+        except Exception:
+            self.tracker.failed()
+            raise
+
+    def executemany(self, sql, param_list):
+        self.tracker.executed(sql)
+        try:
+            return self.cursor.executemany(sql, param_list)
+        except Exception:
+            self.tracker.failed()
+            raise
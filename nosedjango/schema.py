@@ -0,0 +1,150 @@
+"""
+Helpers for recognizing whether an existing test database still matches the
+installed apps' models, so that it can be reused instead of re-created, and
+for putting back the tables whose schema a test has changed.
+"""
+
+from __future__ import absolute_import
+
+import re
+from hashlib import sha1
+
+from nosedjango.fixtures import get_fixtures_hash
+
+FINGERPRINT_TABLE = 'nosedjango_fingerprint'
+
+# MySQL includes the next auto increment value in SHOW CREATE TABLE
+AUTO_INCREMENT_OPTION = re.compile(r' AUTO_INCREMENT=\d+')
+
+CREATE_VIEW = re.compile(r'^\s*CREATE\b[^(]*\bVIEW\b', re.IGNORECASE)
+
+def get_models_fingerprint(connection):
+    """
+    A hash of the DDL that syncdb would run for the installed apps, plus
+    anything else syncdb loads in to a fresh database.
+    """
+    from django import get_version
+    from django.conf import settings
+    from django.core.management.color import no_style
+    from django.db.models import get_models
+
+    style = no_style()
+    models = get_models(include_auto_created=True)
+    known_models = set(models)
+
+    fingerprint = sha1()
+    fingerprint.update(connection.settings_dict['ENGINE'])
+    # What syncdb's handlers create can change between django versions
+    fingerprint.update(get_version())
+    for app in settings.INSTALLED_APPS:
+        fingerprint.update(app)
+    for model in models:
+        sql, _ = connection.creation.sql_create_model(
+            model, style, known_models)
+        sql.extend(connection.creation.sql_indexes_for_model(model, style))
+        for statement in sql:
+            fingerprint.update(statement.encode('utf-8'))
+    fingerprint.update(get_fixtures_hash(['initial_data']))
+    return fingerprint.hexdigest()
+
+def read_fingerprint(connection):
+    """
+    The fingerprint recorded in the database the connection points at, or
+    ``None`` if the database doesn't exist or has no fingerprint.
+    """
+    qn = connection.ops.quote_name
+    try:
+        cursor = connection.cursor()
+        cursor.execute('SELECT fingerprint FROM %s' % qn(FINGERPRINT_TABLE))
+        row = cursor.fetchone()
+    except Exception:
+        # Failing to connect to a database that doesn't exist raises the
+        # driver's own exceptions rather than django's DatabaseError
+        connection.close()
+        return None
+    if row is None:
+        return None
+    return row[0]
+
+def write_fingerprint(connection, fingerprint):
+    """
+    Record ``fingerprint`` in the database the connection points at. A
+    fingerprint of ``None`` marks the database as not reusable.
+    """
+    from django.db import transaction
+
+    qn = connection.ops.quote_name
+    cursor = connection.cursor()
+    if FINGERPRINT_TABLE not in connection.introspection.table_names():
+        cursor.execute('CREATE TABLE %s (fingerprint varchar(40) NOT NULL)' % (
+            qn(FINGERPRINT_TABLE)))
+    cursor.execute('DELETE FROM %s' % qn(FINGERPRINT_TABLE))
+    if fingerprint is not None:
+        cursor.execute(
+            'INSERT INTO %s (fingerprint) VALUES (%%s)' % (
+                qn(FINGERPRINT_TABLE)),
+            [fingerprint])
+    transaction.commit_unless_managed()
+
+def get_table_ddl(connection):
+    """
+    The statements that create each table, with its indexes and triggers,
+    keyed by table name. ``None`` if this isn't supported for the database
+    engine.
+    """
+    engine = connection.settings_dict['ENGINE']
+    cursor = connection.cursor()
+    table_ddl = {}
+    if 'sqlite3' in engine:
+        cursor.execute(
+            "SELECT tbl_name, sql FROM sqlite_master "
+            "WHERE sql IS NOT NULL AND tbl_name NOT LIKE 'sqlite_%' "
+            "ORDER BY CASE type WHEN 'table' THEN 0 ELSE 1 END, name")
+        for table, sql in cursor.fetchall():
+            table_ddl.setdefault(table, []).append(sql)
+    elif 'mysql' in engine:
+        qn = connection.ops.quote_name
+        for table in connection.introspection.table_names():
+            cursor.execute('SHOW CREATE TABLE %s' % qn(table))
+            table_ddl[table] = [
+                AUTO_INCREMENT_OPTION.sub('', cursor.fetchone()[1])]
+    else:
+        return None
+    return table_ddl
+
+def restore_table_ddl(connection, pristine_ddl):
+    """
+    Drop the tables whose DDL is no longer what ``get_table_ddl`` returned
+    as ``pristine_ddl``, along with any new tables, and create the changed
+    and missing tables again. Returns the names of the tables that were
+    created, which are empty. The other tables' rows are left alone.
+    """
+    from django.db import transaction
+
+    qn = connection.ops.quote_name
+    is_mysql = 'mysql' in connection.settings_dict['ENGINE']
+    current_ddl = get_table_ddl(connection)
+    changed_tables = sorted([
+        table for table, ddl in current_ddl.items()
+        if pristine_ddl.get(table) != ddl])
+    created_tables = sorted([
+        table for table in pristine_ddl
+        if current_ddl.get(table) != pristine_ddl[table]])
+    if not changed_tables and not created_tables:
+        return []
+
+    cursor = connection.cursor()
+    if is_mysql:
+        cursor.execute('SET FOREIGN_KEY_CHECKS = 0')
+    for table in changed_tables:
+        if CREATE_VIEW.match(current_ddl[table][0]):
+            cursor.execute('DROP VIEW %s' % qn(table))
+        else:
+            cursor.execute('DROP TABLE %s' % qn(table))
+    for table in created_tables:
+        for sql in pristine_ddl[table]:
+            cursor.execute(sql)
+    if is_mysql:
+        cursor.execute('SET FOREIGN_KEY_CHECKS = 1')
+    transaction.commit_unless_managed()
+    return created_tables
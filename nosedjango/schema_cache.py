@@ -0,0 +1,165 @@
+"""
+Create test databases by replaying the SQL that syncdb ran the first time,
+instead of running syncdb (and the post_syncdb handlers that create content
+types and permissions one at a time) again.
+"""
+
+from __future__ import absolute_import
+
+import logging
+import os
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from nosedjango.cursors import CursorWrapper
+from nosedjango.schema import get_models_fingerprint
+
+logger = logging.getLogger('nose.plugins.nosedjango')
+
+def is_read_only_statement(sql):
+    """
+    Statements that don't need replaying. Postgres resets sequences with a
+    ``SELECT setval(...)``, which does.
+    """
+    sql = sql.lstrip()[:200].upper()
+    return sql.startswith('SELECT') and 'SETVAL' not in sql
+
+class SchemaCache(object):
+    """
+    Keeps the statements that built a test database in ``cache_dir``, one
+    file per models fingerprint.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.recording = False
+        self._statements = []
+        self._fingerprint = None
+
+    def executed(self, sql, param_list):
+        """
+        Record a statement, batching it with the previous one when it's the
+        same SQL with different parameters.
+        """
+        if is_read_only_statement(sql):
+            return
+        if self._statements and self._statements[-1][0] == sql and \
+           param_list and self._statements[-1][1]:
+            self._statements[-1][1].extend(param_list)
+        else:
+            self._statements.append((sql, list(param_list)))
+
+    def get_cache_path(self, connection):
+        if self._fingerprint is None:
+            # The models don't change while the tests run
+            self._fingerprint = get_models_fingerprint(connection)
+        return os.path.join(self.cache_dir, '%s.pickle' % self._fingerprint)
+
+    def load(self, connection):
+        path = self.get_cache_path(connection)
+        if not os.path.exists(path):
+            return None
+        f = open(path, 'rb')
+        try:
+            try:
+                return pickle.load(f)
+            except Exception:
+                logger.warning("Ignoring unreadable schema cache %s", path)
+                return None
+        finally:
+            f.close()
+
+    def save(self, connection, statements):
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        path = self.get_cache_path(connection)
+        temp_path = '%s.%s' % (path, os.getpid())
+        f = open(temp_path, 'wb')
+        try:
+            pickle.dump(statements, f, pickle.HIGHEST_PROTOCOL)
+        finally:
+            f.close()
+        os.rename(temp_path, path)
+
+    def create_test_db(self, connection, verbosity=1, autoclobber=False):
+        """
+        Create the test database from the cache, or with django's
+        ``create_test_db`` (recording what it runs for next time) if there's
+        nothing cached for the current models. Returns whether the cache was
+        used.
+        """
+        statements = self.load(connection)
+        if statements is None:
+            self._record_test_db(connection, verbosity, autoclobber)
+            return False
+
+        creation = connection.creation
+        test_database_name = creation._get_test_db_name()
+        if verbosity >= 1:
+            print "Creating test database for alias '%s' from the schema cache..." % (
+                connection.alias)
+        creation._create_test_db(verbosity, autoclobber)
+        connection.close()
+        connection.settings_dict['NAME'] = test_database_name
+        if hasattr(connection.features, 'confirm'):
+            connection.features.confirm()
+        self._replay(connection, statements)
+        return True
+
+    def _record_test_db(self, connection, verbosity, autoclobber):
+        creation = connection.creation
+        patched = '_create_test_db' in vars(creation)
+        original_create = creation._create_test_db
+
+        def _create_test_db(*args, **kwargs):
+            # Creating the (empty) database itself isn't replayed, only
+            # what's run in it
+            result = original_create(*args, **kwargs)
+            self.recording = True
+            return result
+        creation._create_test_db = _create_test_db
+
+        self._statements = []
+        try:
+            creation.create_test_db(
+                verbosity=verbosity, autoclobber=autoclobber)
+        finally:
+            self.recording = False
+            if patched:
+                creation._create_test_db = original_create
+            else:
+                del creation._create_test_db
+        statements, self._statements = self._statements, []
+        self.save(connection, statements)
+
+    def _replay(self, connection, statements):
+        from django.db import transaction
+
+        cursor = connection.cursor()
+        for sql, param_list in statements:
+            if len(param_list) > 1:
+                cursor.executemany(sql, param_list)
+            elif param_list:
+                cursor.execute(sql, param_list[0])
+            else:
+                cursor.execute(sql)
+        transaction.commit_unless_managed()
+
+class SchemaRecordingCursorWrapper(CursorWrapper):
+    def __init__(self, cursor, schema_cache):
+        super(SchemaRecordingCursorWrapper, self).__init__(cursor)
+        self.schema_cache = schema_cache
+
+    def execute(self, sql, params=()):
+        result = self.cursor.execute(sql, params)
+        if self.schema_cache.recording:
+            self.schema_cache.executed(sql, [params] if params else [])
+        return result
+
+    def executemany(self, sql, param_list):
+        result = self.cursor.executemany(sql, param_list)
+        if self.schema_cache.recording:
+            self.schema_cache.executed(sql, list(param_list))
+        return result
@@ -0,0 +1,118 @@
+"""
+Put a database connection's session back the way django set it up, so that
+the next test can keep using the connection instead of connecting again.
+"""
+
+from __future__ import absolute_import
+
+import re
+from contextlib import contextmanager
+
+from nosedjango.cursors import CursorWrapper
+
+TEMP_TABLE_RE = re.compile(
+    r'^\s*CREATE\s+(?:GLOBAL\s+|LOCAL\s+)?TEMP(?:ORARY)?\s+TABLE\s+'
+    r'(?:IF\s+NOT\s+EXISTS\s+)?[`"]?(\w+)', re.IGNORECASE)
+# SET LOCAL and SET CONSTRAINTS only last until the end of the transaction
+SESSION_SETTING_RE = re.compile(
+    r'^\s*(?:SET|RESET)\s+(?!LOCAL\b|CONSTRAINTS\b)', re.IGNORECASE)
+
+class SessionTracker(object):
+    """
+    Notices the statements that change a connection's session rather than
+    its transaction: creating temporary tables and changing settings.
+    """
+    def __init__(self):
+        self.temp_tables = set()
+        self.settings_changed = False
+        self.suspended = 0
+
+    def executed(self, sql):
+        if self.suspended:
+            return
+        match = TEMP_TABLE_RE.match(sql)
+        if match:
+            self.temp_tables.add(match.group(1))
+        elif SESSION_SETTING_RE.match(sql):
+            self.settings_changed = True
+
+    def reset(self):
+        self.temp_tables = set()
+        self.settings_changed = False
+
+@contextmanager
+def untracked(tracker):
+    """
+    Keep ``tracker``, if there is one, from noticing the statements run in
+    the block: nosedjango's own, which put back what they change, like
+    ``SET FOREIGN_KEY_CHECKS``.
+    """
+    if tracker is None:
+        yield
+        return
+    tracker.suspended += 1
+    try:
+        yield
+    finally:
+        tracker.suspended -= 1
+
+class SessionTrackingCursorWrapper(CursorWrapper):
+    def __init__(self, cursor, tracker):
+        super(SessionTrackingCursorWrapper, self).__init__(cursor)
+        self.tracker = tracker
+
+    def execute(self, sql, params=()):
+        self.tracker.executed(sql)
+        return self.cursor.execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        self.tracker.executed(sql)
+        return self.cursor.executemany(sql, param_list)
+
+def reset_session(connection, tracker):
+    """
+    Undo the session changes ``tracker`` noticed since the last reset, and
+    make sure the encoding and isolation level are what django connected
+    with. Call it outside of a transaction. Returns ``False`` if the session
+    can't be reset, and the connection has to be closed instead.
+    """
+    raw_connection = connection.connection
+    if raw_connection is None:
+        tracker.reset()
+        return True
+
+    engine = connection.settings_dict['ENGINE']
+    qn = connection.ops.quote_name
+    # The raw cursor, so that the tracker doesn't see what we run
+    cursor = raw_connection.cursor()
+    if 'postgresql' in engine:
+        if tracker.settings_changed:
+            cursor.execute('RESET ALL')
+            if connection.settings_dict.get('TIME_ZONE'):
+                cursor.execute(
+                    'SET TIME ZONE %s',
+                    [connection.settings_dict['TIME_ZONE']])
+        for table in tracker.temp_tables:
+            cursor.execute('DROP TABLE IF EXISTS pg_temp.%s' % qn(table))
+        raw_connection.commit()
+        if tracker.settings_changed or raw_connection.encoding != 'UTF8':
+            raw_connection.set_client_encoding('UTF8')
+        if raw_connection.isolation_level != connection.isolation_level:
+            raw_connection.set_isolation_level(connection.isolation_level)
+    elif 'mysql' in engine:
+        if tracker.settings_changed:
+            # There's no RESET ALL
+            return False
+        for table in tracker.temp_tables:
+            cursor.execute('DROP TEMPORARY TABLE IF EXISTS %s' % qn(table))
+        if raw_connection.character_set_name() != 'utf8':
+            raw_connection.set_character_set('utf8')
+        raw_connection.commit()
+    elif 'sqlite3' in engine:
+        # PRAGMAs aren't tracked, and django doesn't set any
+        for table in tracker.temp_tables:
+            cursor.execute('DROP TABLE IF EXISTS temp.%s' % qn(table))
+    else:
+        return False
+    tracker.reset()
+    return True
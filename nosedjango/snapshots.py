@@ -0,0 +1,218 @@
+"""
+Snapshots of the test database's table contents, so that a known database
+state (eg. a set of loaded fixtures) can be restored without rebuilding it.
+"""
+
+from __future__ import absolute_import
+
+import logging
+
+from nosedjango.fixtures import get_fixtures_hash
+
+logger = logging.getLogger('nose.plugins.nosedjango')
+
+def is_sqlite_memory_db(connection):
+    return 'sqlite3' in connection.settings_dict['ENGINE'] and \
+       connection.settings_dict['NAME'] == ':memory:'
+
+def is_memory_db_name(database_name):
+    """
+    Whether ``database_name`` is an in-memory sqlite database, including a
+    shared-cache one opened by URI, which doesn't outlive the process.
+    """
+    return database_name == ':memory:' or (
+        database_name.startswith('file:') and 'mode=memory' in database_name)
+
+def get_snapshot_store(connection):
+    """
+    Pick the fastest snapshot store that works with the given connection.
+    """
+    if is_sqlite_memory_db(connection):
+        return SqliteSnapshotStore(connection)
+    return TableSnapshotStore(connection)
+
+class TableSnapshotStore(object):
+    """
+    Keeps snapshots as rows in python memory and restores them with one bulk
+    ``executemany`` per table.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self._snapshots = {}
+
+    def has_snapshot(self, name):
+        return name in self._snapshots
+
+    def get_tables(self):
+        return self.connection.introspection.django_table_names(
+            only_existing=True)
+
+    def take(self, name):
+        """
+        Store the contents of every django table under ``name``.
+        """
+        qn = self.connection.ops.quote_name
+        cursor = self.connection.cursor()
+        snapshot = []
+        for table in self.get_tables():
+            cursor.execute('SELECT * FROM %s' % qn(table))
+            columns = [column[0] for column in cursor.description]
+            rows = cursor.fetchall()
+            if rows:
+                snapshot.append((table, columns, rows))
+        self._snapshots[name] = snapshot
+
+    def restore(self, name):
+        """
+        Replace the contents of every django table with the ``name``
+        snapshot. The caller is responsible for committing.
+        """
+        from django.core.management.color import no_style
+        from django.db.models import get_models
+
+        qn = self.connection.ops.quote_name
+        cursor = self.connection.cursor()
+
+        for sql in self.connection.ops.sql_flush(
+            no_style(), self.get_tables(), []):
+            cursor.execute(sql)
+
+        is_mysql = 'mysql' in self.connection.settings_dict['ENGINE']
+        if is_mysql:
+            # Rows are inserted table by table, not in dependency order
+            cursor.execute('SET FOREIGN_KEY_CHECKS = 0')
+        for table, columns, rows in self._snapshots[name]:
+            sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+                qn(table),
+                ', '.join([qn(column) for column in columns]),
+                ', '.join(['%s'] * len(columns)),
+            )
+            cursor.executemany(sql, rows)
+        if is_mysql:
+            cursor.execute('SET FOREIGN_KEY_CHECKS = 1')
+
+        for sql in self.connection.ops.sequence_reset_sql(
+            no_style(), get_models(include_auto_created=True)):
+            cursor.execute(sql)
+
+    def drop(self, name):
+        self._snapshots.pop(name, None)
+
+class SqliteSnapshotStore(TableSnapshotStore):
+    """
+    Keeps snapshots inside an in-memory database attached to the sqlite
+    connection, so that taking and restoring them never has to move rows
+    through python. Each store needs its own ``schema`` name.
+    """
+    def __init__(self, connection, schema='nosedjango_snapshots'):
+        super(SqliteSnapshotStore, self).__init__(connection)
+        self.schema = schema
+        self._db_connection = None
+
+    def _get_cursor(self):
+        cursor = self.connection.cursor()
+        if self.connection.connection is not self._db_connection:
+            # A new connection doesn't have the attached database, so any
+            # snapshots we had are gone
+            self._snapshots = {}
+            cursor.execute(
+                "ATTACH DATABASE ':memory:' AS %s" % self.schema)
+            self._db_connection = self.connection.connection
+        return cursor
+
+    def _snapshot_table(self, name, table):
+        return '%s.%s' % (
+            self.schema, self.connection.ops.quote_name(
+                '%s__%s' % (name, table)))
+
+    def take(self, name):
+        cursor = self._get_cursor()
+        qn = self.connection.ops.quote_name
+        self.drop(name)
+        tables = self.get_tables()
+        for table in tables:
+            cursor.execute('CREATE TABLE %s AS SELECT * FROM main.%s' % (
+                self._snapshot_table(name, table), qn(table)))
+        self._snapshots[name] = tables
+
+    def has_snapshot(self, name):
+        self._get_cursor()
+        return name in self._snapshots
+
+    def restore(self, name):
+        cursor = self._get_cursor()
+        qn = self.connection.ops.quote_name
+        for table in self._snapshots[name]:
+            cursor.execute('DELETE FROM main.%s' % qn(table))
+            cursor.execute('INSERT INTO main.%s SELECT * FROM %s' % (
+                qn(table), self._snapshot_table(name, table)))
+
+    def drop(self, name):
+        tables = self._snapshots.pop(name, None)
+        if not tables:
+            return
+        cursor = self._get_cursor()
+        for table in tables:
+            cursor.execute(
+                'DROP TABLE IF EXISTS %s' % self._snapshot_table(name, table))
+
+class FixtureSnapshotCache(object):
+    """
+    A bounded, least-recently-used cache of database snapshots keyed by the
+    sorted list of fixtures that were loaded to produce them. Entries are
+    invalidated whenever the contents of any of their fixture files change.
+    """
+    def __init__(self, store, max_entries):
+        self.store = store
+        self.max_entries = max_entries
+        self._hashes = {}
+        # Least recently used first
+        self._order = []
+        self._next_id = 0
+        self._names = {}
+
+    def _key(self, fixtures):
+        return tuple(sorted(fixtures))
+
+    def restore(self, fixtures):
+        """
+        Restore the snapshot for ``fixtures``. Returns ``False`` if there is
+        no valid snapshot, in which case the fixtures need to be loaded.
+        """
+        key = self._key(fixtures)
+        if key not in self._names:
+            return False
+        if self._hashes[key] != get_fixtures_hash(key) or \
+           not self.store.has_snapshot(self._names[key]):
+            logger.debug("Fixture snapshot is stale: %s", key)
+            self._evict(key)
+            return False
+
+        self.store.restore(self._names[key])
+        self._order.remove(key)
+        self._order.append(key)
+        return True
+
+    def save(self, fixtures):
+        """
+        Take a snapshot of the database with ``fixtures`` freshly loaded.
+        """
+        if self.max_entries <= 0:
+            return
+        key = self._key(fixtures)
+        if key in self._names:
+            self._evict(key)
+        while len(self._order) >= self.max_entries:
+            self._evict(self._order[0])
+
+        self._next_id += 1
+        name = 'fixtures%s' % self._next_id
+        self.store.take(name)
+        self._names[key] = name
+        self._hashes[key] = get_fixtures_hash(key)
+        self._order.append(key)
+
+    def _evict(self, key):
+        self.store.drop(self._names.pop(key))
+        del self._hashes[key]
+        self._order.remove(key)
@@ -0,0 +1,117 @@
+"""
+Wall-clock timings for the phases of a test run that nosedjango controls, so
+that it's possible to see where the time outside of the tests themselves
+goes.
+"""
+
+from __future__ import absolute_import, with_statement
+
+import math
+import time
+from contextlib import contextmanager
+
+try:
+    import json
+except ImportError:
+    from django.utils import simplejson as json
+
+PERCENTILES = (50, 90, 99)
+
+class NoTimings(object):
+    """
+    Stands in for ``PhaseTimings.phase`` when timings aren't being collected.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+NO_TIMINGS = NoTimings()
+
+def percentile(sorted_values, percent):
+    """
+    The nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = int(math.ceil(percent / 100.0 * len(sorted_values)))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+class PhaseTimings(object):
+    """
+    Collects how long each phase took every time it ran, along with the test
+    that was running at the time. Phases can be nested, eg. a flush includes
+    the ``afterFlush`` hook that it calls, so their totals overlap.
+    """
+    def __init__(self):
+        self.current_test = None
+        self.phases = []
+        self.durations = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, time.time() - start)
+
+    def add(self, name, seconds, test=None):
+        if name not in self.durations:
+            self.phases.append(name)
+            self.durations[name] = []
+        self.durations[name].append((seconds, test or self.current_test))
+
+    def summary(self, top_n=5):
+        """
+        Totals, counts, percentiles and the ``top_n`` slowest tests for every
+        phase, in the order the phases first ran.
+        """
+        summary = []
+        for name in self.phases:
+            durations = self.durations[name]
+            seconds = sorted([duration for duration, _ in durations])
+            total = sum(seconds)
+
+            per_test = {}
+            for duration, test in durations:
+                if test is not None:
+                    per_test[test] = per_test.get(test, 0.0) + duration
+            slowest_tests = sorted(
+                per_test.items(), key=lambda item: item[1], reverse=True)
+
+            phase_summary = {
+                'phase': name,
+                'count': len(seconds),
+                'total': total,
+                'mean': total / len(seconds),
+                'max': seconds[-1],
+                'slowest_tests': [
+                    {'test': test, 'seconds': duration}
+                    for test, duration in slowest_tests[:top_n]],
+            }
+            for percent in PERCENTILES:
+                phase_summary['p%s' % percent] = percentile(seconds, percent)
+            summary.append(phase_summary)
+        return summary
+
+    def write_report(self, stream, top_n=5):
+        summary = self.summary(top_n)
+        stream.writeln("Time spent per phase (seconds):")
+        stream.writeln("%-32s %7s %9s %9s %9s %9s %9s" % (
+            'phase', 'count', 'total', 'p50', 'p90', 'p99', 'max'))
+        for phase in sorted(summary, key=lambda p: p['total'], reverse=True):
+            stream.writeln("%-32s %7d %9.3f %9.4f %9.4f %9.4f %9.4f" % (
+                phase['phase'], phase['count'], phase['total'],
+                phase['p50'], phase['p90'], phase['p99'], phase['max']))
+            for slow_test in phase['slowest_tests']:
+                stream.writeln("    %9.4f %s" % (
+                    slow_test['seconds'], slow_test['test']))
+
+    def write_json(self, path, top_n=5):
+        f = open(path, 'w')
+        try:
+            json.dump({'phases': self.summary(top_n)}, f, indent=2)
+        finally:
+            f.close()
@@ -0,0 +1,233 @@
+"""
+Command line entry point that keeps django and the test database set up
+between test runs, and re-runs the tests in a fresh fork whenever a source or
+fixture file changes.
+"""
+
+from __future__ import absolute_import
+
+import os
+import sys
+import time
+import traceback
+
+from nosedjango.fixtures import get_fixture_dirs
+
+WATCH_EXTENSIONS = ('.py',)
+
+def find_watched_files(watch_dirs, fixture_dirs):
+    """
+    Map every watched file to its modification time. Everything in a fixture
+    directory is watched, elsewhere only files with ``WATCH_EXTENSIONS``.
+    """
+    mtimes = {}
+    for watch_dir, extensions in (
+        [(path, WATCH_EXTENSIONS) for path in watch_dirs] +
+        [(path, None) for path in fixture_dirs]):
+        for dirpath, dirnames, filenames in os.walk(watch_dir):
+            # Skip hidden directories, eg. .git
+            dirnames[:] = [name for name in dirnames
+                           if not name.startswith('.')]
+            for filename in filenames:
+                if extensions and \
+                   os.path.splitext(filename)[1] not in extensions:
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    mtimes[path] = os.stat(path).st_mtime
+                except OSError:
+                    # Removed while we were looking
+                    pass
+    return mtimes
+
+def get_changed_files(old_mtimes, new_mtimes):
+    return sorted([
+        path for path in set(old_mtimes) | set(new_mtimes)
+        if old_mtimes.get(path) != new_mtimes.get(path)])
+
+def get_loaded_files():
+    """
+    The source files of every module imported in this process.
+    """
+    loaded_files = set()
+    for module in sys.modules.values():
+        path = getattr(module, '__file__', None)
+        if path:
+            if path.endswith(('.pyc', '.pyo')):
+                path = path[:-1]
+            loaded_files.add(os.path.abspath(path))
+    return loaded_files
+
+def get_test_names(changed_files, test_names, test_match):
+    """
+    Only re-run the changed test modules if nothing else changed, otherwise
+    re-run everything.
+    """
+    changed_tests = []
+    for path in changed_files:
+        module_name = os.path.splitext(os.path.basename(path))[0]
+        if not path.endswith('.py') or not test_match.search(module_name):
+            return test_names
+        changed_tests.append(path)
+    return changed_tests
+
+class Watcher(object):
+    """
+    Sets up django and the test database once, through the django plugin's
+    warm worker support, and then runs the tests in a forked child each time
+    something changes. The child takes over the setup instead of redoing it,
+    and throws away whatever it does to the database when it exits.
+    """
+    def __init__(self, nose_argv, addplugins=None, watch_dirs=None,
+                 interval=1.0):
+        self.nose_argv = list(nose_argv)
+        if '--django-warm-workers' not in self.nose_argv:
+            self.nose_argv.append('--django-warm-workers')
+        self.addplugins = addplugins or []
+        self.watch_dirs = watch_dirs or [os.getcwd()]
+        self.interval = interval
+        self.config = None
+        # Setting up may change directory and nose's capture plugin swaps
+        # out sys.stdout, so hang on to what's needed to start over and to
+        # talk to the user
+        self.cwd = os.getcwd()
+        self.argv = [sys.executable, os.path.abspath(sys.argv[0])] + \
+            sys.argv[1:]
+        self.stdout = sys.stdout
+
+    def make_config(self):
+        from nose.config import Config, all_config_files
+        from nose.plugins.manager import DefaultPluginManager
+
+        config = Config(
+            env=os.environ, files=all_config_files(),
+            plugins=DefaultPluginManager())
+        if self.addplugins:
+            # Fresh instances, since plugins keep state between begin() and
+            # finalize()
+            config.plugins.addPlugins(extraplugins=[
+                plugin.__class__() for plugin in self.addplugins])
+        return config
+
+    def set_up(self):
+        self.config = self.make_config()
+        # Also calls the plugins' begin()
+        self.config.configure(['nosetests'] + self.nose_argv)
+        self.test_names = self.config.testNames or ['.']
+        self.loaded_files = get_loaded_files()
+
+    def can_take_over(self):
+        """
+        Whether the forked runs can take over the test databases. Elsewhere
+        than sqlite, each run would create the same test database again.
+        """
+        from nosedjango import nosedjango
+
+        parent = nosedjango._warm_parent
+        return parent is not None and parent._can_be_taken_over()
+
+    def tear_down(self):
+        self.config.plugins.finalize(None)
+
+    def run_tests(self, test_names):
+        """
+        Run the tests in a forked child. Returns whether they passed.
+        """
+        from nose.core import TestProgram
+
+        options = [arg for arg in self.nose_argv
+                   if arg not in self.config.testNames]
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 2
+            try:
+                try:
+                    program = TestProgram(
+                        argv=['nosetests'] + options + list(test_names),
+                        config=self.make_config(), exit=False)
+                    exit_code = int(not program.success)
+                except SystemExit as e:
+                    exit_code = e.code
+                except:
+                    traceback.print_exc()
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(exit_code or 0)
+        _, status = os.waitpid(pid, 0)
+        return status == 0
+
+    def wait_for_changes(self, mtimes):
+        while True:
+            time.sleep(self.interval)
+            new_mtimes = find_watched_files(
+                self.watch_dirs, self.get_fixture_dirs())
+            changed_files = get_changed_files(mtimes, new_mtimes)
+            if changed_files:
+                return changed_files, new_mtimes
+
+    def get_fixture_dirs(self):
+        return [path for path in get_fixture_dirs()
+                if path and os.path.isdir(path)]
+
+    def restart(self):
+        """
+        Start over in a new process, since code imported while setting up
+        has changed.
+        """
+        self.tear_down()
+        self.stdout.flush()
+        sys.stderr.flush()
+        os.chdir(self.cwd)
+        os.execv(sys.executable, self.argv)
+
+    def run(self):
+        self.set_up()
+        if not self.can_take_over():
+            self.tear_down()
+            sys.exit(
+                "nosedjango-watch needs --with-django and sqlite test "
+                "databases, with any other than the default one in memory")
+        mtimes = find_watched_files(self.watch_dirs, self.get_fixture_dirs())
+        test_names = self.test_names
+        try:
+            while True:
+                self.run_tests(test_names)
+                self.stdout.write('Waiting for changes...\n')
+                self.stdout.flush()
+                changed_files, mtimes = self.wait_for_changes(mtimes)
+                for path in changed_files:
+                    self.stdout.write('Changed: %s\n' % path)
+                if self.loaded_files.intersection(
+                    [os.path.abspath(path) for path in changed_files]):
+                    self.restart()
+                test_names = get_test_names(
+                    changed_files, self.test_names, self.config.testMatch)
+        except KeyboardInterrupt:
+            pass
+        self.tear_down()
+
+def main(argv=None, addplugins=None):
+    """
+    Takes the same arguments as nosetests, plus any number of
+    ``--watch-dir=DIR`` (default: the current directory) and
+    ``--watch-interval=SECONDS``.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    nose_argv = []
+    watch_dirs = []
+    interval = 1.0
+    for arg in argv:
+        if arg.startswith('--watch-dir='):
+            watch_dirs.append(os.path.abspath(arg.split('=', 1)[1]))
+        elif arg.startswith('--watch-interval='):
+            interval = float(arg.split('=', 1)[1])
+        else:
+            nose_argv.append(arg)
+    Watcher(
+        nose_argv, addplugins=addplugins, watch_dirs=watch_dirs,
+        interval=interval).run()
+
+if __name__ == '__main__':
+    main()
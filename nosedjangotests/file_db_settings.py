@@ -0,0 +1,10 @@
+# The test settings, but with a sqlite test database file, which
+# --django-reuse-db can keep around between runs
+from nosedjangotests.settings import *
+
+TEST_DB_FILE = 'nosedjango-reused.db'
+
+if 'DATABASES' in globals():
+    DATABASES['default']['TEST_NAME'] = TEST_DB_FILE
+else:
+    TEST_DATABASE_NAME = TEST_DB_FILE
@@ -12,4 +12,11 @@ class Choice(models.Model):
     poll = generic.GenericForeignKey('content_type', 'object_id')
 
     choice = models.CharField(max_length=200)
-    votes = models.IntegerField(default=0)
\ No newline at end of file
+    votes = models.IntegerField(default=0)
+
+class ProxyPoll(Poll):
+    class Meta:
+        proxy = True
+
+class ClosedPoll(Poll):
+    closed_date = models.DateTimeField('date closed')
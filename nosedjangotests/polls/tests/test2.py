@@ -1,7 +1,16 @@
+import sys
+import threading
+from datetime import datetime
+from unittest import TestCase as UnitTestCase
+
+from nose.plugins.skip import SkipTest
+
 from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import DatabaseError, connection
 from django.test import TestCase
 
-from nosedjangotests.polls.models import Poll
+from nosedjangotests.polls.models import Choice, ClosedPoll, Poll, ProxyPoll
 from nosedjangotests.polls.tests.test1 import _test_fixtures_2
 
 class BaseCase(TestCase):
@@ -42,9 +51,271 @@ class AltersBleed1TestCase(TestCase):
             from django.db import connection
             cursor = connection.cursor()
             cursor.execute('ALTER TABLE `polls_poll` CHANGE COLUMN `question` `question` varchar(201) COLLATE utf8_unicode_ci NOT NULL')
+        else:
+            from django.db import connection
+            cursor = connection.cursor()
+            cursor.execute('ALTER TABLE polls_poll ADD COLUMN bleed integer')
+            cursor.execute('CREATE INDEX polls_poll_bleed ON polls_poll (bleed)')
+            cursor.execute('CREATE TABLE polls_bleed (id integer)')
 
 class AltersBleed2TestCase(TestCase):
     fixtures = ['polls2.json']
 
     def test_bleeding_alteration(self):
         _test_fixtures_2(self)
+
+    def test_schema_restored(self):
+        from django.db import connection
+        cursor = connection.cursor()
+        self.assertFalse(
+            'polls_bleed' in connection.introspection.table_names())
+        columns = [
+            column[0] for column in connection.introspection.get_table_description(
+                cursor, 'polls_poll')]
+        self.assertEqual(
+            sorted(columns),
+            sorted([field.column for field in Poll._meta.fields]))
+
+class DirtyTableBleed1TestCase(UnitTestCase):
+    fixtures = ['polls1.json']
+    use_transaction_isolation = False
+
+    def test_write_unfixtured_table(self):
+        Choice.objects.create(
+            content_type=ContentType.objects.get_for_model(Poll),
+            object_id=1,
+            choice='Black bear')
+
+class DirtyTableBleed2TestCase(UnitTestCase):
+    fixtures = ['polls1.json']
+    use_transaction_isolation = False
+
+    def test_unfixtured_table_bleed(self):
+        self.assertEqual(Choice.objects.all().count(), 0)
+        self.assertEqual(Poll.objects.all().count(), 1)
+
+def _run_in_thread(function):
+    """
+    Call ``function`` in another thread, which gets its own database
+    connection, and return what it returns.
+    """
+    results = []
+    errors = []
+
+    def run():
+        from django.db import connection
+        try:
+            try:
+                results.append(function())
+            except:
+                errors.append(sys.exc_info())
+        finally:
+            connection.close()
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    if errors:
+        raise errors[0][0], errors[0][1], errors[0][2]
+    return results[0]
+
+def _skip_unless_shared_cache():
+    from django.db import connection
+    if 'mode=memory' not in connection.settings_dict['NAME']:
+        raise SkipTest('Needs --django-sqlite-shared-cache')
+
+class SharedCacheReadTestCase(TestCase):
+    fixtures = ['polls1.json']
+
+    def setUp(self):
+        _skip_unless_shared_cache()
+
+    def test_other_thread_sees_fixtures(self):
+        self.assertEqual(_run_in_thread(Poll.objects.count), 1)
+
+    def test_other_thread_sees_uncommitted_writes(self):
+        Poll.objects.create(
+            question='Which bear?', pub_date=datetime(2007, 7, 16))
+        self.assertEqual(_run_in_thread(Poll.objects.count), 2)
+
+class SharedCacheWriteTestCase(UnitTestCase):
+    fixtures = ['polls1.json']
+    use_transaction_isolation = False
+
+    def setUp(self):
+        _skip_unless_shared_cache()
+
+    def test_other_thread_writes(self):
+        _run_in_thread(lambda: Poll.objects.create(
+            question='Which bear?', pub_date=datetime(2007, 7, 16)))
+        self.assertEqual(Poll.objects.count(), 2)
+
+class FixtureLayers1TestCase(TestCase):
+    fixtures = ['polls1.json', 'polls2.json']
+
+    def test_layers_loaded(self):
+        self.assertEqual(Poll.objects.count(), 2)
+        self.assertEqual(Choice.objects.count(), 0)
+        Poll.objects.create(
+            question='Which bear?', pub_date=datetime(2007, 7, 16))
+
+    def test_writes_rolled_back(self):
+        self.assertEqual(Poll.objects.count(), 2)
+
+class FixtureLayers2TestCase(TestCase):
+    fixtures = ['polls1.json', 'choices.json']
+
+    def test_sibling_layer_replaced(self):
+        self.assertEqual(
+            list(Poll.objects.values_list('pk', flat=True)), [1])
+        self.assertEqual(Choice.objects.count(), 1)
+
+class FixtureLayers3TestCase(TestCase):
+    fixtures = ['polls2.json']
+
+    def test_shared_layers_cleared(self):
+        self.assertEqual(
+            list(Poll.objects.values_list('pk', flat=True)), [2])
+        self.assertEqual(Choice.objects.count(), 0)
+
+class SetupTestData1TestCase(TestCase):
+    fixtures = ['polls1.json']
+    num_setups = 0
+
+    @classmethod
+    def setup_test_data(cls):
+        cls.num_setups += 1
+        cls.poll = Poll.objects.create(
+            question='Which bear?', pub_date=datetime(2007, 7, 16))
+
+    def test_test_data_created(self):
+        self.assertEqual(Poll.objects.count(), 2)
+        self.assertEqual(
+            Poll.objects.get(pk=self.poll.pk).question, 'Which bear?')
+        Poll.objects.filter(pk=self.poll.pk).update(question='Black bear')
+        Poll.objects.create(
+            question='Brown bear?', pub_date=datetime(2007, 7, 17))
+
+    def test_test_data_kept(self):
+        self.assertEqual(Poll.objects.count(), 2)
+        self.assertEqual(
+            Poll.objects.get(pk=self.poll.pk).question, 'Which bear?')
+
+    def test_test_data_set_up_once(self):
+        self.assertEqual(self.num_setups, 1)
+
+class SetupTestData2TestCase(TestCase):
+    fixtures = ['polls1.json']
+
+    def test_test_data_rolled_back(self):
+        self.assertEqual(
+            list(Poll.objects.values_list('pk', flat=True)), [1])
+
+class SetupTestDataNoTransactionTestCase(UnitTestCase):
+    fixtures = ['polls1.json']
+    use_transaction_isolation = False
+
+    @classmethod
+    def setup_test_data(cls):
+        Poll.objects.create(
+            question='Which bear?', pub_date=datetime(2007, 7, 16))
+
+    def test_test_data_created_1(self):
+        self.assertEqual(Poll.objects.count(), 2)
+
+    def test_test_data_created_2(self):
+        self.assertEqual(Poll.objects.count(), 2)
+
+class InheritedModelFixturesTestCase(TestCase):
+    fixtures = ['inherited_polls.json']
+
+    def test_fixtures_loaded(self):
+        self.assertEqual(Poll.objects.count(), 2)
+        self.assertEqual(ProxyPoll.objects.get(pk=2).question, 'Which bear?')
+        closed_poll = ClosedPoll.objects.get(pk=1)
+        self.assertEqual(closed_poll.question, 'What bear is best?')
+        self.assertEqual(closed_poll.closed_date, datetime(2007, 7, 16))
+
+class ReadOnly1TestCase(UnitTestCase):
+    fixtures = ['polls1.json']
+    use_transaction_isolation = False
+
+    def test_read(self):
+        self.assertEqual(Poll.objects.count(), 1)
+
+class ReadOnly2TestCase(UnitTestCase):
+    fixtures = ['polls1.json']
+    use_transaction_isolation = False
+
+    def test_write_after_read(self):
+        self.assertEqual(Poll.objects.count(), 1)
+        Poll.objects.create(
+            question='Which bear?', pub_date=datetime(2007, 7, 16))
+
+class ReadOnly3TestCase(UnitTestCase):
+    fixtures = ['polls1.json']
+    use_transaction_isolation = False
+
+    def test_write_cleared(self):
+        self.assertEqual(Poll.objects.count(), 1)
+
+class ReadOnlyFailedQueryTestCase(UnitTestCase):
+    fixtures = ['polls1.json']
+    use_transaction_isolation = False
+
+    def test_failed_read(self):
+        cursor = connection.cursor()
+        self.assertRaises(
+            DatabaseError, cursor.execute, 'SELECT * FROM no_such_table')
+
+    def test_usable_after_failed_read(self):
+        self.assertEqual(Poll.objects.count(), 1)
+
+def _skip_unless_other_db():
+    if 'other' not in getattr(settings, 'DATABASES', {}):
+        raise SkipTest('Needs an "other" database alias')
+
+class MultiDb1TestCase(TestCase):
+    fixtures = ['polls1.json']
+    multi_db = True
+
+    def setUp(self):
+        _skip_unless_other_db()
+
+    def test_fixtures_loaded_in_to_other_db(self):
+        self.assertEqual(Poll.objects.using('other').count(), 1)
+        Poll.objects.using('other').create(
+            question='Which bear?', pub_date=datetime(2007, 7, 16))
+
+    def test_other_db_rolled_back(self):
+        self.assertEqual(Poll.objects.using('other').count(), 1)
+
+class MultiDb2TestCase(TestCase):
+    fixtures = ['polls1.json']
+
+    def setUp(self):
+        _skip_unless_other_db()
+
+    def test_no_fixtures_in_other_db(self):
+        self.assertEqual(Poll.objects.using('other').count(), 0)
+        Poll.objects.using('other').create(
+            question='Which bear?', pub_date=datetime(2007, 7, 16))
+
+    def test_other_db_rolled_back(self):
+        self.assertEqual(Poll.objects.using('other').count(), 0)
+
+class MultiDbNoTransactionTestCase(UnitTestCase):
+    fixtures = ['polls1.json']
+    use_transaction_isolation = False
+
+    def setUp(self):
+        _skip_unless_other_db()
+
+    def test_other_db_flushed_1(self):
+        self.assertEqual(Poll.objects.using('other').count(), 0)
+        Poll.objects.using('other').create(
+            question='Which bear?', pub_date=datetime(2007, 7, 16))
+
+    def test_other_db_flushed_2(self):
+        self.assertEqual(Poll.objects.using('other').count(), 0)
+        Poll.objects.using('other').create(
+            question='Which bear?', pub_date=datetime(2007, 7, 16))
@@ -0,0 +1,32 @@
+from django.test import TestCase
+
+from nosedjangotests.polls.models import Poll
+
+# Set up and torn down once for the module, however its classes get ordered
+module_state = {}
+
+def setup_module():
+    module_state['set_up'] = True
+
+def teardown_module():
+    module_state.clear()
+
+class ModuleFixtures1TestCase(TestCase):
+    fixtures = ['polls1.json']
+
+    def test_module_set_up(self):
+        self.assertTrue(module_state.get('set_up'))
+        self.assertEqual(Poll.objects.count(), 1)
+
+class ModuleFixtures2TestCase(TestCase):
+    fixtures = ['polls2.json']
+
+    def test_module_still_set_up(self):
+        self.assertTrue(module_state.get('set_up'))
+        self.assertEqual(Poll.objects.count(), 1)
+
+class ModuleFixtures3TestCase(TestCase):
+    fixtures = ['polls1.json']
+
+    def test_module_still_set_up(self):
+        self.assertTrue(module_state.get('set_up'))
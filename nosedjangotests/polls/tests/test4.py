@@ -0,0 +1,458 @@
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from StringIO import StringIO
+from unittest import TestCase as UnitTestCase
+
+from nose.config import Config
+from nose.plugins.skip import SkipTest
+
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sites.models import Site
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+
+from nosedjango import fixtures, watch
+from nosedjango.content_types import ContentTypeImage
+from nosedjango.content_types import resequence_content_types
+from nosedjango.fixtures import compile_fixture_file, find_fixture_files
+from nosedjango.fixtures import find_fixture_files_to_load
+from nosedjango.fixtures import iter_json_objects
+from nosedjango.impact import ImpactRecorder, ImpactSelector, load_impact_map
+from nosedjango.plugins import worker_db_plugin
+from nosedjango.plugins.file_storage_plugin import FileStoragePlugin
+from nosedjango.plugins.worker_db_plugin import WorkerDatabasePlugin
+from nosedjango.read_only import ReadOnlyCursorWrapper, ReadOnlyTracker
+from nosedjango.sessions import SessionTracker, untracked
+from nosedjangotests.polls.models import ClosedPoll, Poll
+
+class FakeSettings(object):
+
+    def __init__(self, databases):
+        self.DATABASES = databases
+
+class WorkerDatabaseNamesTestCase(UnitTestCase):
+
+    def setUp(self):
+        self._is_worker_process = worker_db_plugin.is_worker_process
+        worker_db_plugin.is_worker_process = lambda: True
+
+    def tearDown(self):
+        worker_db_plugin.is_worker_process = self._is_worker_process
+
+    def _set_up_connection(self, databases):
+        plugin = WorkerDatabasePlugin()
+        plugin.beforeConnectionSetup(FakeSettings(databases))
+        return plugin
+
+    def test_in_memory_sqlite_left_alone(self):
+        databases = {
+            'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ''},
+        }
+        plugin = self._set_up_connection(databases)
+        # Otherwise each worker leaves a test_<token> file behind
+        self.assertEqual(databases['default'].get('TEST_NAME'), None)
+        self.assertEqual(plugin.template_name, None)
+
+    def test_sqlite_file_renamed(self):
+        databases = {
+            'default': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': '',
+                'TEST_NAME': 'test.db',
+            },
+        }
+        plugin = self._set_up_connection(databases)
+        self.assertEqual(plugin.template_name, 'test.db')
+        self.assertTrue(databases['default']['TEST_NAME'].startswith(
+            'test.db_'))
+
+    def test_mysql_renamed(self):
+        databases = {
+            'default': {'ENGINE': 'django.db.backends.mysql', 'NAME': 'db'},
+        }
+        plugin = self._set_up_connection(databases)
+        self.assertEqual(plugin.template_name, 'test_db')
+        self.assertTrue(databases['default']['TEST_NAME'].startswith(
+            'test_db_'))
+
+class WarmWorkerMediaTestCase(UnitTestCase):
+
+    def test_own_media_dir(self):
+        import nosedjango.nosedjango
+
+        parent = nosedjango.nosedjango._warm_parent
+        if parent is None or parent._pid == os.getpid():
+            raise SkipTest('Only runs in --django-warm-workers workers')
+        parent_tokens = [
+            plugin.get_unique_token() for plugin in parent.django_plugins
+            if isinstance(plugin, FileStoragePlugin)]
+        if not parent_tokens:
+            raise SkipTest('Needs --with-django-testfs')
+        # Otherwise every worker empties the same directory after its tests
+        self.assertFalse(parent_tokens[0] in default_storage.location)
+
+class FakeCreation(object):
+
+    def __init__(self, test_name):
+        self.test_name = test_name
+
+    def _get_test_db_name(self):
+        return self.test_name
+
+class FakeConnection(object):
+
+    def __init__(self, engine, test_name):
+        self.settings_dict = {'ENGINE': engine}
+        self.creation = FakeCreation(test_name)
+
+class WorkerTestDbNamesTestCase(UnitTestCase):
+
+    def test_own_names(self):
+        # Imported here so that nose doesn't collect it as a test
+        from nosedjango.databases import use_worker_test_db_names
+
+        mysql = FakeConnection('django.db.backends.mysql', 'test_other')
+        sqlite_file = FakeConnection('django.db.backends.sqlite3', 'other.db')
+        in_memory = FakeConnection('django.db.backends.sqlite3', ':memory:')
+        use_worker_test_db_names([mysql, sqlite_file, in_memory], 'token')
+        self.assertEqual(mysql.settings_dict['TEST_NAME'], 'test_other_token')
+        self.assertEqual(
+            sqlite_file.settings_dict['TEST_NAME'], 'other.db_token')
+        self.assertFalse('TEST_NAME' in in_memory.settings_dict)
+
+class FailingCursor(object):
+
+    def execute(self, sql, params=()):
+        raise ValueError(sql)
+
+class ReadOnlyFailedQueryTestCase(UnitTestCase):
+
+    def test_failed_read_counts_as_write(self):
+        tracker = ReadOnlyTracker()
+        cursor = ReadOnlyCursorWrapper(FailingCursor(), tracker)
+        self.assertRaises(ValueError, cursor.execute, 'SELECT 1')
+        self.assertTrue(tracker.wrote)
+
+class UntrackedSessionTestCase(UnitTestCase):
+
+    def test_own_statements_not_tracked(self):
+        tracker = SessionTracker()
+        with untracked(tracker):
+            tracker.executed('SET FOREIGN_KEY_CHECKS = 0')
+            tracker.executed('CREATE TEMPORARY TABLE own (id integer)')
+        self.assertFalse(tracker.settings_changed)
+        self.assertEqual(tracker.temp_tables, set())
+
+        tracker.executed('SET FOREIGN_KEY_CHECKS = 0')
+        self.assertTrue(tracker.settings_changed)
+
+    def test_no_tracker(self):
+        with untracked(None):
+            pass
+
+class MultipleFixtureFilesTestCase(UnitTestCase):
+
+    def setUp(self):
+        self.fixture_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.fixture_dir)
+        self.fixture_name = os.path.join(self.fixture_dir, 'polls')
+        shutil.copy(
+            os.path.join(
+                os.path.dirname(os.path.dirname(__file__)),
+                'fixtures', 'polls1.json'),
+            self.fixture_name + '.json')
+
+    def test_single_file(self):
+        self.assertEqual(
+            find_fixture_files_to_load(self.fixture_name),
+            [(self.fixture_name + '.json', 'json', None)])
+
+    def test_multiple_files_refused(self):
+        # Like loaddata, which can't tell which one is meant
+        shutil.copy(
+            self.fixture_name + '.json', self.fixture_name + '.json.gz')
+        self.assertRaises(
+            ValueError, find_fixture_files_to_load, self.fixture_name)
+
+class IterJsonObjectsTestCase(UnitTestCase):
+
+    def _decode(self, text, chunk_size=1):
+        # Reading a byte at a time splits every object across reads
+        return list(iter_json_objects(
+            StringIO(text.encode('utf-8')), chunk_size=chunk_size))
+
+    def test_strings_with_brackets(self):
+        self.assertEqual(
+            self._decode('[{"a": "}]{[,"}, {"b": "]"}]'),
+            [{'a': '}]{[,'}, {'b': ']'}])
+
+    def test_escapes(self):
+        self.assertEqual(
+            self._decode(r'[{"a": "\"}\\", "b": "\u00e9\n"}]'),
+            [{'a': '"}\\', 'b': u'\xe9\n'}])
+
+    def test_unicode(self):
+        bear = u'\u043c\u0435\u0434\u0432\u0435\u0434\u044c'
+        # The multi-byte characters are split across reads too
+        self.assertEqual(
+            self._decode(u'[{"%s": "%s"}]' % (bear, bear)), [{bear: bear}])
+
+    def test_nested_objects(self):
+        self.assertEqual(
+            self._decode('[{"a": {"b": [1, {"c": []}]}}, {"d": {}}]'),
+            [{'a': {'b': [1, {'c': []}]}}, {'d': {}}])
+
+    def test_split_across_chunks(self):
+        text = '[%s]' % ', '.join(['{"pk": %d, "a": "x"}' % i
+                                   for i in range(20)])
+        for chunk_size in (1, 2, 3, 7, 1000):
+            self.assertEqual(
+                self._decode(text, chunk_size=chunk_size),
+                [{'pk': i, 'a': 'x'} for i in range(20)])
+
+    def test_empty_array(self):
+        self.assertEqual(self._decode(' [ ] '), [])
+
+    def test_truncated(self):
+        self.assertRaises(ValueError, self._decode, '[{"a": 1}, {"b"')
+
+    def test_not_an_array(self):
+        self.assertRaises(ValueError, self._decode, '{"a": 1}')
+
+class CompiledFixturesTestCase(TestCase):
+    # The proxy object in inherited_polls replaces the one in polls2
+    fixture_labels = ['polls2', 'inherited_polls']
+
+    def setUp(self):
+        if not fixtures.can_load_in_bulk():
+            raise SkipTest('Compiled fixtures need django >= 1.2')
+        self.compiled_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.compiled_dir)
+        for fixture_label in self.fixture_labels:
+            for path, format, compression_format in find_fixture_files(
+                fixture_label):
+                compile_fixture_file(
+                    path, format, compression_format, self.compiled_dir)
+
+        self._deserialize_fixture_file = fixtures.deserialize_fixture_file
+        self.addCleanup(
+            setattr, fixtures, 'deserialize_fixture_file',
+            self._deserialize_fixture_file)
+
+    def _get_rows(self):
+        return (
+            list(Poll.objects.order_by('pk').values_list(
+                'pk', 'question', 'pub_date')),
+            list(ClosedPoll.objects.order_by('pk').values_list(
+                'pk', 'question', 'pub_date', 'closed_date')),
+        )
+
+    def test_same_as_loaddata(self):
+        call_command(
+            'loaddata', *self.fixture_labels, verbosity=0, commit=False)
+        loaded_rows = self._get_rows()
+        self.assertEqual(len(loaded_rows[0]), 2)
+        self.assertEqual(len(loaded_rows[1]), 1)
+        Poll.objects.all().delete()
+
+        def deserialize_fixture_file(*args, **kwargs):
+            raise AssertionError('Read the fixture instead of its copy')
+        fixtures.deserialize_fixture_file = deserialize_fixture_file
+        fixtures.load_fixtures(
+            self.fixture_labels, compiled_dir=self.compiled_dir)
+        self.assertEqual(self._get_rows(), loaded_rows)
+
+class WatchTestCase(UnitTestCase):
+
+    def setUp(self):
+        self.watch_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.watch_dir)
+
+    def _touch(self, *parts):
+        path = os.path.join(self.watch_dir, *parts)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        open(path, 'w').close()
+        return path
+
+    def test_find_watched_files(self):
+        module = self._touch('app', 'models.py')
+        self._touch('app', 'README')
+        self._touch('.git', 'hook.py')
+        fixture = self._touch('app', 'fixtures', 'polls.json')
+        mtimes = watch.find_watched_files(
+            [self.watch_dir], [os.path.dirname(fixture)])
+        self.assertEqual(sorted(mtimes), sorted([module, fixture]))
+        self.assertEqual(mtimes[module], os.stat(module).st_mtime)
+
+    def test_get_changed_files(self):
+        self.assertEqual(
+            watch.get_changed_files(
+                {'same': 1, 'changed': 1, 'removed': 1},
+                {'same': 1, 'changed': 2, 'added': 1}),
+            ['added', 'changed', 'removed'])
+        self.assertEqual(watch.get_changed_files({'a': 1}, {'a': 1}), [])
+
+    def test_get_test_names(self):
+        test_match = Config().testMatch
+        test_names = ['app']
+        # Only the changed test modules
+        self.assertEqual(
+            watch.get_test_names(
+                ['app/tests/test_models.py'], test_names, test_match),
+            ['app/tests/test_models.py'])
+        # Everything, since any test could use the changed code or fixture
+        self.assertEqual(
+            watch.get_test_names(
+                ['app/tests/test_models.py', 'app/models.py'],
+                test_names, test_match),
+            test_names)
+        self.assertEqual(
+            watch.get_test_names(
+                ['app/fixtures/test_polls.json'], test_names, test_match),
+            test_names)
+
+class WatchTakeOverTestCase(UnitTestCase):
+
+    def setUp(self):
+        import nosedjango.nosedjango
+
+        if 'sqlite3' not in connection.settings_dict['ENGINE']:
+            raise SkipTest('Only sqlite test databases can be taken over')
+        self.module = nosedjango.nosedjango
+        self.addCleanup(
+            setattr, self.module, '_warm_parent', self.module._warm_parent)
+        self.module._warm_parent = self.module.NoseDjango()
+        self.watcher = watch.Watcher([])
+
+    def test_sqlite(self):
+        self.assertTrue(self.watcher.can_take_over())
+
+    def test_other_backends_refused(self):
+        # Each run would create the same test database again
+        self.addCleanup(
+            connection.settings_dict.__setitem__, 'ENGINE',
+            connection.settings_dict['ENGINE'])
+        connection.settings_dict['ENGINE'] = \
+            'django.db.backends.postgresql_psycopg2'
+        self.assertFalse(self.watcher.can_take_over())
+
+    def test_without_django_plugin(self):
+        self.module._warm_parent = None
+        self.assertFalse(self.watcher.can_take_over())
+
+class ImpactTestCase(UnitTestCase):
+
+    def setUp(self):
+        self.root = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))
+        self.map_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.map_dir)
+
+    def _record(self, test_id, module_name):
+        if module_name is not None:
+            # In case the test module hasn't run in this process
+            __import__(module_name)
+        recorder = ImpactRecorder(self.root)
+        recorder.start_test(test_id, module_name)
+        recorder.stop_test()
+        map_path = os.path.join(self.map_dir, 'impact.json')
+        recorder.save(map_path)
+        return load_impact_map(map_path)
+
+    def test_helpers_from_other_test_modules(self):
+        # test2 uses a helper function from test1, which nose imported first
+        test_id = 'nosedjangotests.polls.tests.test2.' \
+            'AltersBleed2TestCase.test_bleeding_alteration'
+        impact_map = self._record(test_id, 'nosedjangotests.polls.tests.test2')
+        self.assertTrue(ImpactSelector(
+            impact_map, set(['polls/tests/test1.py'])).is_affected(test_id))
+        self.assertFalse(ImpactSelector(
+            impact_map, set(['polls/tests/test0.py'])).is_affected(test_id))
+
+    def test_unknown_module(self):
+        impact_map = self._record('unknown.test_something', None)
+        self.assertTrue(ImpactSelector(
+            impact_map, set(['polls/tests/test1.py'])).is_affected(
+                'unknown.test_something'))
+
+class ContentTypeImageTestCase(TestCase):
+    # Only used by the flush on django < 1.2, but nothing in it depends on
+    # the version. Restoring flushes, which mysql can't roll back.
+    use_transaction_isolation = False
+
+    def setUp(self):
+        self.addCleanup(ContentType.objects.clear_cache)
+        # Tests without fixtures can find an earlier test's still loaded
+        call_command('flush', verbosity=0, interactive=False)
+
+    def _get_rows(self):
+        return (
+            list(ContentType.objects.order_by('pk').values_list(
+                'pk', 'app_label', 'model', 'name')),
+            list(Permission.objects.order_by('pk').values_list(
+                'pk', 'content_type', 'codename', 'name')),
+            list(Site.objects.order_by('pk').values_list(
+                'pk', 'domain', 'name')),
+        )
+
+    def _count_restore_statements(self, image):
+        # DEBUG makes the cursors record every statement, counting each
+        # executemany once
+        self.addCleanup(setattr, settings, 'DEBUG', settings.DEBUG)
+        settings.DEBUG = True
+        connection.queries = []
+        image.restore(connection)
+        settings.DEBUG = False
+        return len(connection.queries)
+
+    def test_restore(self):
+        resequence_content_types()
+        content_types, permissions, sites = resequenced_rows = \
+            self._get_rows()
+        self.assertEqual(
+            [row[0] for row in content_types],
+            range(1, len(content_types) + 1))
+        self.assertEqual(
+            [row[0] for row in permissions],
+            range(1, len(permissions) + 1))
+        # Created by the sites app's post_syncdb handler
+        self.assertEqual(len(sites), 1)
+
+        image = ContentTypeImage.capture(connection)
+        Poll.objects.create(question='Flushed?', pub_date=datetime.now())
+        ContentType.objects.all().delete()
+        Site.objects.all().delete()
+        image.restore(connection)
+        self.assertEqual(self._get_rows(), resequenced_rows)
+        self.assertEqual(Poll.objects.count(), 0)
+        self.assertEqual(
+            ContentType.objects.get_for_model(Poll).pk,
+            ContentType.objects.get(app_label='polls', model='poll').pk)
+
+    def test_statements_independent_of_models(self):
+        resequence_content_types()
+        image = ContentTypeImage.capture(connection)
+        num_statements = self._count_restore_statements(image)
+
+        # As if there were many more models
+        for i in range(50):
+            content_type = ContentType.objects.create(
+                app_label='other', model='model%d' % i, name='model %d' % i)
+            for action in ('add', 'change', 'delete'):
+                Permission.objects.create(
+                    content_type=content_type,
+                    codename='%s_model%d' % (action, i),
+                    name='Can %s model %d' % (action, i))
+        more_models_image = ContentTypeImage.capture(connection)
+        self.assertEqual(
+            self._count_restore_statements(more_models_image),
+            num_statements)
+        self.assertEqual(
+            ContentType.objects.filter(app_label='other').count(), 50)
@@ -20,7 +20,16 @@ if hasattr(global_settings, 'DATABASES'):
             'PASSWORD': '',
             'HOST': '',
             'PORT': '',
-        }
+        },
+        # For the multi-db tests. Stays on sqlite when default doesn't
+        'other': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': 'nosedjango_other',
+            'USER': '',
+            'PASSWORD': '',
+            'HOST': '',
+            'PORT': '',
+        },
     }
 
     if getenv('JENNKINS_URL', False):
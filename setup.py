@@ -1,6 +1,9 @@
 import codecs
+import glob
 import os
+import shutil
 import sys
+import tempfile
 
 from setuptools import setup, find_packages, Command
 
@@ -62,6 +65,18 @@ class RunTests(Command):
         ]
         test_results.append(TestProgram(argv=args, exit=False))
 
+        print "Running tests with --django-fixture-grouping on sqlite"
+        args = [
+            '--verbosity=2',
+            '--with-doctest',
+            '--with-django',
+            '--django-fixture-grouping',
+            '--django-settings', 'nosedjangotests.settings',
+            '--with-django-sqlite',
+            'nosedjangotests.polls',
+        ]
+        test_results.append(TestProgram(argv=args, exit=False))
+
         print "Running tests with class-based fixture grouping multiprocess style"
         args = [
             '--verbosity=2',
@@ -74,6 +89,294 @@ class RunTests(Command):
         ]
         test_results.append(TestProgram(argv=args, exit=False))
 
+        print "Running tests with --django-fixture-grouping multiprocess style"
+        args = [
+            '--verbosity=2',
+            '--with-doctest',
+            '--processes', '3',
+            '--with-django',
+            '--django-fixture-grouping',
+            '--django-settings', 'nosedjangotests.settings',
+            '--with-django-sqlite',
+            'nosedjangotests.polls',
+        ]
+        test_results.append(TestProgram(argv=args, exit=False))
+
+        print "Running tests with fixture snapshots on sqlite"
+        args = [
+            '--verbosity=2',
+            '--with-doctest',
+            '--with-django',
+            '--django-fixture-snapshots', '2',
+            '--django-settings', 'nosedjangotests.settings',
+            '--with-django-sqlite',
+            'nosedjangotests.polls',
+        ]
+        test_results.append(TestProgram(argv=args, exit=False))
+
+        print "Running tests with fixture layers on sqlite"
+        args = [
+            '--verbosity=2',
+            '--with-doctest',
+            '--with-django',
+            '--django-fixture-layers',
+            '--django-settings', 'nosedjangotests.settings',
+            '--with-django-sqlite',
+            'nosedjangotests.polls',
+        ]
+        test_results.append(TestProgram(argv=args, exit=False))
+
+        print "Running tests with read-only test detection on sqlite"
+        args = [
+            '--verbosity=2',
+            '--with-doctest',
+            '--with-django',
+            '--django-detect-read-only',
+            '--django-settings', 'nosedjangotests.settings',
+            '--with-django-sqlite',
+            'nosedjangotests.polls',
+        ]
+        test_results.append(TestProgram(argv=args, exit=False))
+
+        print "Running tests multiprocess with warm workers"
+        args = [
+            '--verbosity=2',
+            '--with-doctest',
+            '--processes', '3',
+            '--with-django',
+            '--django-warm-workers',
+            '--django-settings', 'nosedjangotests.settings',
+            '--with-django-sqlite',
+            'nosedjangotests.polls',
+        ]
+        test_results.append(TestProgram(argv=args, exit=False))
+
+        print "Running tests multiprocess with warm workers and testfs"
+        args = [
+            '--verbosity=2',
+            '--with-doctest',
+            '--processes', '3',
+            '--with-django',
+            '--django-warm-workers',
+            '--with-django-testfs',
+            '--django-settings', 'nosedjangotests.settings',
+            '--with-django-sqlite',
+            'nosedjangotests.polls',
+        ]
+        test_results.append(TestProgram(argv=args, exit=False))
+
+        print "Running tests multiprocess, longest first"
+        durations_dir = tempfile.mkdtemp()
+        args = [
+            '--verbosity=2',
+            '--with-doctest',
+            '--processes', '3',
+            '--with-django',
+            '--django-longest-first',
+            '--django-durations-file',
+            os.path.join(durations_dir, 'durations.json'),
+            '--django-settings', 'nosedjangotests.settings',
+            '--with-django-sqlite',
+            'nosedjangotests.polls',
+        ]
+        test_results.append(TestProgram(argv=args, exit=False))
+        shutil.rmtree(durations_dir)
+
+        print "Running tests with dirty table tracking on sqlite"
+        args = [
+            '--verbosity=2',
+            '--with-doctest',
+            '--with-django',
+            '--django-track-dirty-tables',
+            '--django-settings', 'nosedjangotests.settings',
+            '--with-django-sqlite',
+            'nosedjangotests.polls',
+        ]
+        test_results.append(TestProgram(argv=args, exit=False))
+
+        print "Running tests with a pristine copy of the sqlite db"
+        args = [
+            '--verbosity=2',
+            '--with-doctest',
+            '--with-django',
+            '--django-settings', 'nosedjangotests.settings',
+            '--with-django-sqlite',
+            '--django-sqlite-pristine-copy',
+            'nosedjangotests.polls',
+        ]
+        test_results.append(TestProgram(argv=args, exit=False))
+
+        print "Running tests with a shared-cache in-memory sqlite db"
+        args = [
+            '--verbosity=2',
+            '--with-doctest',
+            '--with-django',
+            '--django-settings', 'nosedjangotests.settings',
+            '--with-django-sqlite',
+            '--django-sqlite-shared-cache',
+            'nosedjangotests.polls',
+        ]
+        test_results.append(TestProgram(argv=args, exit=False))
+
+        print "Running tests multiprocess with sqlite database files"
+        args = [
+            '--verbosity=2',
+            '--with-doctest',
+            '--processes', '3',
+            '--with-django',
+            '--django-settings', 'nosedjangotests.settings',
+            '--with-django-sqlite',
+            '--django-sqlite-file',
+            'nosedjangotests.polls',
+        ]
+        test_results.append(TestProgram(argv=args, exit=False))
+
+        print "Running tests multiprocess with per-worker sqlite databases"
+        args = [
+            '--verbosity=2',
+            '--with-doctest',
+            '--processes', '3',
+            '--with-django',
+            '--with-django-worker-db',
+            '--django-settings', 'nosedjangotests.settings',
+            '--with-django-sqlite',
+            'nosedjangotests.polls',
+        ]
+        test_results.append(TestProgram(argv=args, exit=False))
+        # The workers' in-memory databases shouldn't leave files behind
+        leftover_files = glob.glob(os.path.join(tests_dir, 'test_*'))
+        if leftover_files:
+            print "Test database files left behind: %s" % (
+                ', '.join(leftover_files))
+
+        print "Running tests with a schema cache on sqlite"
+        schema_cache_dir = tempfile.mkdtemp()
+        args = [
+            '--verbosity=2',
+            '--with-doctest',
+            '--with-django',
+            '--django-schema-cache', schema_cache_dir,
+            '--django-settings', 'nosedjangotests.settings',
+            '--with-django-sqlite',
+            'nosedjangotests.polls',
+        ]
+        # Once to fill the cache, and once to use it
+        test_results.append(TestProgram(argv=args, exit=False))
+        test_results.append(TestProgram(argv=args, exit=False))
+        shutil.rmtree(schema_cache_dir)
+
+        print "Running tests reusing a sqlite test database file"
+        args = [
+            '--verbosity=2',
+            '--with-doctest',
+            '--with-django',
+            '--django-reuse-db',
+            '--django-settings', 'nosedjangotests.file_db_settings',
+            'nosedjangotests.polls',
+        ]
+        # Once to create the database, and once to reuse it
+        test_results.append(TestProgram(argv=args, exit=False))
+        test_results.append(TestProgram(argv=args, exit=False))
+        from nosedjangotests.file_db_settings import TEST_DB_FILE
+        if os.path.exists(TEST_DB_FILE):
+            os.remove(TEST_DB_FILE)
+
+        print "Running tests reusing connections on sqlite"
+        args = [
+            '--verbosity=2',
+            '--with-doctest',
+            '--with-django',
+            '--django-reuse-connections',
+            '--django-settings', 'nosedjangotests.settings',
+            '--with-django-sqlite',
+            'nosedjangotests.polls',
+        ]
+        test_results.append(TestProgram(argv=args, exit=False))
+
+        print "Running tests with fast schema rebuilds on sqlite"
+        args = [
+            '--verbosity=2',
+            '--with-doctest',
+            '--with-django',
+            '--django-fast-rebuild-schema',
+            '--django-settings', 'nosedjangotests.settings',
+            '--with-django-sqlite',
+            'nosedjangotests.polls',
+        ]
+        test_results.append(TestProgram(argv=args, exit=False))
+
+        print "Running tests with bulk fixture loading on sqlite"
+        args = [
+            '--verbosity=2',
+            '--with-doctest',
+            '--with-django',
+            '--django-bulk-fixtures',
+            '--django-settings', 'nosedjangotests.settings',
+            '--with-django-sqlite',
+            'nosedjangotests.polls',
+        ]
+        test_results.append(TestProgram(argv=args, exit=False))
+
+        print "Running tests with compiled fixtures on sqlite"
+        compiled_fixtures_dir = tempfile.mkdtemp()
+        os.environ['DJANGO_SETTINGS_MODULE'] = 'nosedjangotests.settings'
+        from nosedjango.compile_fixtures import main as compile_fixtures
+        compile_fixtures(['-d', compiled_fixtures_dir])
+        args = [
+            '--verbosity=2',
+            '--with-doctest',
+            '--with-django',
+            '--django-compiled-fixtures', compiled_fixtures_dir,
+            '--django-settings', 'nosedjangotests.settings',
+            '--with-django-sqlite',
+            'nosedjangotests.polls',
+        ]
+        test_results.append(TestProgram(argv=args, exit=False))
+        shutil.rmtree(compiled_fixtures_dir)
+
+        print "Running tests with phase timings and query stats on sqlite"
+        args = [
+            '--verbosity=2',
+            '--with-doctest',
+            '--with-django',
+            '--django-timings',
+            '--django-query-stats',
+            '--django-settings', 'nosedjangotests.settings',
+            '--with-django-sqlite',
+            'nosedjangotests.polls',
+        ]
+        test_results.append(TestProgram(argv=args, exit=False))
+
+        print "Running tests while recording the impact map on sqlite"
+        impact_map_dir = tempfile.mkdtemp()
+        args = [
+            '--verbosity=2',
+            '--with-doctest',
+            '--with-django',
+            '--django-record-impact',
+            '--django-impact-map',
+            os.path.join(impact_map_dir, 'impact.json'),
+            '--django-settings', 'nosedjangotests.settings',
+            '--with-django-sqlite',
+            'nosedjangotests.polls',
+        ]
+        test_results.append(TestProgram(argv=args, exit=False))
+
+        print "Running the tests affected by uncommitted changes on sqlite"
+        args = [
+            '--verbosity=2',
+            '--with-doctest',
+            '--with-django',
+            '--django-changed-since', 'HEAD',
+            '--django-impact-map',
+            os.path.join(impact_map_dir, 'impact.json'),
+            '--django-settings', 'nosedjangotests.settings',
+            '--with-django-sqlite',
+            'nosedjangotests.polls',
+        ]
+        test_results.append(TestProgram(argv=args, exit=False))
+        shutil.rmtree(impact_map_dir)
+
         print "Running tests with mysql. (will fail if mysql not configured)"
         args = [
             '--verbosity=2',
@@ -95,6 +398,31 @@ class RunTests(Command):
         ]
         test_results.append(TestProgram(argv=args, exit=False))
 
+        print "Running tests with --django-fixture-grouping on mysql."
+        print "This will fail if mysql isn't configured"
+        args = [
+            '--verbosity=2',
+            '--with-doctest',
+            '--with-django',
+            '--django-fixture-grouping',
+            '--django-settings', 'nosedjangotests.settings',
+            'nosedjangotests.polls',
+        ]
+        test_results.append(TestProgram(argv=args, exit=False))
+
+        print "Running tests multiprocess with per-worker mysql databases."
+        print "This will fail if mysql isn't configured"
+        args = [
+            '--verbosity=2',
+            '--with-doctest',
+            '--processes', '3',
+            '--with-django',
+            '--with-django-worker-db',
+            '--django-settings', 'nosedjangotests.settings',
+            'nosedjangotests.polls',
+        ]
+        test_results.append(TestProgram(argv=args, exit=False))
+
         selenium_installed = False
         try:
             import selenium
@@ -118,6 +446,7 @@ class RunTests(Command):
         os.chdir(setup_dir)
 
         is_success = [tr.success for tr in test_results]
+        is_success.append(not leftover_files)
 
         if all(is_success):
             print "Success!"
@@ -163,6 +492,11 @@ setup(
             'djangosqlite = nosedjango.plugins.sqlite_plugin:SqlitePlugin',
             'selenium = nosedjango.plugins.selenium_plugin:SeleniumPlugin',
             'sshtunnel = nosedjango.plugins.ssh_tunnel_plugin:SshTunnelPlugin',
+            'djangoworkerdb = nosedjango.plugins.worker_db_plugin:WorkerDatabasePlugin',
+        ],
+        'console_scripts': [
+            'nosedjango-compile-fixtures = nosedjango.compile_fixtures:main',
+            'nosedjango-watch = nosedjango.watch:main',
         ],
     },
 )